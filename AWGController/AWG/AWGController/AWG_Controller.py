@@ -452,10 +452,12 @@ class AWG_Controller:
 
 
     ############### FILE HANDLE #####################
-    def import_file(self, filename):
+    # file_format: CSV for decimal text, BIN for int16 DAC words with marker bits (see dac_codes.DACEncoder)
+    # iq_data: IONL (real samples / I only), QONL or BOTH (I and Q, e.g. CSV Y1/Y2 columns or IQBIN interleaved words)
+    def import_file(self, filename, file_format="CSV", segment_id=1, iq_data="IONL", channel=1):
         try:
             start_t = time.time()
-            command = f':TRAC1:IQIM 1,"{filename}",CSV,IONL,0'
+            command = f':TRAC{channel}:IQIM {segment_id},"{filename}",{file_format},{iq_data},0'
             self.write_instrument(command=str(command))
 
             query = self.query_instrument(':SYST:ERR?')
@@ -529,6 +531,50 @@ class AWG_Controller:
             self.print_errors(str(e))
             return log
             
+    ################### SEQUENCER ######################
+
+    # Sequence table control bits
+    SEQ_INIT = 1 << 28
+    SEQ_END = 1 << 30
+    SCENARIO_END = 1 << 31
+
+    # Function mode: ARB (single segment), STS (sequence), STSC (scenario)
+    def set_function_mode(self, channel:int, mode:str):
+        try:
+            start_t = time.time()
+            channel = str(channel)
+            command = f':FUNC{channel}:MODE {mode}'
+            self.write_instrument(command=command)
+            response = self.query_instrument(query=':SYST:ERR?')
+            end_t = time.time()
+            response_t = (end_t - start_t) * 1000
+            log = self.logger._log_command(command=command, duration_ms= response_t, response=response)
+            self.print_query_msg(response=response)
+            return log
+        except Exception as e:
+            log = self.logger._log_command(command=command, duration_ms=None, response=self.query_instrument(":SYST:ERR?"))
+            self.print_errors(str(e))
+            return log
+
+    # Write one sequence table entry: play segment_id segment_loops times (the whole entry sequence_loops times)
+    def write_sequence_entry(self, channel:int, index:int, segment_id:int, segment_loops:int = 1,
+                             sequence_loops:int = 1, control:int = 0, start:int = 0, end:int = 0xFFFFFFFF):
+        try:
+            start_t = time.time()
+            channel = str(channel)
+            command = f':STAB{channel}:DATA {index},{control},{sequence_loops},{segment_loops},{segment_id},{start},{end}'
+            self.write_instrument(command=command)
+            response = self.query_instrument(query=':SYST:ERR?')
+            end_t = time.time()
+            response_t = (end_t - start_t) * 1000
+            log = self.logger._log_command(command=command, duration_ms= response_t, response=response)
+            self.print_query_msg(response=response)
+            return log
+        except Exception as e:
+            log = self.logger._log_command(command=command, duration_ms=None, response=self.query_instrument(":SYST:ERR?"))
+            self.print_errors(str(e))
+            return log
+
     ########### ABORT WAVE GENERATION #################
 
     def abort_wave_generation(self, channel:int): 
@@ -242,12 +242,17 @@ class AWGGui(QMainWindow):
         self.ch1_step_center_freq = QLineEdit()
         self.ch1_lfm_pulse_width = QLineEdit()
         self.ch1_lfm_bandwidth = QLineEdit()
+        self.ch1_lfm_pri = QLineEdit()
+        self.ch1_lfm_pri.setPlaceholderText("optional, e.g. 10000 or 10000,12000,11000 (stagger)")
+        self.ch1_lfm_num_pulses = QLineEdit()
         self.ch1_generate_lfm_wave_btn = QPushButton(CONFIG['buttons']['Generate_waveform']['label'])
         lfm_layout.addRow("Starting Center Freq (GHz):", self.ch1_start_center_freq)
         lfm_layout.addRow("Stoping Center Freq (GHz):", self.ch1_stop_center_freq)
         lfm_layout.addRow("Step Center Freq (GHz):", self.ch1_step_center_freq)
         lfm_layout.addRow("Pulse width (ns):", self.ch1_lfm_pulse_width)
         lfm_layout.addRow("Bandwidth (GHz):", self.ch1_lfm_bandwidth)
+        lfm_layout.addRow("PRI (ns):", self.ch1_lfm_pri)
+        lfm_layout.addRow("Pulses:", self.ch1_lfm_num_pulses)
         lfm_layout.addRow(self.ch1_generate_lfm_wave_btn)
 
         self.ch1_lfm_group.setLayout(lfm_layout)
@@ -439,12 +444,17 @@ class AWGGui(QMainWindow):
         self.ch2_step_center_freq = QLineEdit()
         self.ch2_lfm_pulse_width = QLineEdit()
         self.ch2_lfm_bandwidth = QLineEdit()
+        self.ch2_lfm_pri = QLineEdit()
+        self.ch2_lfm_pri.setPlaceholderText("optional, e.g. 10000 or 10000,12000,11000 (stagger)")
+        self.ch2_lfm_num_pulses = QLineEdit()
         self.ch2_generate_lfm_wave_btn = QPushButton(CONFIG['buttons']['Generate_waveform']['label'])
         lfm_layout.addRow("Starting Center Freq (GHz):", self.ch2_start_center_freq)
         lfm_layout.addRow("Stoping Center Freq (GHz):", self.ch2_stop_center_freq)
         lfm_layout.addRow("Step Center Freq (GHz):", self.ch2_step_center_freq)
         lfm_layout.addRow("Pulse width (ns):", self.ch2_lfm_pulse_width)
         lfm_layout.addRow("Bandwidth (GHz):", self.ch2_lfm_bandwidth)
+        lfm_layout.addRow("PRI (ns):", self.ch2_lfm_pri)
+        lfm_layout.addRow("Pulses:", self.ch2_lfm_num_pulses)
         lfm_layout.addRow(self.ch2_generate_lfm_wave_btn)
 
         self.ch2_lfm_group.setLayout(lfm_layout)
@@ -600,7 +610,7 @@ class AWGGui(QMainWindow):
            self.wave_boxes.append(cb)
 
            dropdown = QComboBox()
-           dropdown.addItems(["Select", "Sine", "PRBS", "LFM", "Step LFM", "Noise"])
+           dropdown.addItems(["Select", "Sine", "PRBS", "LFM", "Step LFM", "Noise", "Expression"])
            dropdown.currentIndexChanged.connect(self.show_parameters)
            dropdown.setVisible(False)
            self.dropdown_boxes.append(dropdown)
@@ -710,6 +720,11 @@ class AWGGui(QMainWindow):
                 elif wf_type == "Noise":
                     layout.addRow("Variance:", QLineEdit())
 
+                elif wf_type == "Expression":
+                    formula = QLineEdit()
+                    formula.setPlaceholderText("0.5*sin(2*pi*1e9*t) + prbs(7, 100e6)*gauss(t - 200e-9, 50e-9)")
+                    layout.addRow("Formula:", formula)
+
                 param_group.setVisible(True)
 
     def select_run_channel(self):
@@ -10,26 +10,46 @@ import math
 import csv
 from scipy import signal
 import numpy as np
-from numpy.fft import fft
 
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import plotly.io as pio
 
 
+from config_loader import load_config
 from AWG_Controller import AWG_Controller
 from WaveformGenerator import WaveformGenerator
 from CombinedWaveformGenerator import CombinedWaveformGenerator
+from dac_codes import DACEncoder, write_dac_file
+from Waveform import Waveform
+from loop_compression import compress
+from pulse_train import pulse_train
+from spectrum import power_spectrum, power_spectra
+from streaming_spectrum import welch_psd, spectrogram
+from spectral_metrics import spectral_metrics, METRICS_FILE, SPURS_FILE
+from predistortion import Predistorter
+from WaveformComposer import WaveformComposer
+from SweepEngine import ParallelSweepEngine
+from waveform_expression import ExpressionError
+from waveform_cache import WaveformCache
 
 
 import PyQt5.QtWidgets as QtWidgets
 from PyQt5.QtWidgets import QMessageBox, QFileDialog, QDialog, QVBoxLayout, QLabel, QLineEdit, QPushButton, QHBoxLayout, QFormLayout
 
+CONFIG = load_config()
+
 
 class AWG_GUI_handler:
     def __init__(self, gui_instance):
         self.gui = gui_instance
         self.awg = None
+        # (segments [(file name, samples)], sequence table rows [(segment index, segment loops, sequence loops,
+        # starts a sequence, ends a sequence)]) when the saved waveform is played by the sequencer
+        self.loop_plan = None
+        self.predistorter = Predistorter.from_config()  # None unless config.json "predistortion" is enabled
+        self.composer = None  # WaveformComposer of the combined waveform, kept between regenerations
+        self.cache = WaveformCache.from_config()  # None unless config.json "cache" is enabled
 
 
     def handle_generate_waveform(self, channel):
@@ -48,21 +68,24 @@ class AWG_GUI_handler:
         self.folder_name = f"channel_{channel}_{datetime_1}"
         full_path = os.path.join(ch_folder, self.folder_name)
         os.makedirs(full_path, exist_ok=True)
+        self.loop_plan = None
 
         if waveform_type == "Sine":
             fig = make_subplots(rows = 2, cols = 1, subplot_titles=(f"channel{channel} waveform", f"channel{channel} FFT"))
-            self.generator = WaveformGenerator(ip_address='1.00.0')
+            self.generator = self.cached(WaveformGenerator(ip_address='1.00.0'))
             start = float(getattr(self.gui, f"ch{channel}_start_freq").text().strip())
             stop= float(getattr(self.gui, f"ch{channel}_stop_freq").text().strip())
             step = float(getattr(self.gui, f"ch{channel}_step_freq").text().strip())
             
-            for f in np.arange(start, stop + 0.0001, step):
-                t, w = self.generator.sinusoidal(frequency=f)
-                freq, x = self.fft_signal(w, iota=2)
+            frequencies = np.arange(start, stop + 0.0001, step)
+            waves = self.generator.sinusoidal_batch(frequencies=frequencies, coherent=CONFIG.get("segment", {}).get("coherent", False))
+            waves = self.predistort(waves)
+            for f, w, (freq, x) in zip(frequencies, waves, self.spectra(waves)):
                 # Plot waveform
-                fig.add_trace(go.Scatter(x=t * 1e9, y=w.astype(float), mode='lines', name=f"{waveform_type}_{f:.2f} GHz"), row=1, col=1)
+                fig.add_trace(go.Scatter(x=w.time() * 1e9, y=w.samples.astype(float), mode='lines', name=f"{waveform_type}_{f:.2f} GHz"), row=1, col=1)
                 fig.add_trace(go.Scatter(x=freq, y=x, mode='lines', name=f"{waveform_type}_{f:.2f} GHz"), row=2, col=1)                
-                self.save_waveform_to_csv(waveform_data= w, waveform_type=waveform_type, channel=channel, folder= full_path)
+                self.save_waveform(waveform_data= w.samples, waveform_type=waveform_type, channel=channel, folder= full_path)
+            self.log_metrics(waves, frequencies, full_path)
                 
             fig.update_xaxes(title_text="Time (ns)", row=1, col=1)
             fig.update_yaxes(title_text="Amplitude (V)", row=1, col=1)
@@ -74,20 +97,22 @@ class AWG_GUI_handler:
 
         elif waveform_type == "PRBS":
             fig = make_subplots(rows = 2, cols= 1, subplot_titles=(f"channel{channel} waveform", f"channel{channel} FFT"))
-            self.generator = WaveformGenerator(ip_address='1.00.0')
+            self.generator = self.cached(WaveformGenerator(ip_address='1.00.0'))
             start = float(getattr(self.gui, f"ch{channel}_start_order").text().strip())
             stop= float(getattr(self.gui, f"ch{channel}_stop_order").text().strip())
             step = float(getattr(self.gui, f"ch{channel}_step_order").text().strip())
             repetition_rate = int(getattr(self.gui, f"ch{channel}_prbs_repetition_rate").text().strip())
             
-            for f in np.arange(start, stop + 0.0001, step):
-                t, w = self.generator.PRBS(amplitude=1, order=f, repetition_rate=repetition_rate)
-                freq, x = self.fft_signal(w, iota=2)
+            orders = np.arange(start, stop + 0.0001, step)
+            waves = self.generator.PRBS_batch(amplitude=1, orders=orders, repetition_rate=repetition_rate,
+                                              coherent=CONFIG.get("segment", {}).get("coherent", False))
+            waves = self.predistort(waves)
+            for f, w, (freq, x) in zip(orders, waves, self.spectra(waves)):
                 # Plot waveform
-                fig.add_trace(go.Scatter(x=t * 1e9, y=w, mode='lines', name=f"{waveform_type}_{f:.2f} GHz", line=dict(shape="hv")), row=1, col=1)
+                fig.add_trace(go.Scatter(x=w.time() * 1e9, y=w.samples, mode='lines', name=f"{waveform_type}_{f:.2f} GHz", line=dict(shape="hv")), row=1, col=1)
                 fig.add_trace(go.Scatter(x=freq, y=x, mode='lines', name=f"{waveform_type}_{f:.2f} GHz"), row = 2, col= 1)
                   
-                self.save_waveform_to_csv(waveform_data= w, waveform_type=waveform_type, channel=channel, folder= full_path)
+                self.save_waveform(waveform_data= w.samples, waveform_type=waveform_type, channel=channel, folder= full_path)
                 
             fig.update_xaxes(title_text="Time (ns)", row=1, col=1)
             fig.update_yaxes(title_text="Amplitude (V)", row=1, col=1)
@@ -99,21 +124,32 @@ class AWG_GUI_handler:
 
         elif waveform_type == "LFM":
             fig = make_subplots(rows = 2, cols= 1, subplot_titles=(f"channel{channel} waveform", f"channel{channel} FFT"))
-            self.generator = WaveformGenerator(ip_address='1.00.0')
+            self.generator = self.cached(WaveformGenerator(ip_address='1.00.0'))
             start = float(getattr(self.gui, f"ch{channel}_start_center_freq").text().strip())
             stop= float(getattr(self.gui, f"ch{channel}_stop_center_freq").text().strip())
             step = float(getattr(self.gui, f"ch{channel}_step_center_freq").text().strip())
             pulse_width = int(getattr(self.gui, f"ch{channel}_lfm_pulse_width").text().strip())
             bandwidth = float(getattr(self.gui, f"ch{channel}_lfm_bandwidth").text().strip())
             
-            for f in np.arange(start, stop + 0.0001, step):
-                t, w = self.generator.generate_lfm(center_freq=f, bandwidth=bandwidth, pulse_width=pulse_width)
-                freq, wave = self.fft_signal(w, iota=2)
+            pri = getattr(self.gui, f"ch{channel}_lfm_pri").text().strip()
+
+            if pri:
+                # pulse train at the starting center frequency, played from the sequencer; only its first PRIs are plotted
+                center_freqs = [start]
+                num_pulses = getattr(self.gui, f"ch{channel}_lfm_num_pulses").text().strip()
+                waves = [self.save_pulse_train(channel, start, bandwidth, pulse_width, pri, num_pulses, full_path)]
+            else:
+                center_freqs = np.arange(start, stop + 0.0001, step)
+                waves = self.generator.generate_lfm_batch(center_freqs=center_freqs, bandwidth=bandwidth, pulse_width=pulse_width,
+                                                          pad=CONFIG.get("segment", {}).get("coherent", False))
+                waves = self.predistort(waves)
+            for f, w, (freq, wave) in zip(center_freqs, waves, self.spectra(waves)):
                 # Plot waveform
-                fig.add_trace(go.Scatter(x=t * 1e9, y=w, mode='lines', name=f"{waveform_type}_{f:.2f} GHz"), row=1, col=1)
+                fig.add_trace(go.Scatter(x=w.time() * 1e9, y=w.samples, mode='lines', name=f"{waveform_type}_{f:.2f} GHz"), row=1, col=1)
                 fig.add_trace(go.Scatter(x=freq, y=wave, mode='lines', name=f"{waveform_type}_{f:.2f} GHz"), row = 2, col= 1)
                     
-                self.save_waveform_to_csv(waveform_data= w, waveform_type=waveform_type, channel=channel, folder= full_path)
+                if not pri:
+                    self.save_waveform(waveform_data= w.samples, waveform_type=waveform_type, channel=channel, folder= full_path)
                 
             fig.update_xaxes(title_text="Time (ns)", row=1, col=1)
             fig.update_yaxes(title_text="Amplitude (V)", row=1, col=1)
@@ -125,19 +161,19 @@ class AWG_GUI_handler:
 
         elif waveform_type == "Noise":
             fig = make_subplots(rows = 2, cols= 1, subplot_titles=(f"channel{channel} waveform", f"channel{channel} FFT"))
-            self.generator = WaveformGenerator(ip_address='1.00.0')
+            self.generator = self.cached(WaveformGenerator(ip_address='1.00.0'))
             start = float(getattr(self.gui, f"ch{channel}_start_variance").text().strip())
             stop= float(getattr(self.gui, f"ch{channel}_stop_variance").text().strip())
             step = float(getattr(self.gui, f"ch{channel}_step_variance").text().strip())
             
-            for f in np.arange(start, stop + 0.0001, step):
-                t, w = self.generator.sinusoidal(frequency=f)
-                freq, x = self.fft_signal(w, iota=2)
+            variances = np.arange(start, stop + 0.0001, step)
+            waves = self.predistort([self.generator.noise(variance=variance) for variance in variances])
+            for variance, w, (freq, x) in zip(variances, waves, self.spectra(waves)):
                 # Plot waveform
-                fig.add_trace(go.Scatter(x=t * 1e9, y=w, mode='lines', name=f"{waveform_type}_{f:.2f} GHz"), row=1, col=1)
-                fig.add_trace(go.Scatter(x=freq, y=x, mode='lines', name=f"{waveform_type}_{f:.2f} GHz"), row = 2, col= 1)
+                fig.add_trace(go.Scatter(x=w.time() * 1e9, y=w.samples, mode='lines', name=f"{waveform_type}_var{variance:.2f}"), row=1, col=1)
+                fig.add_trace(go.Scatter(x=freq, y=x, mode='lines', name=f"{waveform_type}_var{variance:.2f}"), row = 2, col= 1)
                     
-                self.save_waveform_to_csv(waveform_data= w, waveform_type=waveform_type, channel=channel, folder= full_path)
+                self.save_waveform(waveform_data= w.samples, waveform_type=waveform_type, channel=channel, folder= full_path)
                 
             fig.update_xaxes(title_text="Time (ns)", row=1, col=1)
             fig.update_yaxes(title_text="Amplitude (V)", row=1, col=1)
@@ -148,34 +184,42 @@ class AWG_GUI_handler:
             getattr(self.gui, f"ch{channel}_plot_view").setHtml(html)   
 
         elif waveform_type == "stepLFM":
-            fig = make_subplots(rows = 2, cols = 1, subplot_titles=(f"channel{channel} waveform", f"channel{channel} FFT"))
-            self.generator = WaveformGenerator(ip_address='1.00.0')
+            fig = make_subplots(rows = 3, cols = 1, subplot_titles=(f"channel{channel} waveform", f"channel{channel} FFT",
+                                                                    f"channel{channel} spectrogram"))
+            self.generator = self.cached(WaveformGenerator(ip_address='1.00.0'))
             start = float(getattr(self.gui, f"ch{channel}_lfm_start_freq").text().strip())
             stop= float(getattr(self.gui, f"ch{channel}_lfm_stop_freq").text().strip())
             step = float(getattr(self.gui, f"ch{channel}_lfm_step_freq").text().strip())
             dwell_time = float(getattr(self.gui, f"ch{channel}_lfm_dwell_time").text().strip())
 
-            t, w = self.generator.generate_steplfm(start_freq=start, stop_freq=stop, 
-                                                    step_freq=step, dwell_time=dwell_time)
+            w = self.generator.generate_steplfm(start_freq=start, stop_freq=stop, 
+                                                 step_freq=step, dwell_time=dwell_time)
+            w = self.predistort(w)
 
-            freq, x = self.fft_signal(w, iota=2)
+            freq, x = self.spectrum(w)
 
-            fig.add_trace(go.Scatter(x=t * 1e9, y=w, mode='lines', 
+            fig.add_trace(go.Scatter(x=w.time() * 1e9, y=w.samples, mode='lines', 
                                     name=f"{waveform_type}_{start:.2f}-{stop:.2f} GHz"), 
                                     row=1, col=1)
                 
             fig.add_trace(go.Scatter(x=freq, y=x, mode='lines', 
                                         name=f"{waveform_type}_{start:.2f}-{stop:.2f} GHz"), 
                                         row = 2, col= 1)
-            self.save_waveform_to_csv(waveform_data= w, waveform_type=waveform_type, channel=channel, folder= full_path)
+            times, freqs, power = self.time_frequency(w)
+            fig.add_trace(go.Heatmap(x=times, y=freqs, z=power.T, colorscale="Viridis", colorbar=dict(title="dBm", len=0.3, y=0.15),
+                                     name=f"{waveform_type}_{start:.2f}-{stop:.2f} GHz"), row = 3, col= 1)
+            self.save_waveform(waveform_data= w.samples, waveform_type=waveform_type, channel=channel, folder= full_path)
             
             fig.update_xaxes(title_text="Time (ns)", row=1, col=1)
-            fig.update_yaxes(title_text="Frequency", row=1, col=1)
+            fig.update_yaxes(title_text="Amplitude (V)", row=1, col=1)
             fig.update_xaxes(title_text="F (GHz)", row = 2, col= 1)
             fig.update_yaxes(title_text="Power dBm", row = 2, col= 1)
+            fig.update_xaxes(title_text="Time (ns)", row = 3, col= 1)
+            fig.update_yaxes(title_text="F (GHz)", row = 3, col= 1)
 
             html = pio.to_html(fig, full_html=False, include_plotlyjs='cdn')
             getattr(self.gui, f"ch{channel}_plot_view").setHtml(html)
+        self.log_cache_stats()
         self.handle_upload_waveform(file_path=full_path, channel=channel)
         
 
@@ -189,6 +233,9 @@ class AWG_GUI_handler:
         step_amp = float(getattr(self.gui, f'ch{channel}_step_amp').text().strip())
 
         self.gui.log_box.append(f"Remote path: {self.remote_path}")
+        if self.loop_plan:
+            self.run_looped(channel, start_amp, stop_amp, step_amp)
+            return
         state_1 = self.gui.ch1_upload_check_bx.isChecked()
         state_2 = self.gui.ch2_upload_check_bx.isChecked()
             
@@ -201,7 +248,8 @@ class AWG_GUI_handler:
         elif channel == 2 or state_2:
             file_path = self.ch2_file_path
             print(f"File path: {file_path}")
-        for file in glob.glob(f"{file_path}/*.csv"):
+        file_format = "BIN" if CONFIG.get("output", {}).get("format", "csv") == "bin" else "CSV"
+        for file in glob.glob(f"{file_path}/*.{file_format.lower()}"):
             try:                    
                 filname = os.path.basename(file)
                 print(f"File name: {filname}")
@@ -212,7 +260,7 @@ class AWG_GUI_handler:
                 self.gui.log_box.append(f"FUll path: {full_path}")
                 self.gui.log_box.append(f"Processing: {file}")
                 seg_log = self.awg.define_segment(channel=channel, segment_id=1, n_sample=720)
-                imp_log = self.awg.import_file(full_path)
+                imp_log = self.awg.import_file(full_path, file_format=file_format, channel=channel)
                 self.gui.log_box.append(f"{seg_log}")
                 self.gui.log_box.append(f"no error")
 
@@ -239,6 +287,50 @@ class AWG_GUI_handler:
             except Exception as e:
                 self.gui.log_box.append(f"{e}")
                         
+    def run_looped(self, channel, start_amp, stop_amp, step_amp):
+        """Play a sequencer plan: each stored segment is imported once and repeated by the sequence table."""
+        file_format = "BIN" if CONFIG.get("output", {}).get("format", "csv") == "bin" else "CSV"
+        remote_path = os.path.join(self.remote_path, self.folder_name).replace("\\", "/")
+        segments, table = self.loop_plan
+        try:
+            self.awg.set_output_state(channel=channel, state=1)
+            self.awg.set_function_mode(channel=channel, mode="ARB")
+            for segment_id, (filename, n_sample) in enumerate(segments, start=1):
+                self.awg.delete_segment(channel=channel, id=segment_id)
+                seg_log = self.awg.define_segment(channel=channel, segment_id=segment_id, n_sample=n_sample)
+                imp_log = self.awg.import_file(f"{remote_path}/{filename}", file_format=file_format, segment_id=segment_id,
+                                               channel=channel)
+                self.gui.log_box.append(f"{seg_log}\n{imp_log}")
+
+            last = len(table) - 1
+            for index, (segment, segment_loops, sequence_loops, first, end) in enumerate(table):
+                control = 0
+                if first:
+                    control |= self.awg.SEQ_INIT
+                if end:
+                    control |= self.awg.SEQ_END
+                if index == last:
+                    control |= self.awg.SCENARIO_END
+                seq_log = self.awg.write_sequence_entry(channel=channel, index=index, segment_id=segment + 1,
+                                                        segment_loops=segment_loops, sequence_loops=sequence_loops,
+                                                        control=control)
+                self.gui.log_box.append(f"{seq_log}")
+            # one sequence plays in sequence mode; several (e.g. a stagger table with a partial pattern) need scenario mode
+            sequences = sum(1 for *_, end in table if end)
+            self.awg.set_function_mode(channel=channel, mode="STSC" if sequences > 1 else "STS")
+
+            for amplitude in np.arange(start_amp, stop_amp + 0.001, step_amp):
+                self.awg.abort_wave_generation(channel=channel)
+                self.awg.set_output_voltage_custom(channel=channel, value=amplitude)
+                self.awg.initiate_signal(channel=channel)
+                time.sleep(60)
+                self.awg.abort_wave_generation(channel=channel)
+
+            self.awg.set_function_mode(channel=channel, mode="ARB")
+            self.awg.set_output_state(channel=channel, state=0)
+        except Exception as e:
+            self.gui.log_box.append(f"{e}")
+
     def update_waveform_inputs(self, waveform_type, channel):
         """Update input field availability based on waveform type and channel"""
         if channel == 1:
@@ -369,6 +461,97 @@ class AWG_GUI_handler:
             return True, ""
     
 
+    def save_pulse_train(self, channel, center_freq, bandwidth, pulse_width, pri, num_pulses, folder):
+        """
+        LFM pulse train (pri in ns, comma-separated for a stagger pattern) saved as its sequencer segments; sets
+        loop_plan and returns a preview of the first PRIs. The idle time between pulses is never materialized.
+        """
+        pulse = self.predistort(self.generator.generate_lfm(center_freq=center_freq, bandwidth=bandwidth, pulse_width=pulse_width),
+                                periodic=False)  # the pulse is followed by idle time, not by itself
+        pris = [float(value) * 1e-9 for value in pri.split(",")]
+        plan = pulse_train(pulse, pris, int(num_pulses) if num_pulses else len(pris))
+        self.loop_plan = self.save_sequence_plan(plan.segments, plan.sequence_table(), "lfm_train", channel, folder)
+        self.gui.log_box.append(f"📡 Pulse train: {int(num_pulses or len(pris))} pulses, PRI "
+                                f"{', '.join(f'{p * 1e9:.6g}' for p in plan.pris)} ns, duty cycle {plan.duty_cycle:.2%}; "
+                                f"{plan.upload_samples} of {plan.num_samples} samples stored ({plan.compression_ratio:.0f}x less upload)")
+        return plan.preview()
+
+    def save_sequence_plan(self, segments, table, name, channel, folder):
+        """Save each sequencer segment as <name>_<n>; returns the loop_plan run() plays, or None if a save failed."""
+        saved = []
+        for k, samples in enumerate(segments, start=1):
+            path = self.save_waveform(waveform_data=samples, waveform_type=f"{name}_{k}", channel=channel, folder=folder)
+            if not path:
+                return None
+            saved.append((os.path.basename(path), len(samples)))
+        return saved, table
+
+    def cached(self, generator):
+        """generator behind the configured waveform cache (identical calls are generated once), if any."""
+        return generator if self.cache is None else self.cache.wrap(generator)
+
+    def log_cache_stats(self):
+        if self.cache is None:
+            return
+        stats = self.cache.stats()
+        self.gui.log_box.append(f"Waveform cache: {stats['memory_hits']} memory / {stats['disk_hits']} disk hits, "
+                                f"{stats['misses']} generated ({stats['hit_rate']:.0%} hit rate), "
+                                f"{stats['memory_bytes'] / 2**20:.1f} MiB in memory, {stats['disk_bytes'] / 2**20:.1f} MiB on disk")
+
+    def log_metrics(self, waves, frequencies, folder):
+        """SFDR / THD / SNR / ENOB of every point of a tone sweep (GHz), saved as metrics.csv next to the waveforms."""
+        if not CONFIG.get("metrics", {}).get("enabled", False):
+            return None
+        table = spectral_metrics(waves, fundamentals=np.asarray(frequencies) * 1e9)
+        table.save(os.path.join(folder, METRICS_FILE), params=[{"frequency_ghz": f} for f in frequencies])
+        table.save_spurs(os.path.join(folder, SPURS_FILE))
+        for f, f0, sfdr, thd, snr, enob in zip(frequencies, table["fundamental_hz"], table["sfdr_dbc"], table["thd_dbc"],
+                                               table["snr_db"], table["enob"]):
+            if np.isnan(f0):
+                self.gui.log_box.append(f"⚠️ {f:.2f} GHz: record too short for spectral metrics, skipped.")
+                continue
+            self.gui.log_box.append(f"{f:.2f} GHz: SFDR {sfdr:.1f} dBc, THD {thd:.1f} dBc, SNR {snr:.1f} dB, ENOB {enob:.2f}")
+        return table
+
+    def predistort(self, waves, periodic=True):
+        """
+        Apply the configured pre-distortion to a Waveform (a 2-D sweep batch in one pass) or a list of Waveforms.
+        periodic=False filters linearly, for records that are not played back to back (e.g. a single pulse).
+        """
+        if self.predistorter is None:
+            return waves
+        if isinstance(waves, Waveform):
+            return self.predistorter.apply(waves, periodic)
+        return [self.predistorter.apply(w, periodic) for w in waves]
+
+    def save_waveform(self, waveform_data, waveform_type, channel, folder):
+        """Save waveform data in the output format selected in config.json (csv or bin)."""
+        if CONFIG.get("output", {}).get("format", "csv") == "bin":
+            return self.save_waveform_to_bin(waveform_data, waveform_type, channel, folder)
+        return self.save_waveform_to_csv(waveform_data, waveform_type, channel, folder)
+
+    def save_waveform_to_bin(self, waveform_data, waveform_type, channel, folder):
+        """Save waveform data as int16 DAC words (2 bytes per sample) for BIN import."""
+        self.folder = folder
+        if not self.folder:
+            self.gui.log_box.append("⚠️ Save operation cancelled by user.")
+            return None
+
+        output = CONFIG.get("output", {})
+        encoder = DACEncoder(dac_bits=output.get("dac_bits", 14), full_scale=output.get("full_scale", 1.0))
+        filename = f"{waveform_type.lower()}.bin"
+
+        try:
+            full_path = os.path.join(self.folder, filename)
+            write_dac_file(encoder.encode(waveform_data), full_path)
+            if encoder.last_clipped:
+                self.gui.log_box.append(f"⚠️ {encoder.last_clipped} samples clipped to DAC full scale")
+            self.gui.log_box.append(f"✅ Channel {channel} waveform data saved to: {full_path}")
+            return full_path
+        except Exception as e:
+            self.gui.log_box.append(f"❌ Error saving waveform: {e}")
+            return None
+
     def save_waveform_to_csv(self, waveform_data, waveform_type, channel, folder):
         """Save waveform data to a CSV file."""
         self.folder = folder
@@ -501,14 +684,32 @@ class AWG_GUI_handler:
                 pass
         event.accept()
 
-    def fft_signal(self, w, iota):
-        x = fft(w)
-        x = np.absolute(x)
-        N = len(w)
-        n = np.arange(N)
-        T = N/ (1e9)  # Convert to time in seconds
-        freq = n/T
-        return freq/1e9, x
+    def spectrum(self, waveform):
+        """
+        (frequency in GHz, power in dBm into 50 ohms) of a Waveform for the FFT plots (see spectrum.py).
+        Records longer than spectrum.welch_above samples are Welch-averaged chunk by chunk instead.
+        """
+        config = CONFIG.get("spectrum", {})
+        if waveform.num_samples > config.get("welch_above", 1 << 20):
+            freqs, power = welch_psd(waveform, segment_length=config.get("welch_segment", 1 << 16)).spectrum()
+        else:
+            freqs, power = power_spectrum(waveform)
+        return freqs / 1e9, power
+
+    def spectra(self, waves):
+        """spectrum() of every point of a sweep (2-D Waveform or list of Waveforms) in one batched call."""
+        limit = CONFIG.get("spectrum", {}).get("welch_above", 1 << 20)
+        if any(w.num_samples > limit for w in waves):
+            return [self.spectrum(w) for w in waves]
+        return [(freqs / 1e9, power) for freqs, power in power_spectra(waves)]
+
+    def time_frequency(self, waveform):
+        """(time in ns, frequency in GHz, dBm rows) spectrogram of a Waveform for the chirp plots."""
+        config = CONFIG.get("spectrum", {})
+        segment = min(config.get("spectrogram_segment", 1024), waveform.num_samples)
+        times, freqs, power = spectrogram(waveform, segment_length=segment,
+                                          max_rows=config.get("spectrogram_rows", 256))
+        return times * 1e9, freqs / 1e9, power
     
     
     def toggle_upload_check(self, channel):
@@ -664,6 +865,29 @@ class AWG_GUI_handler:
             self.gui.ch2_cb.setEnabled(True)
 
 
+    def generate_components(self, slots, folder):
+        """
+        Generate the combined-waveform components the composer does not have yet on the sweep engine's process
+        pool: each one is put in its slot and saved to folder as it arrives, while the others are still generating.
+        Small records, or a single missing component, are left to composer.set() in-process.
+        """
+        pending = [(i, method, kwargs, options) for i, method, kwargs, options in slots
+                   if self.composer.needs(method, kwargs)]
+        if len(pending) < 2 or self.composer.num_samples < CONFIG.get("sweep", {}).get("min_parallel_samples", 1 << 20):
+            return
+        os.makedirs(folder, exist_ok=True)
+        calls = [(method, dict(kwargs, **options)) for _, method, kwargs, options in pending]
+        try:
+            for index, _, samples in ParallelSweepEngine(generator="combined").iter_calls(calls, self.composer.num_samples):
+                i, method, kwargs, options = pending[index]
+                self.composer.provide(method, kwargs, samples)
+                self.composer.set(i, method, kwargs)
+                self.save_waveform(waveform_data=samples, waveform_type=f"component{i + 1}_{method}", channel='channel', folder=folder)
+                self.gui.log_box.append(f"Waveform {i + 1}: {method} generated")
+        except Exception as e:
+            # e.g. a bad formula: the remaining slots are generated (and reported) one by one by composer.set()
+            self.gui.log_box.append(f"⚠️ Parallel generation stopped: {e}")
+
     def handle_combined_waveform(self, channel):
         fig = make_subplots(rows=2, cols=1, subplot_titles=("Combined Waveform", "FFT of Combined Waveform"))
 
@@ -679,8 +903,12 @@ class AWG_GUI_handler:
             self.gui.log_box.append("❌ Please enter a valid number of samples")
             return
 
-        combined_waveform = CombinedWaveformGenerator()
-        wave = np.zeros(num_samples)
+        # components are cached between calls: only slots whose parameters changed are regenerated
+        if self.composer is None or self.composer.num_samples != num_samples:
+            self.composer = WaveformComposer(num_samples, generator=self.cached(CombinedWaveformGenerator()))
+        synthesis = CONFIG.get("synthesis", {})
+        chunk_size = synthesis.get("chunk_size")
+        max_workers = synthesis.get("max_workers")
 
         # --- folder to save ---
         combined_folder = QFileDialog.getExistingDirectory(self.gui, "Select Folder to Save CSV") 
@@ -692,6 +920,7 @@ class AWG_GUI_handler:
         os.makedirs(full_path, exist_ok=True)
 
         # --- loop through waveform slots ---
+        slots = []
         for i, cb in enumerate(self.gui.wave_boxes):
             if not cb.isChecked():
                 continue
@@ -711,42 +940,71 @@ class AWG_GUI_handler:
                     val = field_item.widget().text().strip()
                     params[key] = val
 
-            # --- generate waveform based on type ---
+            # --- component method and parameters based on type ---
+            options = {}
             if wf_type == "Sine":
-                frequency = float(params.get("Frequency", 1e6))
-                t, w = combined_waveform.sinusoidal(num_samples=num_samples, frequency=frequency)
+                method = "sinusoidal"
+                kwargs = {"frequency": float(params.get("Frequency", 1e6))}
+                options = {"chunk_size": chunk_size, "max_workers": max_workers}
             elif wf_type == "PRBS":
-                order = int(params.get("Order", 7))
-                repetition_rate = int(params.get("Repetition Rate", 1e6))
-                t, w = combined_waveform.PRBS(num_samples=num_samples, order=order, repetition_rate=repetition_rate)
+                method = "PRBS"
+                kwargs = {"order": int(params.get("Order", 7)),
+                          "repetition_rate": int(params.get("Repetition Rate", 1e6))}
             elif wf_type == "LFM":
-                center_freq = float(params.get("Center Freq", 1e6))
-                bandwidth = float(params.get("Bandwidth", 1e6))
-                pulse_width = int(params.get("Pulse Width", 100))
-                t, w = combined_waveform.generate_lfm(num_samples=num_samples, center_freq=center_freq,
-                                                      bandwidth=bandwidth, pulse_width=pulse_width)
+                method = "generate_lfm"
+                kwargs = {"center_freq": float(params.get("Center Freq", 1e6)),
+                          "bandwidth": float(params.get("Bandwidth", 1e6)),
+                          "pulse_width": int(params.get("Pulse Width", 100))}
+                options = {"chunk_size": chunk_size, "max_workers": max_workers}
             elif wf_type == "Step LFM":
-                start_freq = float(params.get("Start Freq", 1e6))
-                stop_freq = float(params.get("Stop Freq", 2e6))
-                step_freq = float(params.get("Step Freq", 1e5))
-                dwell_time = float(params.get("Dwell Time", 10))
-                t, w = combined_waveform.generate_steplfm(num_samples=num_samples, start_freq=start_freq,
-                                                          stop_freq=stop_freq, step_freq=step_freq,
-                                                          dwell_time=dwell_time)
+                method = "generate_steplfm"
+                kwargs = {"start_freq": float(params.get("Start Freq", 1e6)),
+                          "stop_freq": float(params.get("Stop Freq", 2e6)),
+                          "step_freq": float(params.get("Step Freq", 1e5)),
+                          "dwell_time": float(params.get("Dwell Time", 10))}
             elif wf_type == "Noise":
-                variance = float(params.get("Variance", 1))
-                t, w = combined_waveform.generate_noise(num_samples=num_samples, variance=variance)
+                method = "generate_noise"
+                kwargs = {"variance": float(params.get("Variance", 1))}
+            elif wf_type == "Expression":
+                method = "expression"
+                kwargs = {"formula": params.get("Formula", "")}
+                options = {"chunk_size": chunk_size, "max_workers": max_workers}
             else:
                 continue
+            slots.append((i, method, kwargs, options))
 
-            wave += w
+        self.generate_components(slots, os.path.join(combined_folder, f"{self.folder_name}_components"))
+        active = set()
+        for i, method, kwargs, options in slots:
+            try:
+                self.composer.set(i, method, kwargs, **options)
+            except ExpressionError as e:
+                self.gui.log_box.append(f"❌ Waveform {i + 1}: {e}")
+                continue
+            active.add(i)
+
+        self.composer.retain(active)
+        wave = self.composer.waveform.samples
+
+        combined = self.predistort(Waveform(wave, 7.2e9))
+        wave = combined.samples
 
         # --- FFT ---
-        f, x = self.fft_signal(wave, iota=2)
-        t = np.arange(num_samples) / 7.2e9
+        f, x = self.spectrum(combined)
 
         # --- save ---
-        self.save_waveform_to_csv(waveform_data=wave, waveform_type="combined", channel='channel', folder=full_path)
+        # a periodic composite is stored as its repeating unit (+ tail) and looped by the sequencer in run()
+        self.loop_plan = None
+        looped = compress(combined) if CONFIG.get("segment", {}).get("loop_compression", False) else None
+        if looped is not None and looped.compression_ratio > 1:
+            parts = looped.segments()
+            table = [(k, loops, 1, k == 0, k == len(parts) - 1) for k, (samples, loops) in enumerate(parts)]
+            self.loop_plan = self.save_sequence_plan([samples for samples, loops in parts], table, "combined",
+                                                     channel='channel', folder=full_path)
+            self.gui.log_box.append(f"🔁 Loop compression: {looped.upload_samples} of {looped.num_samples} samples stored "
+                                    f"({looped.compression_ratio:.0f}x less upload)")
+        else:
+            self.save_waveform(waveform_data=wave, waveform_type="combined", channel='channel', folder=full_path)
         if self.gui.ch1_cb.isChecked():
             channel = 1
             self.handle_upload_waveform(channel=channel, file_path=full_path)
@@ -757,7 +1015,7 @@ class AWG_GUI_handler:
             QMessageBox.warning(self.gui, "Channel required", "Select a channel")        
 
         # --- plot ---
-        fig.add_trace(go.Scatter(x=t * 1e9, y=wave, mode='lines', name='Combined Waveform'), row=1, col=1)
+        fig.add_trace(go.Scatter(x=combined.time() * 1e9, y=wave, mode='lines', name='Combined Waveform'), row=1, col=1)
         fig.add_trace(go.Scatter(x=f, y=x, mode='lines', name='FFT of Combined Waveform'), row=2, col=1)
 
         fig.update_xaxes(title_text="Time (ns)", row=1, col=1)
@@ -1,24 +1,42 @@
 import numpy as np
-from pyfinite import ffield
+from chunked_synthesis import synthesize_chunked, sine_chunk_kernel, lfm_chunk_kernel
+from dac_codes import as_output_dtype, resolve_dtype
+from Waveform import Waveform
+from stepped_frequency import stepped_frequency_tone, stepped_frequency_chunk_kernel
+from loop_compression import LoopedWaveform
+from lfsr import primitive_taps, random_state
+from NoiseGenerator import NoiseGenerator
+from waveform_graph import Source, ArraySource, PeriodicSource
+from waveform_expression import compile_expression
 
 class CombinedWaveformGenerator:
+    # part of every waveform_cache key: bump when a change alters the samples a call produces
+    CACHE_VERSION = 2
+
     def __init__(self):
         pass
 
-    def sinusoidal(self, frequency, num_samples, sampling_frequency=7.2):
+    # All methods return a Waveform of num_samples samples; its time axis is built lazily by .time().
+    # chunk_size / max_workers: optional chunked, thread-parallel synthesis into one preallocated buffer
+    # dtype: sample type of the returned wave (None keeps float64, e.g. "float32" halves memory)
+    def sinusoidal(self, frequency, num_samples, sampling_frequency=7.2, chunk_size=None, max_workers=None, dtype=None):
         frequency = frequency * 1e9
         sampling_frequency = sampling_frequency * 1e9
 
-        t = np.arange(num_samples) / sampling_frequency
-        wave = np.sin(2 * np.pi * frequency * t)
-        return t, wave
+        if chunk_size:
+            wave = synthesize_chunked(sine_chunk_kernel(frequency, sampling_frequency), num_samples, chunk_size, max_workers,
+                                      dtype=resolve_dtype(dtype) or np.float64)
+        else:
+            t = np.arange(num_samples) / sampling_frequency
+            wave = as_output_dtype(np.sin(2 * np.pi * frequency * t), dtype)
+        return Waveform(wave, sampling_frequency)
     def get_taps(self, order):
-        F = ffield.FField(order)
-        taps = [i for i, bit in enumerate(reversed(F.ShowCoefficients(F.generator))) if bit == 1]
-        print("taps: ", taps)
-        return taps[:-1]  # remove x^0 term which is always 1 in primitive polynomials
+        taps = primitive_taps(order)
+        return taps
     
-    def PRBS(self, num_samples, order, repetition_rate, sampling_frequency=7.2, max_bits=None):
+    # looped=True returns a LoopedWaveform (one sequence period + loop count + remainder) instead of tiling on the host
+    # seed (int) reproduces the random LFSR start state; None draws a fresh one
+    def PRBS(self, num_samples, order, repetition_rate, sampling_frequency=7.2, max_bits=None, dtype=None, looped=False, seed=None):
         order = int(order)
         taps = self.get_taps(order)
         sampling_frequency = float(sampling_frequency) * 1e9
@@ -32,12 +50,7 @@ class CombinedWaveformGenerator:
         else:
             length = max_length
 
-        while True:
-            seed = np.random.randint(0, 2, size=order).tolist()
-            if any(seed):
-                break
-
-        state = seed.copy()
+        state = random_state(order, seed)
         bits = []
         for _ in range(length):
             feedback = 0
@@ -47,9 +60,6 @@ class CombinedWaveformGenerator:
             state = [feedback] + state[:-1]
 
         bits = np.array(bits)
-        print(f"[DEBUG] order={order}, length={length}, oversample={oversample}, total_samples={length * oversample}")
-        print("Bits:", bits[:50])
-        print("Unique bit values:", np.unique(bits))
 
         # Create waveform by repeating each bit oversample times
         waveform = np.repeat(bits, oversample)
@@ -59,6 +69,9 @@ class CombinedWaveformGenerator:
             print("[WARNING] Empty waveform generated, creating alternating pattern")
             waveform = np.tile([0, 1], num_samples // 2 + 1)[:num_samples]
         
+        if looped and 0 < len(waveform) <= num_samples:
+            return LoopedWaveform.declared(as_output_dtype(waveform, dtype), num_samples, sampling_frequency)
+
         # Ensure we have enough samples, truncate or repeat as needed
         if len(waveform) > num_samples:
             waveform = waveform[:num_samples]
@@ -69,13 +82,11 @@ class CombinedWaveformGenerator:
         elif len(waveform) == 0:
             # Fallback: create simple alternating pattern
             waveform = np.tile([0, 1], num_samples // 2 + 1)[:num_samples]
-            
-        time = np.arange(len(waveform)) / sampling_frequency
 
-        return time, waveform
+        return Waveform(as_output_dtype(waveform, dtype), sampling_frequency)
     
 
-    def generate_lfm(self, center_freq, bandwidth, pulse_width, num_samples, sampling_freq = 7.2):
+    def generate_lfm(self, center_freq, bandwidth, pulse_width, num_samples, sampling_freq = 7.2, chunk_size=None, max_workers=None, dtype=None):
         
         self.sampling_freq = float(sampling_freq) * 1e9  # GHz to Hz
         self.center_freq = float(center_freq) * 1e9  # GHz to Hz
@@ -88,43 +99,82 @@ class CombinedWaveformGenerator:
         self.f0 = float(self.center_freq - self.bandwidth / 2)
         self.f1 = float(self.center_freq + self.bandwidth / 2)
 
-        t = np.arange(0, self.num_samples)/ self.sampling_freq
-        waveform = np.cos(2*np.pi * ((self.f0 * t) + (self.k/2) * (t ** 2)))   #signal.chirp(t, f0=self.f0, f1=self.f1, t1=self.num_samples, method='linear') 
-
-        return t, waveform
-    def generate_steplfm(self, start_freq, stop_freq, step_freq, dwell_time, num_samples, sampling_freq=7.2):
+        if chunk_size:
+            waveform = synthesize_chunked(lfm_chunk_kernel(self.f0, self.k, self.sampling_freq), self.num_samples, chunk_size, max_workers,
+                                          dtype=resolve_dtype(dtype) or np.float64)
+        else:
+            t = np.arange(0, self.num_samples)/ self.sampling_freq
+            waveform = np.cos(2*np.pi * ((self.f0 * t) + (self.k/2) * (t ** 2)))   #signal.chirp(t, f0=self.f0, f1=self.f1, t1=self.num_samples, method='linear') 
+            waveform = as_output_dtype(waveform, dtype)
+
+        return Waveform(waveform, self.sampling_freq)
+    # Stepped-frequency tone over num_samples: the samples are split evenly across the steps (the last step takes
+    # the remainder) and the tone stays phase-continuous across steps; no Python loop over steps.
+    def generate_steplfm(self, start_freq, stop_freq, step_freq, dwell_time, num_samples, sampling_freq=7.2, dtype=None):
         sampling_freq = float(sampling_freq) * 1e9  # GHz to Hz
         start_freq = float(start_freq) * 1e9  # GHz to Hz
         stop_freq = float(stop_freq) * 1e9  # GHz to Hz
         step_freq = float(step_freq) * 1e9 # GHz to Hz 
         dwell_time = float(dwell_time) * 1e-9
 
+        waveform = stepped_frequency_tone(*self._steps(start_freq, stop_freq, step_freq, num_samples), sampling_freq)
+
+        return Waveform(as_output_dtype(waveform, dtype), sampling_freq)
+
+    @staticmethod
+    def _steps(start_freq, stop_freq, step_freq, num_samples):
+        """(frequencies, counts) of generate_steplfm; frequencies in Hz."""
         # Calculate number of frequency steps
         num_steps = int((stop_freq - start_freq) / step_freq) + 1
         samples_per_step = num_samples // num_steps
-    
-        t_total = []
-        waveform = []
-        current_freq = start_freq
-        time_offset = 0
-
-        for step in range(num_steps):
-            # Use samples_per_step instead of num_samples
-            if step == num_steps - 1:  # Last step gets remaining samples
-                current_samples = num_samples - len(np.concatenate(waveform)) if waveform else samples_per_step
-            else:
-                current_samples = samples_per_step
-            
-            t = np.arange(current_samples) / sampling_freq
-            level = (current_freq - start_freq) / step_freq + 1
-            wave = np.full_like(t, fill_value=level)
-            t_total.append(t + time_offset)
-            waveform.append(wave)
-            time_offset += current_samples / sampling_freq
-            current_freq += step_freq
-
-        t_total = np.concatenate(t_total)
-        waveform = np.concatenate(waveform)
-
-        return t_total, waveform
-    
\ No newline at end of file
+
+        counts = np.full(num_steps, samples_per_step)
+        counts[-1] = num_samples - samples_per_step * (num_steps - 1)  # Last step gets remaining samples
+        frequencies = start_freq + step_freq * np.arange(num_steps)
+        return frequencies, counts
+
+    # Zero-mean white Gaussian noise of the given variance. The same seed reproduces the same samples,
+    # whatever max_workers is (see NoiseGenerator).
+    def generate_noise(self, num_samples, variance, sampling_freq=7.2, seed=None, max_workers=None, dtype=None):
+        sampling_freq = float(sampling_freq) * 1e9  # GHz to Hz
+        waveform = NoiseGenerator(seed).white(num_samples, variance, max_workers=max_workers, dtype=dtype)
+        return Waveform(waveform, sampling_freq)
+
+    # User formula, e.g. "0.5*sin(2*pi*f*t) + prbs(7, 100e6)*gauss(t - 200e-9, 50e-9)" with variables={"f": 1e9}.
+    # SI units inside the formula (t in s, Hz); see waveform_expression for the names and functions available.
+    # The formula is compiled once and evaluated in chunks of chunk_size (whole record when None) on max_workers threads.
+    def expression(self, formula, num_samples, sampling_frequency=7.2, variables=None, chunk_size=None, max_workers=None, dtype=None):
+        sampling_frequency = float(sampling_frequency) * 1e9  # GHz to Hz
+        node = compile_expression(formula, num_samples, sampling_frequency, variables)
+        waveform = node.to_array(chunk_size or 1 << 16, max_workers)
+        return Waveform(as_output_dtype(waveform, dtype), sampling_frequency)
+
+    # Lazy counterpart of the generators above: returns a waveform_graph Node for method(num_samples, **kwargs)
+    # instead of samples, to be combined (+, *, gain, clip, window, ...) and evaluated chunk by chunk.
+    # Sine, LFM, stepped-frequency and noise are computed per chunk (noise from the same seeded blocks as
+    # generate_noise), PRBS repeats one period, so no full-length component is held.
+    def lazy(self, method, num_samples, sampling_frequency=7.2, **kwargs):
+        fs = float(sampling_frequency) * 1e9  # GHz to Hz
+        if method == "sinusoidal":
+            return Source(sine_chunk_kernel(float(kwargs["frequency"]) * 1e9, fs), num_samples, fs)
+        if method == "generate_lfm":
+            bandwidth = float(kwargs["bandwidth"]) * 1e9
+            f0 = float(kwargs["center_freq"]) * 1e9 - bandwidth / 2
+            k = bandwidth / (float(kwargs["pulse_width"]) * 1e-9)
+            return Source(lfm_chunk_kernel(f0, k, fs), num_samples, fs)
+        if method == "expression":
+            return compile_expression(kwargs["formula"], num_samples, fs, kwargs.get("variables"))
+        if method == "PRBS":
+            looped = self.PRBS(num_samples, sampling_frequency=sampling_frequency, looped=True, **kwargs)
+            if isinstance(looped, LoopedWaveform):
+                return PeriodicSource(looped.unit, num_samples, fs)
+            return ArraySource(looped.samples, fs)
+
+        if method == "generate_steplfm":
+            steps = self._steps(*(float(kwargs[name]) * 1e9 for name in ("start_freq", "stop_freq", "step_freq")),
+                                num_samples)
+            return Source(stepped_frequency_chunk_kernel(*steps, fs), num_samples, fs)
+        if method == "generate_noise":
+            noise = NoiseGenerator(kwargs.get("seed"))
+            return Source(noise.white_kernel(kwargs["variance"]), num_samples, fs)
+        raise ValueError(f"No lazy form for '{method}'")
@@ -0,0 +1,101 @@
+import csv
+
+import numpy as np
+
+from logger import awg_logger
+from Waveform import Waveform
+from dac_codes import DACEncoder, write_dac_file
+from pulse_shaping import oversampling_ratio, pulse_taps, shape_symbols
+
+
+# Gray-coded constellations, scaled to unit average symbol energy. Square QAM is two Gray-coded PAM axes.
+BITS_PER_SYMBOL = {"BPSK": 1, "QPSK": 2, "16QAM": 4, "64QAM": 6}
+
+
+def _gray_pam(bits):
+    """Levels -(M-1) .. (M-1) of an M = 2**bits PAM, indexed by Gray-coded bit pattern."""
+    m = 1 << bits
+    index = np.arange(m)
+    levels = np.empty(m)
+    levels[index ^ (index >> 1)] = 2 * index - (m - 1)
+    return levels
+
+
+def constellation(scheme):
+    """Symbol table indexed by the integer value of each symbol's bits (MSB first)."""
+    if scheme not in BITS_PER_SYMBOL:
+        raise ValueError(f"Unknown modulation '{scheme}', expected one of {list(BITS_PER_SYMBOL)}")
+    if scheme == "BPSK":
+        points = np.array([-1, 1], dtype=np.complex128)
+    else:
+        half = BITS_PER_SYMBOL[scheme] // 2
+        axis = _gray_pam(half)
+        # high bits pick I, low bits pick Q
+        points = (axis[:, None] + 1j * axis[None, :]).ravel()
+    return points / np.sqrt(np.mean(np.abs(points) ** 2))
+
+
+def map_symbols(bits, scheme):
+    """Bits (0/1, length a multiple of the bits per symbol) to complex symbols, one table lookup for all of them."""
+    bits_per_symbol = BITS_PER_SYMBOL[scheme]
+    bits = np.asarray(bits, dtype=np.uint8).reshape(-1, bits_per_symbol)
+    weights = 1 << np.arange(bits_per_symbol - 1, -1, -1)
+    return constellation(scheme)[bits @ weights]
+
+
+def interleave_iq(samples):
+    """Complex samples as I0, Q0, I1, Q1, ... (a view when samples are complex128)."""
+    return np.ascontiguousarray(samples, dtype=np.complex128).view(np.float64)
+
+
+class ModulationGenerator:
+    """
+    Digitally modulated complex baseband (I + jQ) waveforms for the instrument's IQ mode: Gray-mapped
+    BPSK/QPSK/16-QAM/64-QAM symbols shaped by a root-raised-cosine filter in one polyphase pass
+    (see pulse_shaping.py), at any rational ratio of sampling frequency to symbol rate.
+    """
+
+    def __init__(self, ip_address):
+        self.logger = awg_logger()
+        if self.logger._log_file_path is None:
+                self.logger._initialize_log_file(f"awg_{ip_address}")
+
+    # symbol_rate in MHz, sampling_frequency in GHz (like PRBS). bits=None draws num_symbols random symbols
+    # from seed. The symbols are shaped as one period of a repeating sequence, so the record loops seamlessly.
+    # Peak |I + jQ| is scaled to amplitude / 2.
+    def generate(self, scheme, symbol_rate, num_symbols=1024, bits=None, rolloff=0.35, span=8, amplitude=1,
+                 sampling_frequency=7.2, seed=None):
+        sampling_frequency = float(sampling_frequency) * 1e9  # user gives sampling frequency in GHz
+        symbol_rate = float(symbol_rate) * 1e6  # user gives symbol rate in MHz
+        bits_per_symbol = BITS_PER_SYMBOL.get(scheme)
+        if bits_per_symbol is None:
+            raise ValueError(f"Unknown modulation '{scheme}', expected one of {list(BITS_PER_SYMBOL)}")
+
+        if bits is None:
+            bits = np.random.default_rng(seed).integers(0, 2, size=int(num_symbols) * bits_per_symbol, dtype=np.uint8)
+        bits = np.asarray(bits, dtype=np.uint8)
+        bits = bits[:len(bits) - len(bits) % bits_per_symbol]
+        symbols = map_symbols(bits, scheme)
+
+        up, down = oversampling_ratio(sampling_frequency, symbol_rate)
+        taps, delay = pulse_taps("root_raised_cosine", up, span=span, rolloff=rolloff)
+        iq = shape_symbols(symbols, up, down, taps, delay)
+        iq *= (float(amplitude) / 2) / np.max(np.abs(iq))
+
+        self.logger._log_command(command=f"generate {scheme} IQ wave ({len(symbols)} symbols)", duration_ms=None, response = "Successfully generated")
+        print(f"num symbols: {len(symbols)}, samples per symbol: {up / down:.6g}, num samples: {len(iq)}")
+
+        return Waveform(iq, sampling_frequency)
+
+    # Write I/Q for the instrument's IQ import (AWG.import_file(..., iq_data="BOTH")): file_format "csv" writes
+    # Y1 (I) and Y2 (Q) columns, "bin" writes interleaved int16 DAC words (IQBIN: I0, Q0, I1, Q1, ...).
+    def save_iq(self, waveform, file_path, file_format="csv", dac_bits=14, full_scale=1.0):
+        samples = waveform.samples if isinstance(waveform, Waveform) else np.asarray(waveform)
+        if file_format == "bin":
+            return write_dac_file(DACEncoder(dac_bits=dac_bits, full_scale=full_scale).encode(interleave_iq(samples)), file_path)
+
+        with open(file_path, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(["Y1", "Y2"])
+            writer.writerows(interleave_iq(samples).reshape(-1, 2).tolist())
+        return file_path
@@ -0,0 +1,129 @@
+import numpy as np
+from scipy import fft as sp_fft
+
+from chunked_synthesis import synthesize_chunked
+from dac_codes import resolve_dtype
+
+
+BIT_GENERATORS = {
+    "PCG64": np.random.PCG64,
+    "Philox": np.random.Philox,
+}
+
+
+class NoiseGenerator:
+    """
+    Seeded noise engine on numpy.random.Generator. Samples are drawn in fixed BLOCK_SIZE blocks, block i from
+    its own stream (the seeded bit generator jumped i times), so the output depends only on the seed and
+    the length: blocks can be filled by any number of threads and the result is still bit-for-bit the same.
+    Frequencies and sampling_freq are in Hz.
+    """
+
+    BLOCK_SIZE = 1 << 20
+
+    def __init__(self, seed=None, bit_generator="PCG64"):
+        if bit_generator not in BIT_GENERATORS:
+            raise ValueError(f"Unknown bit generator '{bit_generator}', expected one of {list(BIT_GENERATORS)}")
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.bit_generator = BIT_GENERATORS[bit_generator]
+
+    @property
+    def seed(self):
+        """Entropy of the seed sequence; pass it back as seed to reproduce the noise."""
+        return self.seed_sequence.entropy
+
+    def block_rng(self, block_index):
+        return np.random.Generator(self.bit_generator(self.seed_sequence).jumped(int(block_index)))
+
+    def white(self, num_samples, variance=1.0, distribution="gaussian", max_workers=None, dtype=None):
+        """Zero-mean white noise with the given variance ("gaussian" or "uniform")."""
+        dtype = resolve_dtype(dtype) or np.dtype(np.float64)
+        # the generator fills float32/float64 buffers directly; other output types are cast at the end
+        work_dtype = dtype if dtype in (np.float32, np.float64) else np.dtype(np.float64)
+        kernel = self.white_kernel(variance, distribution)
+        wave = synthesize_chunked(kernel, num_samples, self.BLOCK_SIZE, max_workers, dtype=work_dtype)
+        return wave.astype(dtype, copy=False)
+
+    def white_kernel(self, variance=1.0, distribution="gaussian"):
+        """
+        Chunk kernel(start, stop, out) of white(): samples [start, stop) of the same noise for any chunking.
+        A chunk starting inside a block is copied from that whole block, drawn once and kept until the next one.
+        """
+        if distribution not in ("gaussian", "uniform"):
+            raise ValueError(f"Unknown distribution '{distribution}'")
+        std = np.sqrt(float(variance))
+
+        def draw(block, out):
+            rng = self.block_rng(block)
+            if distribution == "gaussian":
+                rng.standard_normal(out=out, dtype=out.dtype)
+                out *= std
+            else:
+                rng.random(out=out, dtype=out.dtype)  # U[0, 1) -> U[-a, a) with variance a^2 / 3
+                out -= 0.5
+                out *= 2 * np.sqrt(3) * std
+
+        last = (None, None)  # (block index, samples of the whole block)
+
+        def kernel(start, stop, out):
+            nonlocal last
+            position = start
+            while position < stop:
+                block, offset = divmod(position, self.BLOCK_SIZE)
+                end = min(stop, position - offset + self.BLOCK_SIZE)
+                if offset:
+                    cached_block, samples = last
+                    if cached_block != block or samples.dtype != out.dtype:
+                        last = samples = None  # release the previous block first
+                        samples = np.empty(self.BLOCK_SIZE, dtype=out.dtype)
+                        draw(block, samples)
+                        last = (block, samples)
+                    out[position - start:end - start] = samples[offset:offset + end - position]
+                else:
+                    draw(block, out[position - start:end - start])
+                position = end
+        return kernel
+
+    def shaped(self, num_samples, gain, variance=1.0, sampling_freq=7.2e9, max_workers=None, dtype=None):
+        """
+        Noise with power spectral density proportional to gain(f)^2, built in the frequency domain: a seeded
+        complex Gaussian spectrum scaled by gain(f) and one inverse real FFT. The record is periodic, so it
+        loops without a seam. gain is a callable on the rfft frequency axis (Hz).
+        """
+        num_samples = int(num_samples)
+        num_bins = num_samples // 2 + 1
+        spectrum = self.white(2 * num_bins, 0.5, max_workers=max_workers).view(np.complex128)
+        spectrum *= np.asarray(gain(sp_fft.rfftfreq(num_samples, 1 / sampling_freq)), dtype=np.float64)
+        spectrum[0] = 0  # zero mean
+        if num_samples % 2 == 0:
+            spectrum[-1] = spectrum[-1].real
+
+        wave = sp_fft.irfft(spectrum, n=num_samples, workers=max_workers or -1)
+        power = np.mean(wave ** 2)
+        if power > 0:
+            wave *= np.sqrt(float(variance) / power)
+        return wave.astype(resolve_dtype(dtype) or np.float64, copy=False)
+
+    def band_limited(self, num_samples, low_freq, high_freq, variance=1.0, sampling_freq=7.2e9, max_workers=None, dtype=None):
+        """Flat noise confined to [low_freq, high_freq] Hz."""
+        def gain(f):
+            return ((f >= low_freq) & (f <= high_freq)).astype(np.float64)
+        return self.shaped(num_samples, gain, variance, sampling_freq, max_workers, dtype)
+
+    def colored(self, num_samples, exponent=1.0, variance=1.0, low_freq=None, high_freq=None, sampling_freq=7.2e9,
+                max_workers=None, dtype=None):
+        """
+        Power-law noise with PSD ~ 1/f^exponent (1 pink, 2 brown, -1 blue, -2 violet), optionally band-limited.
+        """
+        first_bin = sampling_freq / int(num_samples)
+
+        def gain(f):
+            g = np.zeros_like(f)
+            band = f > 0
+            if low_freq is not None:
+                band &= f >= low_freq
+            if high_freq is not None:
+                band &= f <= high_freq
+            g[band] = (np.maximum(f[band], first_bin) / first_bin) ** (-exponent / 2)
+            return g
+        return self.shaped(num_samples, gain, variance, sampling_freq, max_workers, dtype)
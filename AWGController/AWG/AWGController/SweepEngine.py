@@ -0,0 +1,144 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from config_loader import load_config
+from WaveformGenerator import WaveformGenerator
+from CombinedWaveformGenerator import CombinedWaveformGenerator
+
+
+CONFIG = load_config()
+
+GENERATORS = {
+    "single": lambda: WaveformGenerator(ip_address='1.00.0'),
+    "combined": CombinedWaveformGenerator,
+}
+
+# Per-process state of a pool worker: the attached shared output buffer and one generator instance
+_worker = {}
+
+
+def _init_worker(shm_name, shape, dtype, generator_name):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker["shm"] = shm
+    _worker["buffer"] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _worker["generator"] = GENERATORS[generator_name]()
+
+
+def _generate_point(index, method, kwargs):
+    """Generate one sweep point straight into its row of the shared buffer; only the length goes back."""
+    wave = getattr(_worker["generator"], method)(**kwargs).samples
+    row = _worker["buffer"][index]
+    if len(wave) > len(row):
+        raise ValueError(f"point {index}: {len(wave)} samples do not fit in a {len(row)}-sample slot")
+    row[:len(wave)] = wave
+    return index, len(wave)
+
+
+class SweepResult:
+    """Shared-memory backed (points x num_samples) sweep output. Close it once the data has been consumed."""
+
+    def __init__(self, points, num_samples, dtype):
+        self.points = points
+        itemsize = np.dtype(dtype).itemsize
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, len(points) * num_samples * itemsize))
+        self.buffer = np.ndarray((len(points), num_samples), dtype=dtype, buffer=self._shm.buf)
+        self.lengths = np.zeros(len(points), dtype=int)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def wave(self, index):
+        return self.buffer[index, :self.lengths[index]]
+
+    @property
+    def waves(self):
+        return [self.wave(i) for i in range(len(self.points))]
+
+    def close(self):
+        if self._shm is None:
+            return
+        self.buffer = None
+        self._shm.unlink()
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # waves handed out are still referenced; the mapping goes away with them
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ParallelSweepEngine:
+    """Fans sweep points out across a process pool; workers write into one shared-memory buffer."""
+
+    def __init__(self, max_workers=None, generator="combined", dtype=np.float64):
+        if generator not in GENERATORS:
+            raise ValueError(f"Unknown generator '{generator}', expected one of {list(GENERATORS)}")
+        if max_workers is None:
+            max_workers = CONFIG.get("sweep", {}).get("max_workers") or os.cpu_count() or 1
+        self.max_workers = int(max_workers)
+        self.generator = generator
+        self.dtype = np.dtype(dtype)
+
+    def iter_sweep(self, method, points, num_samples, result=None):
+        """
+        Generate every point of a sweep and yield (index, params, wave) as each one finishes, so saving
+        or uploading a finished point overlaps with generation of the rest.
+
+        points: list of keyword dicts, one per sweep point, for `method` of the selected generator.
+        num_samples: samples per point. Combined generator methods receive it as their num_samples
+        argument; for the single generator it is the slot capacity and the actual length is kept.
+        Yielded waves are views into shared memory that is released when the iteration ends;
+        copy them (or pass a SweepResult) to keep them.
+        """
+        points = [dict(p) for p in points]
+        for index, _, wave in self.iter_calls([(method, p) for p in points], num_samples, result):
+            yield index, points[index], wave
+
+    def iter_calls(self, calls, num_samples, result=None):
+        """
+        iter_sweep over (method, kwargs) pairs, so one pool generates points of different methods (e.g. the
+        components of a combined waveform). Yields (index, (method, kwargs), wave) as each call finishes.
+        """
+        calls = [(method, dict(kwargs)) for method, kwargs in calls]
+        points = [kwargs for _, kwargs in calls]
+        own_result = result is None
+        if own_result:
+            result = SweepResult(points, int(num_samples), self.dtype)
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                     initargs=(result.name, result.buffer.shape, self.dtype, self.generator)) as pool:
+                futures = []
+                for index, (method, params) in enumerate(calls):
+                    kwargs = dict(params)
+                    if self.generator == "combined":
+                        kwargs["num_samples"] = int(num_samples)
+                    futures.append(pool.submit(_generate_point, index, method, kwargs))
+
+                for future in as_completed(futures):
+                    index, length = future.result()
+                    result.lengths[index] = length
+                    yield index, calls[index], result.wave(index)
+        finally:
+            if own_result:
+                result.close()
+
+    def run_sweep(self, method, points, num_samples):
+        """Generate a whole sweep and return the SweepResult (caller closes it)."""
+        result = SweepResult([dict(p) for p in points], int(num_samples), self.dtype)
+        try:
+            for _ in self.iter_sweep(method, result.points, num_samples, result=result):
+                pass
+        except Exception:
+            result.close()
+            raise
+        return result
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class Waveform:
+    """
+    Generated samples plus the sample clock that produced them (sample_rate in Hz, start_time in s).
+    The time axis is never stored; time() builds it on request, for any slice and with decimation.
+    samples may be 2-D (points x samples) for batched sweeps; iterating then yields one Waveform per row.
+    """
+
+    def __init__(self, samples, sample_rate, start_time=0.0):
+        self.samples = samples
+        self.sample_rate = float(sample_rate)
+        self.start_time = float(start_time)
+
+    @property
+    def num_samples(self):
+        return self.samples.shape[-1]
+
+    @property
+    def duration(self):
+        return self.num_samples / self.sample_rate
+
+    @property
+    def dtype(self):
+        return self.samples.dtype
+
+    def time(self, start=0, stop=None, step=1):
+        """Time axis in seconds for samples[start:stop:step]."""
+        start, stop, step = slice(start, stop, step).indices(self.num_samples)
+        return self.start_time + np.arange(start, stop, step) / self.sample_rate
+
+    def decimated(self, max_points=20000):
+        """(time, samples) with at most max_points samples along the time axis, for plotting."""
+        step = max(1, int(np.ceil(self.num_samples / max_points)))
+        return self.time(step=step), self.samples[..., ::step]
+
+    def iter_chunks(self, chunk_size):
+        """Yield (start, samples chunk) pairs; samples[..., start:start + chunk_size] is a view."""
+        chunk_size = int(chunk_size)
+        for start in range(0, self.num_samples, chunk_size):
+            yield start, self.samples[..., start:start + chunk_size]
+
+    def with_samples(self, samples):
+        """Same sample clock, new samples (e.g. after scaling or a dtype change)."""
+        return Waveform(samples, self.sample_rate, self.start_time)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __iter__(self):
+        if self.samples.ndim == 1:
+            return iter(self.samples)
+        return (self.with_samples(row) for row in self.samples)
+
+    def __getitem__(self, index):
+        if self.samples.ndim == 1:
+            return self.samples[index]
+        rows = self.samples[index]
+        return self.with_samples(rows) if rows.ndim >= 1 else rows
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.samples
+        return self.samples.astype(dtype, copy=False)
+
+    def __repr__(self):
+        return (f"Waveform(shape={self.samples.shape}, dtype={self.samples.dtype}, "
+                f"sample_rate={self.sample_rate:g}, start_time={self.start_time:g})")
@@ -0,0 +1,123 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from CombinedWaveformGenerator import CombinedWaveformGenerator
+from Waveform import Waveform
+from waveform_cache import CachedGenerator
+
+
+class WaveformComposer:
+    """
+    Incrementally maintained sum of CombinedWaveformGenerator components. Each slot holds one component,
+    identified by (method, parameters, num_samples); setting a slot to new parameters generates only that
+    component and updates the running sum by subtracting the old samples and adding the new ones.
+    Components no longer in a slot are kept in an LRU of up to max_bytes, so switching a slot back to earlier
+    parameters costs no generation at all. When the generator is a CachedGenerator the shared WaveformCache
+    already keeps them, so by default only the live components are held here.
+    """
+
+    def __init__(self, num_samples, sampling_frequency=7.2, generator=None, max_bytes=None, rebuild_every=64):
+        self.num_samples = int(num_samples)
+        self.sampling_frequency = float(sampling_frequency)
+        self.generator = generator or CombinedWaveformGenerator()
+        if max_bytes is None:
+            max_bytes = 0 if isinstance(self.generator, CachedGenerator) else 256 << 20
+        self.max_bytes = int(max_bytes)
+        self.rebuild_every = int(rebuild_every)
+        self.cache = OrderedDict()   # key -> samples
+        self.slots = {}              # slot -> key
+        self.total = np.zeros(self.num_samples)
+        self.generated = 0           # components actually generated (cache misses)
+        self._updates = 0
+
+    def key(self, method, params):
+        return (method, tuple(sorted(params.items())), self.num_samples)
+
+    def _component(self, key, options):
+        samples = self.cache.get(key)
+        if samples is None:
+            method, params, num_samples = key
+            samples = getattr(self.generator, method)(num_samples=num_samples, **dict(params), **options).samples
+            self.generated += 1
+            self.cache[key] = samples
+        self.cache.move_to_end(key)
+        return samples
+
+    def needs(self, method, params):
+        """Whether set(slot, method, params) would have to generate the component."""
+        key = self.key(method, params)
+        if key in self.cache:
+            return False
+        if isinstance(self.generator, CachedGenerator):
+            return not self.generator.contains(method, num_samples=self.num_samples, **params)
+        return True
+
+    def provide(self, method, params, samples):
+        """Add a component generated elsewhere (e.g. on the sweep engine's process pool); samples are copied."""
+        key = self.key(method, params)
+        wave = Waveform(np.array(samples, dtype=np.float64), self.sampling_frequency * 1e9)
+        if isinstance(self.generator, CachedGenerator):
+            wave = self.generator.store(method, wave, num_samples=self.num_samples, **params)
+        self.cache[key] = wave.samples
+        self.generated += 1
+
+    def _evict(self):
+        """Drop least recently used components until those not in the sum fit in max_bytes."""
+        live = set(self.slots.values())
+        spare = sum(samples.nbytes for key, samples in self.cache.items() if key not in live)
+        for key in list(self.cache):
+            if spare <= self.max_bytes:
+                break
+            if key not in live:
+                spare -= self.cache.pop(key).nbytes
+
+    def set(self, slot, method, params, **options):
+        """
+        Put method(**params) (a CombinedWaveformGenerator method) in slot. options (e.g. chunk_size, max_workers)
+        are passed through but are not part of the cache key. Returns True when the sum changed.
+        """
+        key = self.key(method, params)
+        old = self.slots.get(slot)
+        if old == key:
+            return False
+        new_samples = self._component(key, options)
+        if old is not None:
+            self.total -= self.cache[old]
+        self.total += new_samples
+        self.slots[slot] = key
+        self._evict()
+        self._touch()
+        return True
+
+    def remove(self, slot):
+        """Take slot out of the sum (its samples stay cached). Returns True when the sum changed."""
+        old = self.slots.pop(slot, None)
+        if old is None:
+            return False
+        self.total -= self.cache[old]
+        self._evict()
+        self._touch()
+        return True
+
+    def retain(self, slots):
+        """Remove every slot not in slots."""
+        for slot in [s for s in self.slots if s not in slots]:
+            self.remove(slot)
+
+    def _touch(self):
+        # add / subtract round-off accumulates; re-add the live components from time to time
+        self._updates += 1
+        if self._updates >= self.rebuild_every:
+            self.rebuild()
+
+    def rebuild(self):
+        self.total[:] = 0
+        for key in self.slots.values():
+            self.total += self.cache[key]
+        self._updates = 0
+
+    @property
+    def waveform(self):
+        """The current sum (a copy) as a Waveform."""
+        return Waveform(self.total.copy(), self.sampling_frequency * 1e9)
@@ -1,46 +1,168 @@
 import numpy as np
 from scipy import signal
-from pyfinite import ffield
 from logger import awg_logger
+from chunked_synthesis import synthesize_chunked, lfm_chunk_kernel
+from dac_codes import as_output_dtype, resolve_dtype
+from Waveform import Waveform
+from stepped_frequency import stepped_frequency_tone, step_frequencies
+from record_planner import RecordLengthPlanner, coherent_tone
+from NoiseGenerator import NoiseGenerator
+from nco import NCO
+from pulse_shaping import oversampling_ratio, pulse_taps, shape_symbols, symbols_per_whole_record, bt_for_rise_time
+from multitone import (coherent_length, tone_bins, initial_phases, synthesize_multitone,
+                       optimize_crest_factor)
+from lfsr import lfsr_sequence, primitive_taps, random_state
+from code_families import family_codes
+from config_loader import load_config
+
+CONFIG = load_config()
 
 # Create a class to generate waveforms
 
 class WaveformGenerator:
+    # part of every waveform_cache key: bump when a change alters the samples a call produces
+    CACHE_VERSION = 3
+
     def __init__(self, ip_address):
         #self.pulse_width = None
         self.logger = awg_logger()
         if self.logger._log_file_path is None:
                 self.log._initialize_log_file(f"awg_{ip_address}")
 
+    # Every generator returns a Waveform (samples + sample clock; the time axis is built lazily by .time()).
+    # dtype selects the sample type (None keeps float64, or e.g. "float32"); use dac_codes.DACEncoder
+    # to go on to int16 DAC words.
+    # coherent=True sizes the record with a RecordLengthPlanner (planner, or one built from config.json): the
+    # shortest segment-aligned length holding an integer number of cycles, so the instrument can loop it.
+    # engine="nco" synthesizes tones and chirps with the integer phase-accumulator NCO (see nco.py) configured
+    # by the "nco" section of config.json; None takes synthesis.engine from config.json ("float" by default).
+
+    def nco(self, sampling_frequency):
+        nco_config = CONFIG.get("nco", {})
+        return NCO(sampling_frequency, nco_config.get("table_bits", 16), nco_config.get("interpolate", False),
+                   nco_config.get("dither", False), nco_config.get("seed"))
+
+    def _use_nco(self, engine):
+        engine = engine or CONFIG.get("synthesis", {}).get("engine", "float")
+        if engine not in ("float", "nco"):
+            raise ValueError(f"Unknown synthesis engine '{engine}'")
+        return engine == "nco"
+
     # Sinusoidal wave
-    def sinusoidal(self, frequency, amplitude = 1, sampling_frequency=7.2):
+    def sinusoidal(self, frequency, amplitude = 1, sampling_frequency=7.2, dtype=None, coherent=False, planner=None, engine=None):
         amplitude = float(amplitude)
         frequency = float(frequency) * 1e9  # user gives frequency in GHz
         sampling_frequency = float(sampling_frequency) * 1e9  # user gives sampling frequency in GHz
         period = 1 / frequency
-        oversample = int(period * sampling_frequency)
-        time = np.arange(0, period, 1 / sampling_frequency)
-        wave = (amplitude / 2) * np.sin(2 * np.pi * frequency * time)
+        if self._use_nco(engine):
+            if coherent:
+                plan = (planner or RecordLengthPlanner()).plan_tone(frequency, sampling_frequency)
+                frequency, num_samples = plan.frequency, plan.num_samples
+            else:
+                num_samples = int(np.ceil(period * sampling_frequency))  # len(np.arange(0, period, 1/fs))
+            # sin = cos delayed by a quarter cycle
+            wave = self.nco(sampling_frequency).tone(frequency, num_samples, amplitude / 2, phase=-np.pi / 2)
+        elif coherent:
+            plan = (planner or RecordLengthPlanner()).plan_tone(frequency, sampling_frequency)
+            wave = coherent_tone(plan.cycles, plan.num_samples, amplitude / 2)
+        else:
+            time = np.arange(0, period, 1 / sampling_frequency)
+            wave = (amplitude / 2) * np.sin(2 * np.pi * frequency * time)
 
         self.logger._log_command(command="generate sine wave", duration_ms=None, response = "Successfully generated")
-        print(f"num samples: {len(wave)}, over sample {oversample}")
 
-        return  time, wave
+        return Waveform(as_output_dtype(wave, dtype), sampling_frequency)
+
+    # Batched sinusoidal sweep: one waveform per frequency, all evaluated in one broadcast over a shared time base.
+    # Returns one Waveform with 2-D samples (points x samples) when every period has the same sample count,
+    # otherwise a list of Waveforms whose samples are rows of that block cut to each frequency's own length.
+    def sinusoidal_batch(self, frequencies, amplitude = 1, sampling_frequency=7.2, dtype=None, coherent=False, planner=None):
+        amplitude = float(amplitude)
+        frequencies = np.atleast_1d(np.asarray(frequencies, dtype=float)) * 1e9  # user gives frequency in GHz
+        sampling_frequency = float(sampling_frequency) * 1e9  # user gives sampling frequency in GHz
+        step = 1 / sampling_frequency
+
+        if coherent:
+            planner = planner or RecordLengthPlanner()
+            plans = [planner.plan_tone(f, sampling_frequency) for f in frequencies]
+            lengths = np.array([p.num_samples for p in plans])
+            cycles = np.array([p.cycles for p in plans], dtype=np.int64)
+            n = np.arange(lengths.max(), dtype=np.int64)
+            phase = (cycles[:, None] * n[None, :]) % lengths[:, None]  # exact integer phase, loops seamlessly
+            waves = as_output_dtype((amplitude / 2) * np.sin((2 * np.pi / lengths)[:, None] * phase), dtype)
+        else:
+            lengths = np.ceil((1 / frequencies) / step).astype(int)  # same count as np.arange(0, period, 1/fs)
+            time = np.arange(lengths.max()) * step
+            waves = as_output_dtype((amplitude / 2) * np.sin((2 * np.pi * frequencies)[:, None] * time[None, :]), dtype)
+
+        self.logger._log_command(command=f"generate sine wave batch ({len(frequencies)} points)", duration_ms=None, response = "Successfully generated")
+
+        if np.all(lengths == lengths[0]):
+            return Waveform(waves, sampling_frequency)
+        return [Waveform(row[:n], sampling_frequency) for row, n in zip(waves, lengths)]
+
+    # Multitone stimulus: tones (GHz) snapped to the FFT bins of a coherent record and synthesized by one inverse FFT.
+    # num_samples=None picks the shortest planner-aligned record where every tone is coherent.
+    # phases: "schroeder" | "newman" | "random" | "zero" | array; crest_iterations > 0 refines them iteratively.
+    # The result is scaled to a peak of amplitude / 2, like sinusoidal().
+    def multitone(self, frequencies, amplitude = 1, tone_amplitudes=None, num_samples=None, phases="schroeder",
+                  crest_iterations=0, sampling_frequency=7.2, seed=None, dtype=None, planner=None):
+        frequencies = np.atleast_1d(np.asarray(frequencies, dtype=float)) * 1e9  # user gives frequency in GHz
+        sampling_frequency = float(sampling_frequency) * 1e9  # user gives sampling frequency in GHz
+        if num_samples is None:
+            num_samples = coherent_length(frequencies, sampling_frequency, planner or RecordLengthPlanner())
+        num_samples = int(num_samples)
+
+        bins = tone_bins(frequencies, num_samples, sampling_frequency)
+        if tone_amplitudes is None:
+            tone_amplitudes = np.ones(len(bins))
+        tone_phases = initial_phases(phases, len(bins), seed)
+
+        if crest_iterations:
+            tone_phases, wave = optimize_crest_factor(bins, num_samples, tone_amplitudes, tone_phases, crest_iterations)
+        else:
+            wave = synthesize_multitone(bins, num_samples, tone_amplitudes, tone_phases)
+        wave *= (float(amplitude) / 2) / np.max(np.abs(wave))
+
+        self.logger._log_command(command=f"generate multitone wave ({len(bins)} tones)", duration_ms=None, response = "Successfully generated")
+
+        return Waveform(as_output_dtype(wave, dtype), sampling_frequency)
 
     def get_taps(self, order):
-        F = ffield.FField(order)
-        taps = [i for i, bit in enumerate(reversed(F.ShowCoefficients(F.generator))) if bit == 1]
-        print("taps: ", taps)
-        return taps[:-1]  # remove x^0 term which is always 1 in primitive polynomials
+        taps = primitive_taps(order)
+        return taps
+
+    # Bits go through the symbol-to-sample stage in pulse_shaping.py: fs / repetition_rate may be any rational
+    # up / down (no rounding of the oversampling factor, so the bit rate is exact to config prbs.max_denominator)
+    # and pulse_shape selects "rect" (hard edges; np.repeat for an integer ratio), "raised_cosine" (rolloff),
+    # "root_raised_cosine" or "gaussian" (edge set by rise_time, ns). None takes config prbs.pulse_shape.
+    # The bit pattern is shaped as one period of a repeating sequence, so the record loops without a glitch.
+    def _shape_bits(self, bits, sampling_frequency, repetition_rate, pulse_shape, rolloff, rise_time, coherent, planner):
+        prbs_config = CONFIG.get("prbs", {})
+        pulse_shape = pulse_shape or prbs_config.get("pulse_shape", "rect")
+        rolloff = prbs_config.get("rolloff", 0.35) if rolloff is None else float(rolloff)
+        up, down = oversampling_ratio(sampling_frequency, repetition_rate, prbs_config.get("max_denominator", 1000))
+        bt = bt_for_rise_time(float(rise_time) * 1e-9, repetition_rate) if rise_time else 0.5
+        taps, delay = pulse_taps(pulse_shape, up, rolloff=rolloff, bt=bt)
 
-    def PRBS(self, amplitude, order, repetition_rate, sampling_frequency=7.2, max_bits=None):
+        repeats = 1
+        if coherent:
+            # whole bit periods that also span a whole number of samples, tiled up to a legal segment
+            repeats = symbols_per_whole_record(len(bits), up, down)
+        waveform = shape_symbols(np.tile(bits, repeats), up, down, taps, delay)
+        if coherent:
+            waveform = np.tile(waveform, (planner or RecordLengthPlanner()).plan_repeats(len(waveform)))
+        return waveform, up / down
+
+    # seed (int) reproduces the random LFSR start state; None draws a fresh one (and the call is never cached)
+    def PRBS(self, amplitude, order, repetition_rate, sampling_frequency=7.2, max_bits=None, dtype=None, coherent=False, planner=None,
+             pulse_shape=None, rolloff=None, rise_time=None, seed=None):
         amplitude = float(amplitude)
         order = int(order)
         taps = self.get_taps(order)
         sampling_frequency = float(sampling_frequency) * 1e9
         repetition_rate = float(repetition_rate) * 1e6
 
-        oversample = round(sampling_frequency / repetition_rate)
         max_length = (2 ** order) - 1
 
         if max_bits is not None:
@@ -48,33 +170,69 @@ class WaveformGenerator:
         else:
             length = max_length
 
-        while True:
-            seed = np.random.randint(0, 2, size=order).tolist()
-            if any(seed):
-                break
-
-        state = seed.copy()
-        bits = []
-        for _ in range(length):
-            feedback = 0
-            for t in taps:
-                feedback ^= state[t]
-            bits.append(state[-1])
-            state = [feedback] + state[:-1]
-
-        bits = np.array(bits)
-        print(f"[DEBUG] order={order}, length={length}, oversample={oversample}, total_samples={length * oversample}")
-        print("Bits:", bits[:50])
-        print("Unique bit values:", np.unique(bits))
-
-        waveform = np.repeat(bits, oversample)
-        time = np.arange(len(waveform)) / sampling_frequency
+        bits = lfsr_sequence(random_state(order, seed), taps, length)
+        waveform, _ = self._shape_bits(bits, sampling_frequency, repetition_rate, pulse_shape, rolloff, rise_time,
+                                       coherent, planner)
+
         self.logger._log_command(command="generate PRBS wave", duration_ms=None, response = "Successfully generated")
 
-        return time, waveform
+        return Waveform(as_output_dtype(waveform, dtype), sampling_frequency)
     
 
-    def generate_lfm(self, center_freq, bandwidth, pulse_width, sampling_freq = 7.2):
+    # Batched PRBS sweep over LFSR orders. Each order has its own sequence length (2^order - 1 bits),
+    # so the result is always a list of Waveforms. seed (int) reproduces the random start states, as in PRBS.
+    def PRBS_batch(self, amplitude, orders, repetition_rate, sampling_frequency=7.2, max_bits=None, dtype=None, coherent=False, planner=None,
+                   pulse_shape=None, rolloff=None, rise_time=None, seed=None):
+        orders = [int(order) for order in np.atleast_1d(orders)]
+        sampling_frequency = float(sampling_frequency) * 1e9
+        repetition_rate = float(repetition_rate) * 1e6
+
+        if coherent:
+            planner = planner or RecordLengthPlanner()
+
+        waves = []
+        for order in orders:
+            taps = self.get_taps(order)
+            length = (2 ** order) - 1
+            if max_bits is not None:
+                length = min(length, int(max_bits))
+
+            wave, _ = self._shape_bits(lfsr_sequence(random_state(order, seed), taps, length), sampling_frequency, repetition_rate,
+                                       pulse_shape, rolloff, rise_time, coherent, planner)
+            waves.append(Waveform(as_output_dtype(wave, dtype), sampling_frequency))
+
+        self.logger._log_command(command=f"generate PRBS wave batch ({len(orders)} points)", duration_ms=None, response = "Successfully generated")
+
+        return waves
+
+    # Low-cross-correlation code family for multi-channel stimuli (see code_families.py): family "gold"
+    # (2^order + 1 codes, order not a multiple of 4) or "kasami" (2^(order/2) codes, even order), one period each
+    # of 2^order - 1 chips at repetition_rate (MHz), shaped like PRBS. members picks codes by index (all by default).
+    def code_family(self, family, order, repetition_rate, members=None, amplitude=1, sampling_frequency=7.2, seed=1, dtype=None,
+                    coherent=False, planner=None, pulse_shape=None, rolloff=None, rise_time=None):
+        codes = family_codes(family, int(order), seed)
+        if members is not None:
+            codes = codes[np.atleast_1d(members)]
+        sampling_frequency = float(sampling_frequency) * 1e9
+        repetition_rate = float(repetition_rate) * 1e6
+
+        if coherent:
+            planner = planner or RecordLengthPlanner()
+
+        waves = []
+        for bits in codes:
+            wave, oversample = self._shape_bits(bits, sampling_frequency, repetition_rate, pulse_shape, rolloff, rise_time,
+                                                coherent, planner)
+            waves.append(Waveform(as_output_dtype(float(amplitude) * wave, dtype), sampling_frequency))
+
+        self.logger._log_command(command=f"generate {family} code family (order {order}, {len(waves)} codes)", duration_ms=None, response = "Successfully generated")
+        return waves
+
+    # chunk_size (samples) switches to chunked synthesis: the chirp is written chunk by chunk, phase-continuous,
+    # into one preallocated buffer by a thread pool of max_workers, instead of through full-length temporaries.
+    # With pad=True the pulse (pulse_width and chirp rate as requested) is zero-padded to the next legal segment length.
+    def generate_lfm(self, center_freq, bandwidth, pulse_width, sampling_freq = 7.2, chunk_size=None, max_workers=None, dtype=None,
+                     pad=False, planner=None, engine=None):
         
         self.sampling_freq = float(sampling_freq) * 1e9  # GHz to Hz
         self.center_freq = float(center_freq) * 1e9  # GHz to Hz
@@ -86,39 +244,114 @@ class WaveformGenerator:
         self.f0 = float(self.center_freq - self.bandwidth / 2)
         self.f1 = float(self.center_freq + self.bandwidth / 2)
 
-        t = np.arange(0, self.pulse_width, 1 / self.sampling_freq)
-        waveform = np.cos(2*np.pi * ((self.f0 * t) + (self.k/2) * (t ** 2)))   #signal.chirp(t, f0=self.f0, f1=self.f1, t1=self.pulse_width, method='linear') 
+        if self._use_nco(engine):
+            num_samples = int(np.ceil(self.pulse_width / (1 / self.sampling_freq)))
+            waveform = self.nco(self.sampling_freq).chirp(self.f0, self.k, num_samples, max_workers=max_workers,
+                                                          dtype=resolve_dtype(dtype) or np.float64)
+        elif chunk_size:
+            num_samples = int(np.ceil(self.pulse_width / (1 / self.sampling_freq)))  # len(np.arange(0, pulse_width, 1/fs))
+            waveform = synthesize_chunked(lfm_chunk_kernel(self.f0, self.k, self.sampling_freq), num_samples, chunk_size, max_workers,
+                                          dtype=resolve_dtype(dtype) or np.float64)
+        else:
+            t = np.arange(0, self.pulse_width, 1 / self.sampling_freq)
+            waveform = np.cos(2*np.pi * ((self.f0 * t) + (self.k/2) * (t ** 2)))   #signal.chirp(t, f0=self.f0, f1=self.f1, t1=self.pulse_width, method='linear') 
+            waveform = as_output_dtype(waveform, dtype)
+
+        if pad:
+            waveform = self._pad_to_segment(waveform, planner)
+        return Waveform(waveform, self.sampling_freq)
 
-        return t, waveform
+    @staticmethod
+    def _pad_to_segment(waveform, planner=None):
+        """Zeros appended along the last axis up to the next legal segment length."""
+        extra = (planner or RecordLengthPlanner()).align(waveform.shape[-1]) - waveform.shape[-1]
+        return np.pad(waveform, [(0, 0)] * (waveform.ndim - 1) + [(0, extra)]) if extra else waveform
     
-    def generate_steplfm(self, start_freq, stop_freq, step_freq, dwell_time, sampling_freq=7.2):
-        t_total = []
-        waveform = []
+    # Batched LFM sweep over center frequencies. The pulse width is shared, so every chirp has the same
+    # length and the result is one Waveform with 2-D samples (points x samples). The quadratic chirp term is computed once.
+    # pad=True zero-pads the block to the next legal segment length, as in generate_lfm.
+    def generate_lfm_batch(self, center_freqs, bandwidth, pulse_width, sampling_freq = 7.2, dtype=None, pad=False, planner=None):
+        sampling_freq = float(sampling_freq) * 1e9  # GHz to Hz
+        center_freqs = np.atleast_1d(np.asarray(center_freqs, dtype=float)) * 1e9  # GHz to Hz
+        pulse_width = pulse_width * 1e-9
+        bandwidth = float(bandwidth * 1e9)
+
+        k = bandwidth / pulse_width
+
+        f0 = center_freqs - bandwidth / 2
+
+        t = np.arange(0, pulse_width, 1 / sampling_freq)
+        chirp_phase = (k / 2) * (t ** 2)
+        waveforms = np.cos(2 * np.pi * (f0[:, None] * t[None, :] + chirp_phase[None, :]))
+        waveforms = as_output_dtype(waveforms, dtype)
+        if pad:
+            waveforms = self._pad_to_segment(waveforms, planner)
+        self.logger._log_command(command=f"generate LFM wave batch ({len(center_freqs)} points)", duration_ms=None, response = "Successfully generated")
+
+        return Waveform(waveforms, sampling_freq)
+
+    # Stepped-frequency tone: start_freq to stop_freq in step_freq increments (GHz), each held for dwell_time (ns).
+    # Phase-continuous across steps and built in one vectorized pass (see stepped_frequency).
+    def generate_steplfm(self, start_freq, stop_freq, step_freq, dwell_time, sampling_freq=7.2, amplitude=1, dtype=None):
         sampling_freq = float(sampling_freq) * 1e9  # GHz to Hz
         start_freq = float(start_freq) * 1e9  # GHz to Hz
         stop_freq = float(stop_freq) * 1e9  # GHz to Hz
         step_freq = float(step_freq) * 1e9 # GHz to Hz 
         dwell_time = float(dwell_time) * 1e-9 # convert ns to seconds
 
-        current_freq = start_freq
-        time_offset = 0
-
-        while current_freq <= stop_freq:
-            t = np.arange(0, dwell_time, 1/sampling_freq)
-            level = (current_freq - start_freq) / step_freq + 1
-            wave = np.full_like(t, fill_value=level)
-            t_total.append(t + time_offset)
-            waveform.append(wave)
-            time_offset += dwell_time
-            current_freq += step_freq
+        frequencies = step_frequencies(start_freq, stop_freq, step_freq)
+        samples_per_step = int(np.ceil(dwell_time / (1 / sampling_freq)))  # len(np.arange(0, dwell_time, 1/fs))
+        counts = np.full(len(frequencies), samples_per_step)
 
-        t_total = np.concatenate(t_total)
-        waveform = np.concatenate(waveform)
+        waveform = stepped_frequency_tone(frequencies, counts, sampling_freq, amplitude=float(amplitude) / 2)
         self.logger._log_command(command="generate step LFM wave", duration_ms=None, response = "Successfully generated")
 
-        return t_total, waveform
+        return Waveform(as_output_dtype(waveform, dtype), sampling_freq)
 
-            
+    # Noise of the given variance (V^2) over num_samples samples (default from config.json "noise").
+    # kind: "white" (distribution "gaussian" or "uniform"), "band" (flat between low_freq and high_freq, GHz)
+    # or "colored" (PSD ~ 1/f^exponent: 1 pink, 2 brown, -1 blue). Shaped noise is built in the frequency
+    # domain and loops seamlessly. seed=None draws fresh entropy; it is logged so the record can be reproduced.
+    def noise(self, variance, num_samples=None, kind="white", distribution="gaussian", low_freq=None, high_freq=None,
+              exponent=1.0, sampling_frequency=7.2, seed=None, max_workers=None, dtype=None):
+        noise_config = CONFIG.get("noise", {})
+        num_samples = int(num_samples or noise_config.get("num_samples", 7200))
+        sampling_frequency = float(sampling_frequency) * 1e9  # user gives sampling frequency in GHz
+        to_hz = lambda f: None if f is None else float(f) * 1e9
+        if seed is None:
+            seed = noise_config.get("seed")
+        engine = NoiseGenerator(seed, noise_config.get("bit_generator", "PCG64"))
 
+        if kind == "white":
+            wave = engine.white(num_samples, variance, distribution, max_workers=max_workers, dtype=dtype)
+        elif kind == "band":
+            wave = engine.band_limited(num_samples, to_hz(low_freq) or 0.0, to_hz(high_freq) or sampling_frequency / 2,
+                                       variance, sampling_frequency, max_workers, dtype)
+        elif kind == "colored":
+            wave = engine.colored(num_samples, exponent, variance, to_hz(low_freq), to_hz(high_freq),
+                                  sampling_frequency, max_workers, dtype)
+        else:
+            raise ValueError(f"Unknown noise kind '{kind}'")
+
+        self.logger._log_command(command=f"generate {kind} noise (seed {engine.seed})", duration_ms=None, response = "Successfully generated")
+        return Waveform(wave, sampling_frequency)
+
+    # Frequency or phase modulated carrier on the NCO. message is a per-sample array scaled to [-1, 1]:
+    # kind="fm" deviates the carrier by deviation * message (deviation in GHz), kind="pm" shifts its phase by
+    # deviation * message (deviation in radians). The record is as long as message.
+    def modulated(self, carrier_freq, message, kind="fm", deviation=0.1, amplitude=1, sampling_frequency=7.2, dtype=None):
+        carrier_freq = float(carrier_freq) * 1e9  # user gives frequency in GHz
+        sampling_frequency = float(sampling_frequency) * 1e9  # user gives sampling frequency in GHz
+        message = np.asarray(message, dtype=np.float64)
+        nco = self.nco(sampling_frequency)
+        dtype = resolve_dtype(dtype) or np.float64
+
+        if kind == "fm":
+            wave = nco.fm(carrier_freq, float(deviation) * 1e9 * message, float(amplitude) / 2, dtype=dtype)
+        elif kind == "pm":
+            wave = nco.pm(carrier_freq, float(deviation) * message, float(amplitude) / 2, dtype=dtype)
+        else:
+            raise ValueError(f"Unknown modulation '{kind}'")
 
-    
\ No newline at end of file
+        self.logger._log_command(command=f"generate {kind.upper()} wave", duration_ms=None, response = "Successfully generated")
+        return Waveform(wave, sampling_frequency)
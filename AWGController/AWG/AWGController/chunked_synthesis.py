@@ -0,0 +1,64 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+# Fill a preallocated output buffer chunk by chunk in a thread pool (numpy ufuncs release the GIL).
+# kernel(start, stop, out) writes samples [start, stop) of the waveform into out.
+def synthesize_chunked(kernel, num_samples, chunk_size, max_workers=None, dtype=np.float64, out=None):
+    num_samples = int(num_samples)
+    chunk_size = max(1, int(chunk_size))
+    if out is None:
+        out = np.empty(num_samples, dtype=dtype)
+
+    bounds = [(start, min(start + chunk_size, num_samples)) for start in range(0, num_samples, chunk_size)]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    if max_workers == 1 or len(bounds) <= 1:
+        for start, stop in bounds:
+            kernel(start, stop, out[start:stop])
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(lambda b: kernel(b[0], b[1], out[b[0]:b[1]]), bounds))
+
+    return out
+
+
+# Chunk kernels. Each chunk starts from the exact phase of its first sample (reduced mod 1 cycle) and
+# evaluates the rest relative to it, so chunks join phase-continuously and only one chunk-sized
+# temporary (the local time axis) is allocated besides the output slice.
+
+def sine_chunk_kernel(frequency, sampling_freq, amplitude=1.0):
+    """frequency and sampling_freq in Hz."""
+    def kernel(start, stop, out):
+        t0 = start / sampling_freq
+        phase0 = np.mod(frequency * t0, 1.0)
+        tau = np.arange(stop - start, dtype=np.float64)
+        tau *= frequency / sampling_freq
+        tau += phase0
+        tau *= 2 * np.pi
+        np.sin(tau, out=tau)
+        if amplitude != 1.0:
+            tau *= amplitude
+        out[:] = tau
+    return kernel
+
+
+def lfm_chunk_kernel(f0, k, sampling_freq):
+    """cos(2*pi*(f0*t + (k/2)*t**2)); f0 in Hz, chirp rate k in Hz/s, sampling_freq in Hz."""
+    def kernel(start, stop, out):
+        t0 = start / sampling_freq
+        phase0 = np.mod(f0 * t0 + (k / 2) * t0 ** 2, 1.0)
+        f_start = f0 + k * t0  # instantaneous frequency at the first sample of the chunk
+        tau = np.arange(stop - start, dtype=np.float64)
+        tau /= sampling_freq
+        phase = tau * (k / 2)
+        phase += f_start
+        phase *= tau
+        phase += phase0
+        phase *= 2 * np.pi
+        np.cos(phase, out=phase)
+        out[:] = phase
+    return kernel
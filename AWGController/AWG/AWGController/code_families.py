@@ -0,0 +1,143 @@
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft as sp_fft
+
+from lfsr import m_sequence
+
+
+# Families of binary sequences with low periodic cross-correlation, for driving several channels at once.
+# Every member is one period of N = 2^order - 1 bits (0/1, uint8), one row of the returned array.
+#   Gold:   u, v and u XOR (v shifted by j) for every j, where v is u decimated by a preferred q, so any two
+#           members cross-correlate (bipolar) to at most 2^((order + 2) // 2) + 1. order must not be a multiple of 4.
+#   Kasami: the small set: u and u XOR (w shifted by j), w = u decimated by 2^(order/2) + 1, period 2^(order/2) - 1;
+#           cross-correlation at most 2^(order/2) + 1, the Welch bound. order must be even.
+# All shifts are rows of one sliding-window view over the doubled sequence, so a family is a single XOR.
+
+def preferred_decimation(order):
+    """q = 2^k + 1 making u and u[q*i] a preferred pair of m-sequences."""
+    order = int(order)
+    if order % 4 == 0:
+        raise ValueError(f"No preferred pairs of m-sequences exist for order {order} (a multiple of 4)")
+    k = 1 if order % 2 else 2  # gcd(order, k) must be 1 for odd order, 2 for order = 2 mod 4
+    return (1 << k) + 1
+
+
+def decimate(sequence, q):
+    """Sequence sampled every q-th bit, cyclically: v[i] = u[q*i mod N]."""
+    n = len(sequence)
+    return sequence[(q * np.arange(n, dtype=np.int64)) % n]
+
+
+def _shifted(sequence, length, count):
+    """count x length view: row j is sequence cyclically shifted left by j."""
+    repeats = -(-(length + count) // len(sequence))
+    return sliding_window_view(np.tile(sequence, repeats), length)[:count]
+
+
+def gold_codes(order, seed=1):
+    """(2^order + 1) x (2^order - 1) Gold family: u, v, then u XOR shift_j(v) for j = 0 .. N - 1."""
+    u = m_sequence(order, seed)
+    v = decimate(u, preferred_decimation(order))
+    n = len(u)
+    codes = np.empty((n + 2, n), dtype=np.uint8)
+    codes[0], codes[1] = u, v
+    np.bitwise_xor(u, _shifted(v, n, n), out=codes[2:])
+    return codes
+
+
+def kasami_codes(order, seed=1):
+    """2^(order/2) x (2^order - 1) small Kasami family: u, then u XOR shift_j(w) for j = 0 .. 2^(order/2) - 2."""
+    order = int(order)
+    if order % 2:
+        raise ValueError(f"Kasami sets need an even order, got {order}")
+    u = m_sequence(order, seed)
+    period = (1 << (order // 2)) - 1
+    w = decimate(u, (1 << (order // 2)) + 1)[:period]
+    codes = np.empty((period + 1, len(u)), dtype=np.uint8)
+    codes[0] = u
+    np.bitwise_xor(u, _shifted(w, len(u), period), out=codes[1:])
+    return codes
+
+
+def correlation_bound(family, order):
+    """Largest |periodic cross-correlation| (bipolar) between two members the theory allows."""
+    order = int(order)
+    if family == "gold":
+        return (1 << ((order + 2) // 2)) + 1
+    if family == "kasami":
+        return (1 << (order // 2)) + 1
+    raise ValueError(f"Unknown code family '{family}', expected 'gold' or 'kasami'")
+
+
+def family_codes(family, order, seed=1):
+    if family == "gold":
+        return gold_codes(order, seed)
+    if family == "kasami":
+        return kasami_codes(order, seed)
+    raise ValueError(f"Unknown code family '{family}', expected 'gold' or 'kasami'")
+
+
+def to_bipolar(bits):
+    """0/1 bits to +1/-1 chips."""
+    return 1.0 - 2.0 * np.asarray(bits, dtype=np.float64)
+
+
+def periodic_correlation(a, b=None, workers=-1):
+    """
+    Periodic correlation r[tau] = sum_k a[k] * b[k + tau] of bipolar sequences along the last axis, by FFT;
+    leading axes broadcast, so rows of a 2-D a against one b are done in one pass. b=None gives autocorrelation.
+    """
+    a = np.asarray(a, dtype=np.float64)
+    n = a.shape[-1]
+    spectrum_a = sp_fft.rfft(a, axis=-1, workers=workers)
+    spectrum_b = spectrum_a if b is None else sp_fft.rfft(np.asarray(b, dtype=np.float64), axis=-1, workers=workers)
+    return np.rint(sp_fft.irfft(np.conj(spectrum_a) * spectrum_b, n=n, axis=-1, workers=workers))
+
+
+def correlation_peaks(codes, max_bytes=64 << 20, workers=-1):
+    """
+    M x M matrix of peak |periodic correlation| between members (rows of 0/1 codes): off the diagonal the
+    cross-correlation peak over all lags, on the diagonal the largest autocorrelation sidelobe (lag != 0).
+    Member spectra are computed once; blocks of rows (max_bytes of products) are correlated against every member
+    from the block on, and the rest mirrored, since r_ab at lag tau is r_ba at -tau.
+    Single precision is ample: correlations are integers no larger than the code length.
+    """
+    chips = to_bipolar(codes).astype(np.float32)
+    count, n = chips.shape
+    spectra = sp_fft.rfft(chips, axis=-1, workers=workers)
+    block = max(1, int(max_bytes) // (count * spectra.shape[-1] * spectra.itemsize))
+    peaks = np.empty((count, count))
+    for start in range(0, count, block):
+        stop = min(start + block, count)
+        correlation = sp_fft.irfft(np.conj(spectra[start:stop, None, :]) * spectra[None, start:, :], n=n, axis=-1,
+                                   workers=workers)
+        np.abs(correlation, out=correlation)
+        block_peaks = correlation.max(axis=-1)
+        diagonal = np.arange(stop - start)
+        block_peaks[diagonal, diagonal] = correlation[diagonal, diagonal, 1:].max(axis=-1) if n > 1 else 0.0
+        peaks[start:stop, start:] = block_peaks
+        peaks[start:, start:stop] = block_peaks.T
+    return np.rint(peaks)
+
+
+def check_family(codes, family=None, order=None, **kwargs):
+    """
+    Family properties from correlation_peaks: the worst cross-correlation and autocorrelation sidelobe, and,
+    given family and order, whether every pair is within correlation_bound.
+    """
+    codes = np.atleast_2d(codes)
+    peaks = correlation_peaks(codes, **kwargs)
+    off_diagonal = ~np.eye(len(codes), dtype=bool)
+    report = {
+        "members": len(codes),
+        "length": codes.shape[-1],
+        "max_cross_correlation": float(peaks[off_diagonal].max()) if len(codes) > 1 else 0.0,
+        "max_autocorrelation_sidelobe": float(np.diag(peaks).max()),
+    }
+    if family is not None:
+        bound = correlation_bound(family, order if order is not None else int(math.log2(codes.shape[-1] + 1)))
+        report["bound"] = bound
+        report["within_bound"] = report["max_cross_correlation"] <= bound
+    return report
@@ -0,0 +1,101 @@
+import numpy as np
+
+
+# Output sample formats. Generators synthesize in float64 by default; OUTPUT_DTYPES names the
+# reduced formats that can be requested through their dtype argument.
+OUTPUT_DTYPES = {
+    "float64": np.float64,
+    "float32": np.float32,
+}
+
+
+def resolve_dtype(dtype):
+    """Accept None (keep native), a numpy dtype or one of the OUTPUT_DTYPES names."""
+    if dtype is None:
+        return None
+    if isinstance(dtype, str) and dtype in OUTPUT_DTYPES:
+        return np.dtype(OUTPUT_DTYPES[dtype])
+    return np.dtype(dtype)
+
+
+def as_output_dtype(wave, dtype):
+    dtype = resolve_dtype(dtype)
+    if dtype is None:
+        return wave
+    return wave.astype(dtype, copy=False)
+
+
+class DACEncoder:
+    """
+    Scale float waveforms to the instrument's binary sample format: a signed dac_bits code left-aligned in
+    an int16 word, with the sample and sync marker bits packed into the two least significant bits
+    (M8190A BIN layout, 14-bit mode by default).
+    """
+
+    def __init__(self, dac_bits=14, full_scale=1.0, chunk_size=1 << 20):
+        dac_bits = int(dac_bits)
+        if not 2 <= dac_bits <= 16:
+            raise ValueError(f"dac_bits must be between 2 and 16, got {dac_bits}")
+        self.dac_bits = dac_bits
+        self.full_scale = float(full_scale)
+        self.chunk_size = int(chunk_size)
+        self.shift = 16 - dac_bits
+        self.code_max = 2 ** (dac_bits - 1) - 1
+        self.code_min = -(2 ** (dac_bits - 1))
+        self.last_clipped = 0
+
+    def encode(self, wave, sample_marker=None, sync_marker=None, out=None):
+        """
+        Map [-full_scale, +full_scale] onto [code_min, code_max], clipping anything outside, and return int16 words.
+        Markers are boolean arrays (or scalars) the same length as wave; they need two free LSBs (dac_bits <= 14).
+        The number of clipped samples is kept in last_clipped.
+        """
+        wave = np.asarray(wave)
+        if (sample_marker is not None or sync_marker is not None) and self.shift < 2:
+            raise ValueError(f"No free bits for markers with a {self.dac_bits}-bit DAC")
+        if out is None:
+            out = np.empty(wave.shape, dtype=np.int16)
+        elif out.shape != wave.shape:
+            raise ValueError(f"out has shape {out.shape}, expected {wave.shape}")
+
+        scale = self.code_max / self.full_scale
+        clipped = 0
+        flat_wave = wave.reshape(-1)
+        # reshape of a non-contiguous view would be a copy; .flat writes through to the caller's buffer
+        flat_out = out.reshape(-1) if out.flags.c_contiguous else out.flat
+        for start in range(0, flat_wave.size, self.chunk_size):
+            stop = min(start + self.chunk_size, flat_wave.size)
+            codes = flat_wave[start:stop].astype(np.float32 if flat_wave.dtype == np.float32 else np.float64)
+            codes *= scale
+            np.rint(codes, out=codes)
+            clipped += np.count_nonzero((codes > self.code_max) | (codes < self.code_min))
+            np.clip(codes, self.code_min, self.code_max, out=codes)
+            words = codes.astype(np.int16)
+            if self.shift:
+                np.left_shift(words, self.shift, out=words)
+            if sample_marker is not None:
+                words |= self._marker_chunk(sample_marker, start, stop)
+            if sync_marker is not None:
+                words |= self._marker_chunk(sync_marker, start, stop) << 1
+            flat_out[start:stop] = words
+
+        self.last_clipped = int(clipped)
+        return out
+
+    def decode(self, words):
+        """int16 words back to floats in [-full_scale, +full_scale]; marker bits are dropped."""
+        codes = np.right_shift(np.asarray(words, dtype=np.int16), self.shift)
+        return codes.astype(np.float64) * (self.full_scale / self.code_max)
+
+    @staticmethod
+    def _marker_chunk(marker, start, stop):
+        marker = np.asarray(marker)
+        if marker.ndim == 0:
+            return np.int16(bool(marker))
+        return marker.reshape(-1)[start:stop].astype(bool).astype(np.int16)
+
+
+def write_dac_file(words, file_path):
+    """Write int16 DAC words as a little-endian binary file (2 bytes per sample instead of ~20 in CSV)."""
+    np.asarray(words, dtype="<i2").tofile(file_path)
+    return file_path
@@ -0,0 +1,59 @@
+import numpy as np
+from pyfinite import ffield
+
+
+# Fibonacci LFSR output, vectorized.
+# Produces the same bit stream as shifting `state = [feedback] + state[:-1]` one bit at a time
+# (output = state[-1], feedback = XOR of state[taps]). The recurrence is applied in blocks: since
+# p(x)^2 = p(x^2) over GF(2), the sequence also obeys the recurrence with every tap offset doubled,
+# so the block that can be computed in one numpy XOR doubles in width as the sequence grows.
+def lfsr_sequence(seed, taps, length):
+    order = len(seed)
+    length = int(length)
+    offsets = [order - 1 - t for t in taps]
+    bits = np.empty(max(length, order), dtype=np.uint8)
+    bits[:order] = np.asarray(seed, dtype=np.uint8)[::-1]
+
+    filled = order
+    step = 1
+    while filled < length:
+        if filled >= 2 * step * order:
+            step *= 2
+        width = min(step, length - filled)
+        base = filled - step * order
+        block = np.zeros(width, dtype=np.uint8)
+        for c in offsets:
+            start = base + step * c
+            block ^= bits[start:start + width]
+        bits[filled:filled + width] = block
+        filled += width
+
+    return bits[:length]
+
+
+def primitive_taps(order):
+    """
+    Register taps for lfsr_sequence realising pyfinite's degree-`order` primitive polynomial, so the output is
+    a maximal-length sequence. A term x^p (p < order) feeds back bit s[k + p], held in state[order - 1 - p].
+    """
+    order = int(order)
+    field = ffield.FField(order)
+    powers = [p for p, bit in enumerate(reversed(field.ShowCoefficients(field.generator))) if bit == 1 and p < order]
+    return sorted(order - 1 - p for p in powers)
+
+
+def random_state(order, seed=None):
+    """Random non-zero initial register state of `order` bits; an integer seed reproduces it."""
+    rng = np.random.default_rng(seed) if seed is not None else np.random
+    while True:
+        state = (rng.integers(0, 2, size=int(order)) if seed is not None else rng.randint(0, 2, size=int(order))).tolist()
+        if any(state):
+            return state
+
+
+def m_sequence(order, seed=1):
+    """One period (2^order - 1 bits) of the maximal-length sequence; seed is the non-zero initial register state."""
+    state = [(int(seed) >> i) & 1 for i in range(int(order))]
+    if not any(state):
+        raise ValueError("LFSR seed must be non-zero")
+    return lfsr_sequence(state, primitive_taps(order), (1 << int(order)) - 1)
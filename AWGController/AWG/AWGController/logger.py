@@ -3,6 +3,8 @@ import time
 import datetime
 
 class awg_logger:
+    MAX_BYTES = 10 << 20  # a daily log past this size is rotated to <file>.1 when the next logger starts
+
     def __init__(self, device_name='AWG'):
         self.device_name = device_name.upper()
         self._log_file_path = None
@@ -16,9 +18,20 @@ class awg_logger:
         file_name = f"{self.device_name.lower()}_{today.strftime('%d%m%Y')}.txt"
         self._log_file_path = os.path.join(os.getcwd(), file_name)
 
-        with open(self._log_file_path, 'w') as f:
+        # append: generator instances in sweep worker processes share the same daily log file, so a new
+        # logger must not truncate it; the size is bounded by rotating to one backup instead
+        self._rotate()
+        with open(self._log_file_path, 'a') as f:
             f.write(f"Log file created for {self.device_name} at {today} \n")
 
+    def _rotate(self):
+        """Move an oversized log to <file>.1 (replacing the previous backup)."""
+        try:
+            if os.path.getsize(self._log_file_path) > self.MAX_BYTES:
+                os.replace(self._log_file_path, self._log_file_path + ".1")
+        except OSError:  # no log yet, or another process rotated it first
+            pass
+
     # ---------------------- APPEND LOG COMMAND ---------------------
     def _log_command(self, command: str, duration_ms: float = None, response: str = None):
         """Log SCPI command with optional duration and response"""
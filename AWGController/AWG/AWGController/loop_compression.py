@@ -0,0 +1,116 @@
+import numpy as np
+
+from record_planner import RecordLengthPlanner
+from Waveform import Waveform
+
+
+class LoopedWaveform:
+    """
+    A waveform stored as `unit` played `loops` times, optionally followed by a `tail` played once.
+    Only unit and tail need uploading; the repeats map onto the sequencer's segment loop count.
+    """
+
+    def __init__(self, unit, loops, sample_rate, tail=None):
+        self.unit = np.asarray(unit)
+        self.loops = int(loops)
+        self.sample_rate = float(sample_rate)
+        self.tail = None if tail is None or len(tail) == 0 else np.asarray(tail)
+
+    @classmethod
+    def declared(cls, unit, num_samples, sample_rate):
+        """Repeat a known unit (e.g. one PRBS period) to num_samples: whole loops plus the remainder as tail."""
+        unit = np.asarray(unit)
+        loops, remainder = divmod(int(num_samples), len(unit))
+        return cls(unit, loops, sample_rate, tail=unit[:remainder])
+
+    @property
+    def num_samples(self):
+        return len(self.unit) * self.loops + (0 if self.tail is None else len(self.tail))
+
+    @property
+    def upload_samples(self):
+        return len(self.unit) + (0 if self.tail is None else len(self.tail))
+
+    @property
+    def compression_ratio(self):
+        return self.num_samples / max(1, self.upload_samples)
+
+    def segments(self):
+        """[(samples, loop count)] in playback order."""
+        segments = [(self.unit, self.loops)]
+        if self.tail is not None:
+            segments.append((self.tail, 1))
+        return segments
+
+    def materialize(self):
+        parts = [np.tile(self.unit, self.loops)]
+        if self.tail is not None:
+            parts.append(self.tail)
+        return Waveform(np.concatenate(parts), self.sample_rate)
+
+    def __repr__(self):
+        tail = 0 if self.tail is None else len(self.tail)
+        return f"LoopedWaveform(unit={len(self.unit)}, loops={self.loops}, tail={tail}, ratio={self.compression_ratio:.1f}x)"
+
+
+def _divisors(n):
+    small = [d for d in range(1, int(np.sqrt(n)) + 1) if n % d == 0]
+    return sorted(set(small + [n // d for d in small]))
+
+
+def find_period(samples, atol=0.0):
+    """Length of the shortest unit that tiles samples exactly (within atol); len(samples) if none does."""
+    samples = np.asarray(samples)
+    n = len(samples)
+    for period in _divisors(n):
+        if period == n:
+            break
+        # cheap rejection on the first repeat before comparing the whole record
+        if not np.allclose(samples[period:2 * period], samples[:period], rtol=0, atol=atol):
+            continue
+        if np.allclose(samples[period:], samples[:-period], rtol=0, atol=atol):
+            return period
+    return n
+
+
+def fit_unit(unit, loops, planner):
+    """
+    Grow the unit to whole repeats until it is a legal segment (granularity / min length); the loop count
+    drops accordingly. Returns (unit, loops), or None when no divisor of loops gives a legal segment.
+    """
+    unit_len = len(unit)
+    for repeats in _divisors(loops):
+        length = unit_len * repeats
+        if planner.align(length) == length:
+            return np.tile(unit, repeats), loops // repeats
+    return None
+
+
+def compress(waveform, planner=None, atol=0.0):
+    """
+    Detect the minimal repeating unit of a Waveform (or accept a LoopedWaveform with a declared unit) and
+    return a LoopedWaveform whose unit and tail are legal segments. Falls back to host-side tiling, i.e.
+    one segment holding everything, when the repeats cannot be split into legal segments.
+    """
+    planner = planner or RecordLengthPlanner()
+    if isinstance(waveform, LoopedWaveform):
+        looped = waveform
+    else:
+        samples = waveform.samples
+        period = find_period(samples, atol=atol)
+        looped = LoopedWaveform(samples[:period], len(samples) // period, waveform.sample_rate)
+
+    # an illegal tail borrows whole units from the loop (at most granularity of them changes its alignment)
+    unit, loops, tail = looped.unit, looped.loops, looped.tail
+    for _ in range(planner.granularity):
+        if tail is None or planner.align(len(tail)) == len(tail) or loops <= 1:
+            break
+        tail = np.concatenate([unit, tail])
+        loops -= 1
+
+    fitted = fit_unit(unit, loops, planner)
+    tail_ok = tail is None or planner.align(len(tail)) == len(tail)
+    if fitted is None or not tail_ok:
+        return LoopedWaveform(looped.materialize().samples, 1, looped.sample_rate)
+    unit, loops = fitted
+    return LoopedWaveform(unit, loops, looped.sample_rate, tail=tail)
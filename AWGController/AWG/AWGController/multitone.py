@@ -0,0 +1,97 @@
+import math
+from fractions import Fraction
+
+import numpy as np
+from scipy import fft as sp_fft
+
+
+# Multitone synthesis on coherent FFT bins: every tone sits exactly on bin k of an L-sample record, so the
+# whole stimulus is one inverse real FFT (O(L log L) regardless of tone count) and loops seamlessly.
+
+def crest_factor(x):
+    """Peak to RMS ratio (linear)."""
+    x = np.asarray(x, dtype=np.float64)
+    return float(np.max(np.abs(x)) / np.sqrt(np.mean(x ** 2)))
+
+
+def tone_bins(frequencies, num_samples, sampling_freq):
+    """Nearest FFT bin of each tone (Hz) in a num_samples record; raises if two tones share a bin."""
+    bins = np.rint(np.asarray(frequencies, dtype=np.float64) * num_samples / sampling_freq).astype(np.int64)
+    if np.any(bins <= 0) or np.any(bins >= (num_samples + 1) // 2):
+        raise ValueError("Tones must lie strictly between DC and Nyquist")
+    if len(np.unique(bins)) != len(bins):
+        raise ValueError(f"Tones collide on the same FFT bin with a {num_samples}-sample record")
+    return bins
+
+
+def coherent_length(frequencies, sampling_freq, planner):
+    """
+    Shortest planner-aligned record in which every tone completes an integer number of cycles. Tones are
+    quantized jointly to the planner's frequency tolerance, which bounds the record by sampling_freq / tolerance.
+    """
+    resolution = planner.frequency_tolerance or 1.0
+    fs_units = max(1, round(sampling_freq / resolution))
+    length = 1
+    for frequency in frequencies:
+        length = math.lcm(length, Fraction(round(frequency / resolution), fs_units).denominator)
+    return planner.align(length, multiple=length)
+
+
+def schroeder_phases(num_tones):
+    """Schroeder phases for equal-amplitude tones: -pi*k*(k-1)/N."""
+    k = np.arange(1, num_tones + 1)
+    return -np.pi * k * (k - 1) / num_tones
+
+
+def newman_phases(num_tones):
+    """Newman phases: pi*(k-1)^2/N."""
+    k = np.arange(1, num_tones + 1)
+    return np.pi * (k - 1) ** 2 / num_tones
+
+
+def initial_phases(phases, num_tones, seed=None):
+    if isinstance(phases, str):
+        if phases == "schroeder":
+            return schroeder_phases(num_tones)
+        if phases == "newman":
+            return newman_phases(num_tones)
+        if phases == "random":
+            return np.random.default_rng(seed).uniform(-np.pi, np.pi, num_tones)
+        if phases == "zero":
+            return np.zeros(num_tones)
+        raise ValueError(f"Unknown phase scheme '{phases}'")
+    phases = np.asarray(phases, dtype=np.float64)
+    if phases.shape != (num_tones,):
+        raise ValueError(f"Expected {num_tones} phases, got shape {phases.shape}")
+    return phases
+
+
+def synthesize_multitone(bins, num_samples, amplitudes, phases, workers=None):
+    """sum_k amplitudes[k] * cos(2*pi*bins[k]*n/num_samples + phases[k]) by one irfft."""
+    spectrum = np.zeros(num_samples // 2 + 1, dtype=np.complex128)
+    spectrum[bins] = (num_samples / 2) * np.asarray(amplitudes) * np.exp(1j * np.asarray(phases))
+    return sp_fft.irfft(spectrum, n=num_samples, workers=workers)
+
+
+def optimize_crest_factor(bins, num_samples, amplitudes, phases, iterations=20, clip_ratio=0.9, workers=None):
+    """
+    Iterative clip-and-restore crest factor reduction: clip the peaks of the time signal, go back to the
+    frequency domain, keep the new tone phases but restore the tone amplitudes (out-of-band energy dropped).
+    Returns (phases, waveform) of the best iteration seen.
+    """
+    amplitudes = np.asarray(amplitudes, dtype=np.float64)
+    phases = np.asarray(phases, dtype=np.float64)
+    best_phases = phases
+    wave = synthesize_multitone(bins, num_samples, amplitudes, phases, workers)
+    best_wave, best_crest = wave, crest_factor(wave)
+
+    for _ in range(int(iterations)):
+        limit = clip_ratio * np.max(np.abs(wave))
+        spectrum = sp_fft.rfft(np.clip(wave, -limit, limit), workers=workers)
+        phases = np.angle(spectrum[bins])
+        wave = synthesize_multitone(bins, num_samples, amplitudes, phases, workers)
+        crest = crest_factor(wave)
+        if crest < best_crest:
+            best_phases, best_wave, best_crest = phases, wave, crest
+
+    return best_phases, best_wave
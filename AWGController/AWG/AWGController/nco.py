@@ -0,0 +1,177 @@
+import numpy as np
+
+from chunked_synthesis import synthesize_chunked
+from NoiseGenerator import NoiseGenerator
+
+
+# Numerically controlled oscillator, the way the instrument's DDS does it: the phase is a 64-bit unsigned
+# integer (one full cycle = 2**64) that wraps for free, advanced by an integer tuning word per sample.
+# Phase is therefore exact however long the record is, and the same inputs always give the same samples.
+# The phase is turned into a sample by a sine table lookup (optionally linearly interpolated), or by cos of
+# the exactly reduced phase. A plain table lookup is the fastest path; see SineTable.
+
+PHASE_BITS = 64
+PHASE_SCALE = 2.0 ** PHASE_BITS
+
+
+def tuning_word(frequency, sampling_freq):
+    """Phase increment per sample for frequency (Hz, may be negative) as uint64 (mod 2**64)."""
+    words = np.rint(np.mod(np.asarray(frequency, dtype=np.float64) / sampling_freq, 1.0) * PHASE_SCALE)
+    # a fraction that rounds up to a whole cycle is phase 0; 2**64 itself does not fit in uint64
+    return np.where(words >= PHASE_SCALE, 0, words).astype(np.uint64)
+
+
+def phase_word(radians):
+    """Phase offset (radians) as uint64 phase words."""
+    return tuning_word(np.asarray(radians, dtype=np.float64) / (2 * np.pi), 1.0)
+
+
+def tone_phase(word, start, stop, phase0=0):
+    """Accumulator values for samples [start, stop) of a fixed tuning word: phase0 + n * word (mod 2**64)."""
+    n = np.arange(start, stop, dtype=np.uint64)
+    n *= np.uint64(word)
+    n += np.uint64(phase0)
+    return n
+
+
+def chirp_phase(word0, word_step, start, stop, phase0=0):
+    """
+    Accumulator values of a linear chirp whose tuning word grows by word_step every sample:
+    phase0 + n * word0 + word_step * n * (n - 1) / 2 (mod 2**64), in closed form so any chunk can start anywhere.
+    """
+    n = np.arange(start, stop, dtype=np.uint64)
+    # n * (n - 1) / 2 exactly mod 2**64: halve whichever factor is even before multiplying
+    odd = (n & np.uint64(1)).astype(bool)
+    half = np.where(odd, n, n >> np.uint64(1))
+    half *= np.where(odd, (n - np.uint64(1)) >> np.uint64(1), n - np.uint64(1))
+    half *= np.uint64(word_step)
+    n *= np.uint64(word0)
+    n += half
+    n += np.uint64(phase0)
+    return n
+
+
+def accumulate(words, phase0=0):
+    """Running phase of a per-sample tuning word sequence (frequency modulation): cumulative uint64 sum."""
+    phase = np.cumsum(np.asarray(words, dtype=np.uint64), dtype=np.uint64)
+    # sample n carries the phase reached before its own increment, like tone_phase
+    phase -= np.asarray(words, dtype=np.uint64)
+    phase += np.uint64(phase0)
+    return phase
+
+
+# float64 with exponent 0 and the given mantissa bits is 1.fraction, so OR-ing the exponent of 1.0 onto the
+# top 52 fraction bits of a phase word reads the fraction as a float with integer ops only (no int->float cast)
+_ONE_BITS = np.uint64(0x3FF0000000000000)
+
+
+def phase_fraction(phase, skip_bits=0):
+    """Fraction of a cycle in [0, 1) held by phase (uint64) after dropping its top skip_bits; overwrites phase."""
+    if skip_bits:
+        phase <<= np.uint64(skip_bits)
+    phase >>= np.uint64(PHASE_BITS - 52)
+    phase |= _ONE_BITS
+    fraction = phase.view(np.float64)
+    fraction -= 1.0
+    return fraction
+
+
+class SineTable:
+    """
+    cos lookup on the top table_bits of the phase, optionally linearly interpolated with the remaining bits.
+    table_bits=None skips the table and evaluates cos of the exactly reduced phase instead (no truncation spurs).
+    """
+
+    def __init__(self, table_bits=16, interpolate=True):
+        self.table_bits = None if table_bits is None else int(table_bits)
+        self.interpolate = interpolate
+        if self.table_bits is None:
+            return
+        size = 1 << self.table_bits
+        self.table = np.cos(2 * np.pi * np.arange(size + 1) / size)  # one guard entry for interpolation
+        self.slope = np.diff(self.table)
+        self.shift = np.uint64(PHASE_BITS - self.table_bits)
+
+    @property
+    def resolution_bits(self):
+        """Phase bits below the table index (dropped or used for interpolation)."""
+        return 0 if self.table_bits is None else PHASE_BITS - self.table_bits
+
+    def lookup(self, phase, out):
+        """Write cos(2*pi*phase / 2**64) into out; phase (uint64) is used as scratch space."""
+        if self.table_bits is None:
+            angle = phase_fraction(phase)
+            angle *= 2 * np.pi
+            np.cos(angle, out=out, casting="unsafe")
+            return out
+        index = (phase >> self.shift).view(np.int64)
+        if not self.interpolate:
+            np.take(self.table, index, out=out, mode="clip")
+            return out
+        fraction = phase_fraction(phase, self.table_bits)
+        fraction *= np.take(self.slope, index, mode="clip")
+        np.add(fraction, np.take(self.table, index, mode="clip"), out=out, casting="unsafe")
+        return out
+
+
+class NCO:
+    """
+    Chunked NCO synthesis. Frequencies and sampling_freq are in Hz.
+    table_bits / interpolate select the phase-to-amplitude stage (see SineTable).
+    dither=True adds uniform random phase below the table resolution before lookup, which turns the
+    periodic phase-truncation spurs into a noise floor; it is seeded and drawn per BLOCK_SIZE block
+    (see NoiseGenerator), so a dithered record is still reproducible bit for bit.
+    """
+
+    BLOCK_SIZE = NoiseGenerator.BLOCK_SIZE
+
+    def __init__(self, sampling_freq, table_bits=16, interpolate=True, dither=False, seed=None):
+        self.sampling_freq = float(sampling_freq)
+        self.table = SineTable(table_bits, interpolate)
+        self.dither = dither
+        self.noise = NoiseGenerator(seed) if dither else None
+
+    def _render(self, phase_fn, num_samples, amplitude, max_workers, dtype):
+        amplitude = float(amplitude)
+
+        def kernel(start, stop, out):
+            phase = phase_fn(start, stop)
+            if self.dither:
+                rng = self.noise.block_rng(start // self.BLOCK_SIZE)
+                phase += rng.integers(0, 1 << self.table.resolution_bits, size=stop - start, dtype=np.uint64)
+            self.table.lookup(phase, out)
+            if amplitude != 1.0:
+                out *= amplitude
+
+        return synthesize_chunked(kernel, num_samples, self.BLOCK_SIZE, max_workers, dtype=dtype)
+
+    def tone(self, frequency, num_samples, amplitude=1.0, phase=0.0, max_workers=None, dtype=np.float64):
+        """amplitude * cos(2*pi*frequency*t + phase)."""
+        word, phase0 = tuning_word(frequency, self.sampling_freq), phase_word(phase)
+        return self._render(lambda start, stop: tone_phase(word, start, stop, phase0), num_samples, amplitude,
+                            max_workers, dtype)
+
+    def chirp(self, start_freq, rate, num_samples, amplitude=1.0, phase=0.0, max_workers=None, dtype=np.float64):
+        """amplitude * cos(2*pi*(start_freq*t + rate/2*t**2) + phase); rate in Hz/s."""
+        # phase(n) = f0/fs * n + rate/(2 fs^2) * n^2 = word0 * n + word_step * n(n-1)/2 with:
+        word_step = tuning_word(rate / self.sampling_freq, self.sampling_freq)
+        word0 = tuning_word(start_freq + rate / (2 * self.sampling_freq), self.sampling_freq)
+        phase0 = phase_word(phase)
+        return self._render(lambda start, stop: chirp_phase(word0, word_step, start, stop, phase0), num_samples,
+                            amplitude, max_workers, dtype)
+
+    def fm(self, carrier_freq, frequency_offset, amplitude=1.0, phase=0.0, dtype=np.float64):
+        """Frequency modulation: instantaneous frequency carrier_freq + frequency_offset[n] (Hz per sample)."""
+        words = tuning_word(carrier_freq + np.asarray(frequency_offset, dtype=np.float64), self.sampling_freq)
+        phase_track = accumulate(words, phase_word(phase))
+        return self._render(lambda start, stop: phase_track[start:stop].copy(), len(words), amplitude, 1, dtype)
+
+    def pm(self, carrier_freq, phase_offset, amplitude=1.0, max_workers=None, dtype=np.float64):
+        """Phase modulation: carrier phase plus phase_offset[n] (radians per sample)."""
+        word, offsets = tuning_word(carrier_freq, self.sampling_freq), phase_word(phase_offset)
+
+        def phase_fn(start, stop):
+            phase = tone_phase(word, start, stop)
+            phase += offsets[start:stop]
+            return phase
+        return self._render(phase_fn, len(offsets), amplitude, max_workers, dtype)
@@ -0,0 +1,173 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft as sp_fft
+from scipy import signal
+
+from config_loader import load_config
+from Waveform import Waveform
+
+
+CONFIG = load_config()
+
+
+# Pre-distortion: filter a waveform with the inverse of the AWG's measured frequency-dependent error before
+# upload. The correction is a linear-phase FIR (designed from an error-vs-frequency table, e.g. the FFNN
+# error curves) applied by overlap-save FFT convolution in fixed-size blocks, so memory stays bounded for any
+# record length and a 2-D batch of sweep points is corrected in the same FFTs.
+
+def correction_taps(frequencies, error_db, sampling_freq, numtaps=257, max_boost_db=6.0, error_phase=None):
+    """
+    FIR undoing error_db (measured output / wanted, dB) at frequencies (Hz). error_phase (radians), if given,
+    is undone too. Boost is capped at max_boost_db where the error is a deep loss; outside the table the
+    nearest entry is held. The taps are centred: the group delay is (numtaps - 1) / 2 samples.
+    """
+    numtaps = int(numtaps) | 1
+    num_fft = sp_fft.next_fast_len(8 * numtaps, real=True)
+    grid = sp_fft.rfftfreq(num_fft, 1 / sampling_freq)
+    gain_db = np.minimum(-np.interp(grid, frequencies, error_db), max_boost_db)
+    response = 10 ** (gain_db / 20)
+    if error_phase is not None:
+        response = response * np.exp(-1j * np.interp(grid, frequencies, error_phase))
+
+    impulse = sp_fft.irfft(response, n=num_fft)
+    taps = np.roll(impulse, numtaps // 2)[:numtaps]
+    return taps * signal.get_window(("kaiser", 8.0), numtaps, fftbins=False)
+
+
+def load_correction(file_path, sampling_freq, **kwargs):
+    """
+    Correction taps from a csv table with a header row and columns frequency (GHz), error (dB) and optionally
+    phase error (degrees); kwargs go to correction_taps.
+    """
+    table = np.loadtxt(file_path, delimiter=",", skiprows=1, ndmin=2)
+    order = np.argsort(table[:, 0])
+    table = table[order]
+    phase = np.deg2rad(table[:, 2]) if table.shape[1] > 2 else None
+    return correction_taps(table[:, 0] * 1e9, table[:, 1], sampling_freq, error_phase=phase, **kwargs)
+
+
+class OverlapSaveFilter:
+    """
+    Streaming FIR by overlap-save: each FFT block of fft_size samples yields fft_size - len(taps) + 1 outputs.
+    process() / flush() take chunks of any size along the last axis (rows of a 2-D batch are independent) and
+    return the outputs of the full ("valid" + tail) convolution; the filter spectrum is computed once.
+    """
+
+    def __init__(self, taps, fft_size=None, blocks_per_pass=64):
+        self.taps = np.asarray(taps, dtype=np.float64)
+        overlap = len(self.taps) - 1
+        self.fft_size = int(fft_size or sp_fft.next_fast_len(max(4 * len(self.taps), 1024), real=True))
+        if self.fft_size <= overlap:
+            raise ValueError(f"fft_size {self.fft_size} must exceed the filter length {len(self.taps)}")
+        self.step = self.fft_size - overlap
+        self.blocks_per_pass = int(blocks_per_pass)
+        self.spectrum = sp_fft.rfft(self.taps, n=self.fft_size)
+        self.reset()
+
+    def reset(self):
+        self._pending = None
+        self._consumed = 0
+        self._produced = 0
+
+    def _run_blocks(self, count):
+        """Filter `count` whole blocks off the front of the pending input, blocks_per_pass FFTs at a time."""
+        outputs = []
+        for first in range(0, count, self.blocks_per_pass):
+            blocks = min(self.blocks_per_pass, count - first)
+            start = first * self.step
+            span = self._pending[..., start:start + (blocks - 1) * self.step + self.fft_size]
+            frames = sliding_window_view(span, self.fft_size, axis=-1)[..., ::self.step, :]
+            filtered = sp_fft.irfft(sp_fft.rfft(frames, axis=-1) * self.spectrum, n=self.fft_size, axis=-1)
+            filtered = filtered[..., len(self.taps) - 1:]
+            outputs.append(filtered.reshape(filtered.shape[:-2] + (-1,)))
+        self._pending = self._pending[..., count * self.step:]
+        return np.concatenate(outputs, axis=-1)
+
+    def process(self, chunk):
+        """Feed input samples; returns every output sample whose block is complete."""
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if self._pending is None:
+            # the first len(taps) - 1 outputs see zeros before the start of the input
+            self._pending = np.zeros(chunk.shape[:-1] + (len(self.taps) - 1,))
+        self._pending = np.concatenate([self._pending, chunk], axis=-1)
+        self._consumed += chunk.shape[-1]
+        count = max(0, (self._pending.shape[-1] - self.fft_size) // self.step + 1)
+        if count == 0:
+            return self._pending[..., :0]
+        out = self._run_blocks(count)
+        self._produced += out.shape[-1]
+        return out
+
+    def flush(self, num_outputs=None):
+        """Outputs still owed: up to num_outputs in total (default: one per input sample), zeros past the input."""
+        total = self._consumed if num_outputs is None else int(num_outputs)
+        remaining = total - self._produced
+        if remaining <= 0 or self._pending is None:
+            self.reset()
+            return np.zeros((0,))
+        count = -(-remaining // self.step)
+        needed = (count - 1) * self.step + self.fft_size
+        padding = np.zeros(self._pending.shape[:-1] + (max(0, needed - self._pending.shape[-1]),))
+        self._pending = np.concatenate([self._pending, padding], axis=-1)
+        out = self._run_blocks(count)[..., :remaining]
+        self.reset()
+        return out
+
+    def filter(self, samples, delay=0, periodic=False, chunk_size=1 << 20):
+        """
+        Same-length output with `delay` samples of filter delay removed. periodic=True filters the record as one
+        period of a looped waveform (circular convolution), so the corrected record still loops seamlessly.
+        Input is fed in chunk_size pieces into a preallocated output.
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        n = samples.shape[-1]
+        lead = len(self.taps) - 1 - delay  # samples before the record the first output depends on
+        if periodic:
+            head = np.take(samples, np.arange(-lead, 0) % n, axis=-1)
+            tail = np.take(samples, np.arange(delay) % n, axis=-1)
+        else:
+            head = np.zeros(samples.shape[:-1] + (lead,))
+            tail = np.zeros(samples.shape[:-1] + (delay,))
+
+        out = np.empty(samples.shape[:-1] + (n,))
+        written, skip = 0, len(self.taps) - 1  # outputs before the record is fully in the window are dropped
+
+        def emit(block):
+            nonlocal written, skip
+            drop = min(skip, block.shape[-1])
+            block, skip = block[..., drop:], skip - drop
+            out[..., written:written + block.shape[-1]] = block
+            written += block.shape[-1]
+
+        self.reset()
+        emit(self.process(head))
+        for start in range(0, n, int(chunk_size)):
+            emit(self.process(samples[..., start:start + int(chunk_size)]))
+        emit(self.process(tail))
+        emit(self.flush(self._consumed))
+        return out
+
+
+class Predistorter:
+    """Correction taps plus the overlap-save filter that applies them to generator output."""
+
+    def __init__(self, taps, fft_size=None):
+        self.taps = np.asarray(taps, dtype=np.float64)
+        self.delay = (len(self.taps) - 1) // 2
+        self.filter = OverlapSaveFilter(self.taps, fft_size)
+
+    @classmethod
+    def from_config(cls, sampling_freq=7.2e9):
+        """Predistorter from the "predistortion" section of config.json, or None when it is disabled."""
+        config = CONFIG.get("predistortion", {})
+        if not config.get("enabled", False) or not config.get("correction_file"):
+            return None
+        taps = load_correction(config["correction_file"], sampling_freq, numtaps=config.get("numtaps", 257),
+                               max_boost_db=config.get("max_boost_db", 6.0))
+        return cls(taps, config.get("fft_size"))
+
+    def apply(self, waveform, periodic=True, chunk_size=1 << 20):
+        """Corrected copy of a Waveform or sample array (1-D, or 2-D points x samples)."""
+        if isinstance(waveform, Waveform):
+            return waveform.with_samples(self.apply(waveform.samples, periodic, chunk_size))
+        return self.filter.filter(waveform, self.delay, periodic, chunk_size)
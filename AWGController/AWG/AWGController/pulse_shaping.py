@@ -0,0 +1,111 @@
+import math
+from fractions import Fraction
+
+import numpy as np
+from scipy import signal
+
+
+# Symbol-to-sample stage for serial data. Symbols are upsampled by `up`, filtered by the pulse shape at the
+# upsampled rate and decimated by `down` in one polyphase pass (scipy.signal.upfirdn), so fs / symbol_rate can
+# be any rational up / down and the work per output sample is the pulse span in symbols, not the filter length.
+# Filter taps are normalized so each polyphase branch sums to ~1: a run of equal symbols keeps its level.
+
+def oversampling_ratio(sampling_freq, symbol_rate, max_denominator=1000):
+    """(up, down) with up / down ~ sampling_freq / symbol_rate; the bit-rate error is symbol_rate * relative error."""
+    ratio = (Fraction(sampling_freq) / Fraction(symbol_rate)).limit_denominator(int(max_denominator))
+    if ratio < 1:
+        raise ValueError(f"Symbol rate {symbol_rate} Hz is above the sampling rate {sampling_freq} Hz")
+    return ratio.numerator, ratio.denominator
+
+
+def rect_taps(sps):
+    """Sample-and-hold pulse one symbol long (np.repeat for an integer ratio)."""
+    return np.ones(int(sps))
+
+
+def raised_cosine_taps(sps, span=8, rolloff=0.35):
+    """Raised-cosine pulse over span symbols, sps samples per symbol, unit peak."""
+    t = np.arange(-span * sps // 2, span * sps // 2 + 1) / sps
+    taps = np.sinc(t)
+    denominator = 1 - (2 * rolloff * t) ** 2
+    singular = np.isclose(denominator, 0)
+    taps[~singular] *= np.cos(np.pi * rolloff * t[~singular]) / denominator[~singular]
+    taps[singular] = (np.pi / 4) * np.sinc(1 / (2 * rolloff))
+    return taps
+
+
+def root_raised_cosine_taps(sps, span=8, rolloff=0.35):
+    """Root-raised-cosine pulse over span symbols, normalized to unit energy per symbol."""
+    t = np.arange(-span * sps // 2, span * sps // 2 + 1) / sps
+    taps = np.empty_like(t)
+    at_zero = np.isclose(t, 0)
+    at_edge = np.isclose(np.abs(t), 1 / (4 * rolloff)) if rolloff > 0 else np.zeros_like(at_zero)
+    regular = ~(at_zero | at_edge)
+    tr = t[regular]
+    taps[regular] = ((np.sin(np.pi * tr * (1 - rolloff)) + 4 * rolloff * tr * np.cos(np.pi * tr * (1 + rolloff)))
+                     / (np.pi * tr * (1 - (4 * rolloff * tr) ** 2)))
+    taps[at_zero] = 1 + rolloff * (4 / np.pi - 1)
+    if rolloff > 0:
+        taps[at_edge] = (rolloff / np.sqrt(2)) * ((1 + 2 / np.pi) * np.sin(np.pi / (4 * rolloff))
+                                                  + (1 - 2 / np.pi) * np.cos(np.pi / (4 * rolloff)))
+    return taps / np.sqrt(np.sum(taps ** 2) / sps)
+
+
+def gaussian_taps(sps, span=4, bt=0.5):
+    """Gaussian filter with bandwidth-time product bt (as in GMSK) convolved with a one-symbol rectangle."""
+    t = np.arange(-span * sps // 2, span * sps // 2 + 1) / sps
+    sigma = np.sqrt(np.log(2)) / (2 * np.pi * bt)
+    gaussian = np.exp(-t ** 2 / (2 * sigma ** 2))
+    return np.convolve(gaussian / gaussian.sum(), rect_taps(sps), mode="same")
+
+
+def bt_for_rise_time(rise_time, symbol_rate):
+    """Gaussian bt giving a 10-90 % edge of rise_time seconds (t_r ~ 0.34 / B)."""
+    return 0.34 / (float(rise_time) * float(symbol_rate))
+
+
+def pulse_taps(shape, sps, span=None, rolloff=0.35, bt=0.5):
+    """Taps at sps samples per symbol, and the delay (samples) that puts each pulse's peak mid-symbol like rect."""
+    sps = int(sps)
+    if shape == "rect":
+        return rect_taps(sps), 0
+    if shape == "raised_cosine":
+        taps = raised_cosine_taps(sps, span or 8, rolloff)
+    elif shape == "root_raised_cosine":
+        taps = root_raised_cosine_taps(sps, span or 8, rolloff)
+    elif shape == "gaussian":
+        taps = gaussian_taps(sps, span or 4, bt)
+    else:
+        raise ValueError(f"Unknown pulse shape '{shape}'")
+    # centred pulses peak (len - 1) / 2 samples in; shift them onto the middle of the symbol like rect
+    return taps, (len(taps) - 1) // 2 - sps // 2
+
+
+def shape_symbols(symbols, up, down, taps, delay=0, periodic=True):
+    """
+    Pulse-shaped waveform of len(symbols) * up / down samples (rounded up). periodic=True treats the symbols as one
+    period of a repeating pattern (wrapping the filter tails round), so the result loops seamlessly.
+    Complex symbols (I + jQ) are shaped on both rails at once.
+    """
+    symbols = np.asarray(symbols)
+    symbols = symbols.astype(np.result_type(symbols, np.float64), copy=False)
+    up, down = int(up), int(down)
+    taps = np.asarray(taps, dtype=np.float64)
+    taps = taps * (up / taps.sum()) if taps.sum() else taps
+    num_out = -(-len(symbols) * up // down)
+
+    pad = -(-len(taps) // up) + 1 if periodic else 0
+    if periodic:
+        symbols = np.concatenate([np.resize(symbols[::-1], pad)[::-1], symbols, np.resize(symbols, pad)])
+    # first wanted sample at upsampled index pad * up + delay; delay the filter until that is a multiple of down
+    offset = pad * up + delay
+    lag = (-offset) % down
+    if lag:
+        taps = np.concatenate([np.zeros(lag), taps])
+    first = (offset + lag) // down
+    return signal.upfirdn(taps, symbols, up, down)[first:first + num_out]
+
+
+def symbols_per_whole_record(num_symbols, up, down):
+    """Smallest number of repeats of a num_symbols pattern that spans a whole number of output samples."""
+    return down // math.gcd(int(num_symbols) * int(up), int(down))
@@ -0,0 +1,186 @@
+import numpy as np
+
+from record_planner import RecordLengthPlanner
+from waveform_graph import Node, FileSink, DecimatingSink
+from Waveform import Waveform
+
+
+# Radar pulse trains as sequencer programs instead of sample records. A train is mostly idle time, so the plan
+# stores the pulse once plus short zero segments and lets the sequence table repeat them: per PRI the pulse,
+# a zero block looped k times and a short zero remainder; a stagger pattern of PRIs is one sequence, looped as a
+# whole. Every stored segment is a legal length (RecordLengthPlanner granularity / minimum), so each PRI is
+# rounded to the nearest granularity multiple; the PRIs actually played are in PulseTrainPlan.pris.
+# Samples exist only when asked for: to_node() renders any range lazily, save() streams a file, preview() renders
+# the first PRIs.
+
+class PulseTrainPlan:
+    """
+    segments: stored sample arrays; sequences: [([(segment index, segment loops), ...], sequence loops)] in
+    playback order. pris: the PRI (s) of each pulse in one stagger cycle.
+    """
+
+    def __init__(self, segments, sequences, sample_rate, pris=None, pulse_samples=None):
+        self.segments = [np.asarray(segment) for segment in segments]
+        self.sequences = [([(int(i), int(n)) for i, n in entries], int(loops)) for entries, loops in sequences]
+        self.sample_rate = float(sample_rate)
+        self.pris = list(pris or [])
+        self.pulse_samples = pulse_samples
+
+    def sequence_samples(self, entries):
+        return sum(len(self.segments[i]) * n for i, n in entries)
+
+    @property
+    def num_samples(self):
+        return sum(self.sequence_samples(entries) * loops for entries, loops in self.sequences)
+
+    @property
+    def duration(self):
+        return self.num_samples / self.sample_rate
+
+    @property
+    def upload_samples(self):
+        return sum(len(segment) for segment in self.segments)
+
+    @property
+    def compression_ratio(self):
+        return self.num_samples / max(1, self.upload_samples)
+
+    @property
+    def duty_cycle(self):
+        if not self.pris or not self.pulse_samples:
+            return None
+        return self.pulse_samples / self.sample_rate / np.mean(self.pris)
+
+    def sequence_table(self):
+        """Rows (segment index, segment loops, sequence loops, first entry of its sequence, last entry) in order."""
+        rows = []
+        for entries, loops in self.sequences:
+            for k, (segment, segment_loops) in enumerate(entries):
+                rows.append((segment, segment_loops, loops, k == 0, k == len(entries) - 1))
+        return rows
+
+    def to_node(self):
+        """Lazy waveform_graph Node of the whole train."""
+        return PulseTrainNode(self)
+
+    def materialize(self, chunk_size=1 << 20, max_workers=None):
+        return self.to_node().to_waveform(chunk_size, max_workers)
+
+    def save(self, file_path, file_format="csv", encoder=None, chunk_size=1 << 20):
+        """Stream the full train to a csv / bin file chunk by chunk."""
+        return self.to_node().stream(FileSink(file_path, file_format, encoder), chunk_size)
+
+    def preview(self, num_pris=None, max_samples=1 << 20):
+        """The first num_pris PRIs (default: one stagger cycle, at least two), capped at max_samples."""
+        if num_pris is None:
+            num_pris = max(2, len(self.pris))
+        cycle = np.resize(np.round(np.asarray(self.pris) * self.sample_rate), int(num_pris)) if self.pris else [0]
+        num_samples = min(int(np.sum(cycle)) or self.num_samples, self.num_samples, int(max_samples))
+        samples = np.empty(num_samples)
+        self.to_node().render(0, num_samples, samples)
+        return Waveform(samples, self.sample_rate)
+
+    def envelope_preview(self, max_points=20000, chunk_size=1 << 20):
+        """Every n-th sample of the whole train (decimated), for an overview plot of long trains."""
+        return self.to_node().stream(DecimatingSink(self.num_samples, self.sample_rate, max_points), chunk_size)
+
+    def __repr__(self):
+        return (f"PulseTrainPlan(pulses per cycle={len(self.pris)}, segments={len(self.segments)}, "
+                f"samples={self.num_samples}, ratio={self.compression_ratio:.1f}x)")
+
+
+class PulseTrainNode(Node):
+    """Renders [start, stop) of a PulseTrainPlan: zero-fill, then copy only the non-zero segments that overlap."""
+
+    def __init__(self, plan):
+        super().__init__(plan.num_samples, plan.sample_rate)
+        self.plan = plan
+        self.silent = [not np.any(segment) for segment in plan.segments]
+        self.layout = []  # (start, iteration length, loops, [(offset, segment, segment loops)])
+        position = 0
+        for entries, loops in plan.sequences:
+            offsets, offset = [], 0
+            for segment, segment_loops in entries:
+                offsets.append((offset, segment, segment_loops))
+                offset += len(plan.segments[segment]) * segment_loops
+            self.layout.append((position, offset, loops, offsets))
+            position += offset * loops
+
+    def render(self, start, stop, out):
+        out[:] = 0
+        for first, period, loops, offsets in self.layout:
+            low, high = max(start, first), min(stop, first + period * loops)
+            if low >= high or period == 0:
+                continue
+            for iteration in range((low - first) // period, (high - 1 - first) // period + 1):
+                base = first + iteration * period
+                for offset, segment, segment_loops in offsets:
+                    if self.silent[segment]:
+                        continue
+                    samples = self.plan.segments[segment]
+                    a = base + offset
+                    lo, hi = max(a, start), min(a + len(samples) * segment_loops, stop)
+                    if lo < hi:
+                        out[lo - start:hi - start] = np.take(samples, np.arange(lo - a, hi - a), mode="wrap")
+
+
+def pulse_train(pulse, pri, num_pulses, sample_rate=None, planner=None, idle_samples=None):
+    """
+    PulseTrainPlan playing num_pulses copies of pulse (a Waveform, or samples at sample_rate Hz). pri is one PRI
+    in seconds, or a list of them for a staggered train (cycled). The pulse segment is zero-padded to a legal
+    length; idle time is a zero segment of idle_samples (default: the shortest legal segment) looped as needed.
+    """
+    if isinstance(pulse, Waveform):
+        sample_rate = pulse.sample_rate if sample_rate is None else sample_rate
+        pulse = pulse.samples
+    if sample_rate is None:
+        raise ValueError("sample_rate is required when pulse is a plain array")
+    pulse = np.asarray(pulse)
+    sample_rate = float(sample_rate)
+    planner = planner or RecordLengthPlanner()
+    granularity, min_length = planner.granularity, planner.min_length
+    idle_unit = planner.align(idle_samples or min_length)
+
+    segments, index = [], {}
+
+    def segment(key, make):
+        if key not in index:
+            index[key] = len(segments)
+            segments.append(make())
+        return index[key]
+
+    pulse_length = planner.align(len(pulse))
+    padded = lambda extra: np.concatenate([pulse, np.zeros(pulse_length + extra - len(pulse), dtype=pulse.dtype)])
+
+    pris = np.atleast_1d(np.asarray(pri, dtype=np.float64))
+    periods, pattern = [], []
+    for value in pris:
+        period = max(granularity, int(round(value * sample_rate / granularity)) * granularity)
+        if period < pulse_length:
+            raise ValueError(f"PRI {value * 1e9:.6g} ns is shorter than the pulse segment "
+                             f"({pulse_length / sample_rate * 1e9:.6g} ns)")
+        idle = period - pulse_length
+        loops, remainder = divmod(idle, idle_unit)
+        if remainder and remainder < min_length and loops:
+            loops, remainder = loops - 1, remainder + idle_unit
+        if idle and idle < min_length:
+            # too short for a segment of its own: the pulse segment carries the idle time
+            entries = [(segment(("pulse", idle), lambda: padded(idle)), 1)]
+        else:
+            entries = [(segment(("pulse", 0), lambda: padded(0)), 1)]
+            if loops:
+                entries.append((segment(("zeros", idle_unit), lambda: np.zeros(idle_unit, dtype=pulse.dtype)), loops))
+            if remainder:
+                entries.append((segment(("zeros", remainder), lambda: np.zeros(remainder, dtype=pulse.dtype)), 1))
+        periods.append(period)
+        pattern.append(entries)
+
+    num_pulses = int(num_pulses)
+    cycles, extra = divmod(num_pulses, len(pattern))
+    sequences = []
+    if cycles:
+        sequences.append(([entry for entries in pattern for entry in entries], cycles))
+    if extra:
+        sequences.append(([entry for entries in pattern[:extra] for entry in entries], 1))
+    return PulseTrainPlan(segments, sequences, sample_rate, pris=[p / sample_rate for p in periods],
+                          pulse_samples=len(pulse))
@@ -0,0 +1,118 @@
+import math
+from fractions import Fraction
+
+import numpy as np
+
+from config_loader import load_config
+
+
+CONFIG = load_config()
+
+
+class RecordPlan:
+    """Planned segment: num_samples samples holding exactly `cycles` periods of `frequency` (Hz)."""
+
+    def __init__(self, num_samples, cycles, frequency, sampling_freq):
+        self.num_samples = int(num_samples)
+        self.cycles = int(cycles)
+        self.frequency = float(frequency)
+        self.sampling_freq = float(sampling_freq)
+
+    @property
+    def duration(self):
+        return self.num_samples / self.sampling_freq
+
+    def __repr__(self):
+        return (f"RecordPlan(num_samples={self.num_samples}, cycles={self.cycles}, "
+                f"frequency={self.frequency:.6g} Hz)")
+
+
+def simplest_fraction(low, high):
+    """Fraction with the smallest denominator in [low, high] (0 <= low <= high), by continued fractions."""
+    whole = math.floor(low)
+    if whole == low:
+        return Fraction(whole)
+    if whole + 1 <= high:
+        return Fraction(whole + 1)
+    return whole + 1 / simplest_fraction(1 / (high - whole), 1 / (low - whole))
+
+
+class RecordLengthPlanner:
+    """
+    Picks the shortest loopable record for a periodic waveform: the smallest sample count holding an integer
+    number of cycles that is also a multiple of the instrument's segment granularity and at least its
+    minimum segment length. Defaults come from the "segment" section of config.json.
+    """
+
+    def __init__(self, granularity=None, min_length=None, max_length=None, frequency_tolerance=None):
+        segment = CONFIG.get("segment", {})
+        self.granularity = int(granularity or segment.get("granularity", 1))
+        self.min_length = int(min_length or segment.get("min_length", 1))
+        self.max_length = int(max_length or segment.get("max_length", 2 ** 31))
+        # largest acceptable deviation (Hz) between the requested and the coherent frequency
+        if frequency_tolerance is None:
+            frequency_tolerance = segment.get("frequency_tolerance_hz", 1.0)
+        self.frequency_tolerance = float(frequency_tolerance)
+
+    def align(self, num_samples, multiple=1):
+        """Smallest length >= num_samples and >= min_length that is a multiple of both multiple and granularity."""
+        step = math.lcm(int(multiple), self.granularity)
+        needed = max(int(num_samples), self.min_length, 1)
+        return -(-needed // step) * step
+
+    def cycle_ratio(self, frequency, sampling_freq, min_samples=0):
+        """
+        cycles/samples for the shortest legal record (a multiple of granularity, at least min_samples and
+        min_length long) holding a whole number of cycles of a tone within frequency_tolerance of frequency;
+        of the cycle counts that fit that record, the one closest to frequency, so an exact ratio wins.
+        """
+        ratio = Fraction(frequency) / Fraction(sampling_freq)
+        tolerance = Fraction(self.frequency_tolerance) / Fraction(sampling_freq)
+        # in units of granularity-sized blocks: m blocks are legal when [m * low, m * high] holds an integer
+        low, high = (ratio - tolerance) * self.granularity, (ratio + tolerance) * self.granularity
+        if low <= 0:
+            raise ValueError(f"{frequency} Hz is within frequency_tolerance of DC")
+        first = -(-self.align(min_samples) // self.granularity)
+        unit = simplest_fraction(low, high).denominator  # every multiple of it is legal
+        blocks = -(-first // unit) * unit
+        if high > low and blocks > first:
+            # a shorter count between first and that multiple may hold a different fraction; floats find the
+            # candidates (at most 1 / (high - low) of them need checking), exact arithmetic confirms them
+            count = min(blocks - first, math.ceil(1 / (high - low)) + 1, 1 << 22)
+            m = first + np.arange(count, dtype=np.float64)
+            hits = np.flatnonzero(np.ceil(m * float(low) - 1e-9) <= np.floor(m * float(high) + 1e-9))
+            for hit in (first + hits).tolist():
+                if math.ceil(hit * low) <= math.floor(hit * high):
+                    blocks = hit
+                    break
+        cycles = min(max(round(blocks * ratio * self.granularity), math.ceil(blocks * low)), math.floor(blocks * high))
+        num_samples = blocks * self.granularity
+        if num_samples > self.max_length:
+            raise ValueError(f"No coherent record for {frequency} Hz at {sampling_freq} Hz within {self.max_length} samples")
+        return Fraction(cycles, num_samples)
+
+    def plan_tone(self, frequency, sampling_freq, min_samples=0):
+        """Shortest coherent record for a tone (frequency and sampling_freq in Hz)."""
+        ratio = self.cycle_ratio(frequency, sampling_freq, min_samples)
+        num_samples = self.align(min_samples, multiple=ratio.denominator)
+        if num_samples > self.max_length:
+            raise ValueError(f"Coherent record of {num_samples} samples exceeds max_length {self.max_length}")
+        cycles = ratio.numerator * (num_samples // ratio.denominator)
+        return RecordPlan(num_samples, cycles, float(ratio) * sampling_freq, sampling_freq)
+
+    def plan_repeats(self, period_samples):
+        """Number of whole periods of a period_samples-long pattern (e.g. one PRBS sequence) per record."""
+        num_samples = self.align(period_samples, multiple=period_samples)
+        return num_samples // int(period_samples)
+
+
+def coherent_tone(cycles, num_samples, amplitude=1.0):
+    """amplitude * sin(2*pi*cycles*n/num_samples) with the phase reduced exactly in integers; loops seamlessly."""
+    n = np.arange(num_samples, dtype=np.int64)
+    phase = (n * int(cycles)) % int(num_samples)
+    wave = phase.astype(np.float64)
+    wave *= 2 * np.pi / num_samples
+    np.sin(wave, out=wave)
+    if amplitude != 1.0:
+        wave *= amplitude
+    return wave
@@ -0,0 +1,172 @@
+import csv
+import glob
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import signal
+
+from config_loader import load_config
+from dac_codes import DACEncoder, write_dac_file
+from pulse_shaping import oversampling_ratio
+from spectral_metrics import METRICS_FILE, SPURS_FILE
+from Waveform import Waveform
+
+
+CONFIG = load_config()
+
+
+# Rational polyphase sample-rate conversion: upsample by up, low-pass, downsample by down in one upfirdn pass.
+# The Kaiser low-pass keeps the band below passband * min(input, output Nyquist) flat to within the stopband
+# ripple (10 ** (-stopband_db / 20)) and rejects images / aliases beyond that Nyquist by stopband_db.
+
+def design_taps(up, down, passband=0.9, stopband_db=80.0):
+    """Low-pass taps at the upsampled rate, gain up (so the output keeps the input level)."""
+    cutoff = 1.0 / max(int(up), int(down))  # fraction of the upsampled Nyquist
+    width = cutoff * (1 - passband)
+    numtaps, beta = signal.kaiserord(stopband_db, width)
+    numtaps |= 1  # odd: integer group delay
+    return signal.firwin(numtaps, cutoff * (1 + passband) / 2, window=("kaiser", beta)) * up
+
+
+class PolyphaseResampler:
+    """
+    Converts samples from input_rate to output_rate (Hz) with zero group delay: output sample m sits at time
+    m / output_rate, and N inputs give ceil(N * up / down) outputs.
+    resample() does a whole array; process() / flush() stream it in chunks of any size with bounded memory
+    and give the same samples. Samples are resampled along the last axis, so a 2-D batch is done row-wise.
+    """
+
+    def __init__(self, input_rate, output_rate, passband=0.9, stopband_db=80.0, max_denominator=1000):
+        self.input_rate = float(input_rate)
+        self.output_rate = float(output_rate)
+        self.up, self.down = oversampling_ratio(output_rate, input_rate, max_denominator) if output_rate >= input_rate \
+            else oversampling_ratio(input_rate, output_rate, max_denominator)[::-1]
+        self.taps = design_taps(self.up, self.down, passband, stopband_db)
+
+        # delay the filter so its group delay lands on a whole output sample, which is then skipped
+        delay = (len(self.taps) - 1) // 2
+        lag = (-delay) % self.down
+        self._taps = np.concatenate([np.zeros(lag), self.taps])
+        self._offset = (delay + lag) // self.down
+        # blocks starting on a multiple of _group inputs start on a whole output sample
+        self._group = self.down // math.gcd(self.up, self.down)
+        self.reset()
+
+    def reset(self):
+        history = -(-(len(self._taps) // self.up + 1) // self._group) * self._group
+        self._buffer = None
+        self._history = history
+        self._buffer_start = -history  # global index of the first buffered input (inputs before 0 are zeros)
+        self._consumed = 0
+        self._produced = 0
+
+    def _append(self, chunk):
+        chunk = np.asarray(chunk)
+        if self._buffer is None:
+            zeros = np.zeros(chunk.shape[:-1] + (self._history,), dtype=np.result_type(chunk, np.float64))
+            self._buffer = zeros
+        self._buffer = np.concatenate([self._buffer, chunk], axis=-1)
+
+    def _emit(self, stop):
+        """Outputs [produced, stop) from the buffered inputs; drops inputs no later output needs."""
+        start = self._produced
+        if stop <= start:
+            return self._buffer[..., :0]
+        first, last = start + self._offset, stop + self._offset  # indices into the delayed-filter output
+        k_min = (first * self.down - (len(self._taps) - 1)) // self.up
+        k_max = ((last - 1) * self.down) // self.up
+        k_start = max(self._buffer_start, (k_min // self._group) * self._group)
+
+        block = self._buffer[..., k_start - self._buffer_start:k_max + 1 - self._buffer_start]
+        base = k_start * self.up // self.down
+        out = signal.upfirdn(self._taps, block, self.up, self.down, axis=-1)[..., first - base:last - base]
+
+        self._produced = stop
+        next_min = ((stop + self._offset) * self.down - (len(self._taps) - 1)) // self.up
+        keep_from = max(self._buffer_start, (next_min // self._group) * self._group)
+        self._buffer = self._buffer[..., keep_from - self._buffer_start:]
+        self._buffer_start = keep_from
+        return out
+
+    def process(self, chunk):
+        """Feed the next input samples; returns every output sample they complete."""
+        self._append(chunk)
+        self._consumed += np.shape(chunk)[-1]
+        ready = (self._consumed * self.up - 1) // self.down - self._offset + 1
+        return self._emit(min(ready, -(-self._consumed * self.up // self.down)))
+
+    def flush(self):
+        """Remaining outputs, with zeros past the end of the input."""
+        total = -(-self._consumed * self.up // self.down)
+        needed = ((total - 1 + self._offset) * self.down) // self.up + 1
+        padding = max(0, needed - (self._buffer_start + self._buffer.shape[-1]))
+        self._buffer = np.concatenate([self._buffer, np.zeros(self._buffer.shape[:-1] + (padding,), self._buffer.dtype)], axis=-1)
+        out = self._emit(total)
+        self.reset()
+        return out
+
+    def resample(self, samples):
+        self.reset()
+        return np.concatenate([self.process(samples), self.flush()], axis=-1)
+
+    def resample_chunks(self, chunks):
+        """Generator form of process()/flush() over an iterable of input chunks."""
+        self.reset()
+        for chunk in chunks:
+            out = self.process(chunk)
+            if out.shape[-1]:
+                yield out
+        yield self.flush()
+
+
+def resample(waveform, output_rate, **kwargs):
+    """Waveform at output_rate (Hz); kwargs go to PolyphaseResampler (passband, stopband_db, max_denominator)."""
+    resampler = PolyphaseResampler(waveform.sample_rate, output_rate, **kwargs)
+    return Waveform(resampler.resample(waveform.samples), output_rate, waveform.start_time)
+
+
+# Batch retargeting of a saved sweep folder (the csv / bin files written by AWG_GUI_handler.save_waveform).
+# bin files are int16 DAC words and are streamed through the resampler from a memmap, chunk_size words at a time.
+
+def resample_file(in_path, out_path, resampler, chunk_size=1 << 20, encoder=None):
+    if in_path.lower().endswith(".bin"):
+        encoder = encoder or DACEncoder()
+        words = np.memmap(in_path, dtype="<i2", mode="r")
+        chunks = (encoder.decode(words[i:i + chunk_size]) for i in range(0, len(words), chunk_size))
+        with open(out_path, "wb") as file:
+            for out in resampler.resample_chunks(chunks):
+                write_dac_file(encoder.encode(out), file)
+        return out_path
+
+    samples = np.loadtxt(in_path, delimiter=",", skiprows=1, ndmin=2)
+    with open(in_path, newline="") as file:
+        header = next(csv.reader(file))
+    out = resampler.resample(samples.T).T
+    with open(out_path, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(out.tolist())
+    return out_path
+
+
+def resample_folder(folder, out_folder, input_rate, output_rate, max_workers=None, **kwargs):
+    """
+    Resample every csv / bin waveform in folder into out_folder (same file names); the metrics / spurs reports
+    saved alongside are skipped. Returns the written paths.
+    """
+    os.makedirs(out_folder, exist_ok=True)
+    paths = sorted(glob.glob(os.path.join(folder, "*.csv")) + glob.glob(os.path.join(folder, "*.bin")))
+    paths = [path for path in paths if os.path.basename(path) not in (METRICS_FILE, SPURS_FILE)]
+    output = CONFIG.get("output", {})
+    encoder = DACEncoder(dac_bits=output.get("dac_bits", 14), full_scale=output.get("full_scale", 1.0))
+    if max_workers is None:
+        max_workers = CONFIG.get("sweep", {}).get("max_workers")
+
+    def convert(path):
+        resampler = PolyphaseResampler(input_rate, output_rate, **kwargs)
+        return resample_file(path, os.path.join(out_folder, os.path.basename(path)), resampler, encoder=encoder)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(convert, paths))
@@ -0,0 +1,258 @@
+import csv
+import functools
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft as sp_fft
+from scipy import signal
+
+from config_loader import load_config
+from spectrum import spectrum_plan, spectrum_settings, group_by_length, watts_to_dbm, as_samples
+
+
+CONFIG = load_config()
+
+
+# Single-tone quality metrics for every point of a sweep, computed on the stacked power spectra (points x bins)
+# with array operations only, so a sweep costs one rfft plus a few passes over the spectra.
+# The fundamental is the strongest bin above DC, or the bin nearest a given frequency. Harmonics 2..num_harmonics+1
+# are placed at h * f0 folded into the first Nyquist zone. Powers are summed over window main lobes of the
+# energy-calibrated spectrum (tone-calibrated bins divided by the window's noise bandwidth), so tone and noise
+# powers are exact whatever the window. Noise is everything outside DC, the fundamental and harmonic lobes,
+# extrapolated over the excluded bins. Harmonic and spur levels are main-lobe sums as well, so every column shares
+# one calibration. Records shorter than num_harmonics + 2 main lobes of bins cannot separate DC, the fundamental
+# and its harmonics: their rows are NaN. Use a low-sidelobe window (blackmanharris, kaiser 14, the default from
+# config.json): a hann window leaks a non-coherent tone's sidelobes past its main lobe into the noise.
+#   SNR = P1 / N, THD = sum(Ph) / P1, SINAD = P1 / (N + sum(Ph)), ENOB = (SINAD - 1.76) / 6.02
+#   (SINAD referred to full_scale volts peak, when given), SFDR = P1 / power of the highest other peak's lobe.
+
+METRIC_COLUMNS = ("fundamental_hz", "fundamental_dbm", "sfdr_dbc", "spur_hz", "thd_dbc", "snr_db", "sinad_db",
+                  "enob", "noise_dbm_hz")
+# file names log_metrics writes next to a sweep's waveforms (not waveforms themselves)
+METRICS_FILE = "metrics.csv"
+SPURS_FILE = "spurs.csv"
+SPUR_FIELDS = [("frequency_hz", np.float64), ("dbc", np.float64), ("harmonic", np.int16)]
+
+
+@functools.lru_cache(maxsize=32)
+def main_lobe_bins(window):
+    """Half-width of the window's main lobe in DFT bins (1 rect, 2 hann, 4 blackmanharris)."""
+    oversample = 32
+    response = np.abs(sp_fft.rfft(signal.get_window(window, 256, fftbins=True), 256 * oversample))
+    rising = np.flatnonzero(np.diff(response) > 0)
+    return rising[0] / oversample if len(rising) else 1.0
+
+
+def fold(frequencies, sample_rate):
+    """Frequencies aliased into the first Nyquist zone [0, sample_rate / 2]."""
+    folded = np.mod(frequencies, sample_rate)
+    return np.where(folded > sample_rate / 2, sample_rate - folded, folded)
+
+
+def empty_spurs(points, num_spurs):
+    spurs = np.zeros((points, num_spurs), dtype=SPUR_FIELDS)
+    spurs["frequency_hz"] = spurs["dbc"] = np.nan
+    return spurs
+
+
+class MetricsTable:
+    """
+    Metrics of a sweep: one row per point (columns METRIC_COLUMNS, frequencies in Hz), harmonics_dbc
+    (points x num_harmonics, harmonic 2 first; NaN where a harmonic folds onto the fundamental) and spurs, a
+    points x num_spurs structured array (SPUR_FIELDS) of the highest peaks other than the fundamental, highest
+    first; harmonic is the harmonic order the spur sits on, 0 if none.
+    """
+
+    def __init__(self, columns, harmonics_dbc, spurs):
+        self.columns = columns
+        self.harmonics_dbc = harmonics_dbc
+        self.spurs = spurs
+
+    @classmethod
+    def empty(cls, points, num_harmonics, num_spurs):
+        columns = {name: np.full(points, np.nan) for name in METRIC_COLUMNS}
+        return cls(columns, np.full((points, num_harmonics), np.nan), empty_spurs(points, num_spurs))
+
+    def assign(self, indices, other):
+        for name in METRIC_COLUMNS:
+            self.columns[name][indices] = other.columns[name]
+        self.harmonics_dbc[indices] = other.harmonics_dbc
+        self.spurs[indices] = other.spurs
+
+    def __len__(self):
+        return len(self.columns["fundamental_hz"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def header(self):
+        harmonics = [f"h{h}_dbc" for h in range(2, self.harmonics_dbc.shape[1] + 2)]
+        return list(METRIC_COLUMNS) + harmonics
+
+    def features(self):
+        """points x len(header()) float array, for the error dataset."""
+        return np.column_stack([self.columns[name] for name in METRIC_COLUMNS] + [self.harmonics_dbc])
+
+    def rows(self, params=None):
+        """One dict per point, prefixed with params[i] (e.g. the sweep points) when given."""
+        header = self.header()
+        rows = []
+        for i, values in enumerate(self.features().tolist()):
+            row = dict(params[i]) if params is not None else {}
+            row.update(zip(header, values))
+            rows.append(row)
+        return rows
+
+    def spur_rows(self):
+        """(point, rank, frequency_hz, dbc, harmonic) for every listed spur."""
+        points, ranks = np.indices(self.spurs.shape)
+        return list(zip(points.ravel().tolist(), ranks.ravel().tolist(), self.spurs["frequency_hz"].ravel().tolist(),
+                        self.spurs["dbc"].ravel().tolist(), self.spurs["harmonic"].ravel().tolist()))
+
+    def save(self, file_path, params=None):
+        rows = self.rows(params)
+        with open(file_path, mode="w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0]) if rows else self.header())
+            writer.writeheader()
+            writer.writerows(rows)
+        return file_path
+
+    def save_spurs(self, file_path):
+        with open(file_path, mode="w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["point", "rank", "frequency_hz", "dbc", "harmonic"])
+            writer.writerows(self.spur_rows())
+        return file_path
+
+
+def _metrics_block(block, sample_rate, fundamentals, plan, impedance, num_harmonics, num_spurs, full_scale,
+                   workers):
+    power = plan.power(block, impedance, workers)  # W per bin, tone-calibrated
+    points, bins = power.shape
+    bin_hz = sample_rate / plan.num_fft
+    half = int(np.ceil(main_lobe_bins(plan.window_name) * plan.num_fft / plan.num_samples))
+    if bins < (num_harmonics + 2) * (2 * half + 1):
+        return MetricsTable.empty(points, num_harmonics, num_spurs)
+    offsets = np.arange(-half, half + 1)
+    rows = np.arange(points)[:, None]
+    # tone-calibrated -> energy-calibrated: divide lobe / band sums by the noise bandwidth in bins
+    window = plan.window
+    enbw = plan.num_fft * np.dot(window, window) / window.sum() ** 2
+
+    def lobe_mask(centres):
+        mask = np.zeros(power.shape, dtype=bool)
+        centres = np.asarray(centres).reshape(points, -1)
+        mask[rows, np.clip(centres[:, :, None] + offsets, 0, bins - 1).reshape(points, -1)] = True
+        return mask
+
+    dc = np.zeros(power.shape, dtype=bool)
+    dc[:, :half + 1] = True
+    above_dc = np.where(dc, 0.0, power)
+    if fundamentals is None:
+        k0 = above_dc.argmax(axis=1)
+    else:
+        guess = np.rint(fold(np.broadcast_to(np.asarray(fundamentals, dtype=np.float64), (points,)), sample_rate)
+                        / bin_hz).astype(np.int64)
+        candidates = np.clip(guess[:, None] + offsets, 0, bins - 1)
+        k0 = candidates[rows[:, 0], above_dc[rows, candidates].argmax(axis=1)]
+
+    fundamental = lobe_mask(k0)
+    lobe = np.where(fundamental, power, 0.0)
+    p1 = lobe.sum(axis=1) / enbw
+    f0 = (lobe @ np.arange(bins)) / np.maximum(lobe.sum(axis=1), np.finfo(float).tiny) * bin_hz
+
+    orders = np.arange(2, num_harmonics + 2)
+    harmonic_bins = np.rint(fold(f0[:, None] * orders, sample_rate) / bin_hz).astype(np.int64)
+    harmonic_bins = np.clip(harmonic_bins, 0, bins - 1)
+    harmonics = lobe_mask(harmonic_bins) & ~fundamental & ~dc if num_harmonics else np.zeros_like(dc)
+    harmonic_power = np.where(harmonics, power, 0.0).sum(axis=1) / enbw
+
+    # power of the main lobe centred on every bin, DC and the fundamental lobe left out
+    outside = np.cumsum(np.pad(np.where(dc | fundamental, 0.0, power), ((0, 0), (1, 0))), axis=1)
+    centres = np.arange(bins)
+    lobe_power = (outside[:, np.minimum(centres + half + 1, bins)] - outside[:, np.maximum(centres - half, 0)]) / enbw
+
+    on_fundamental = np.abs(harmonic_bins - k0[:, None]) <= 2 * half
+    harmonics_dbc = np.where(on_fundamental, np.nan,
+                             watts_to_dbm(lobe_power[rows, harmonic_bins]) - watts_to_dbm(p1)[:, None])
+
+    noise_bins = ~(dc | fundamental | harmonics)
+    counted = np.maximum(noise_bins.sum(axis=1), 1)
+    noise = np.where(noise_bins, power, 0.0).sum(axis=1) / enbw * (bins / counted)
+
+    # spurs: bins outside DC and the fundamental lobe that are the highest within a main lobe (so a spur's own
+    # sidelobes are not listed again), ranked by the power of their lobes; on a spectrum falling away from the
+    # fundamental with no such bin, the strongest lobe stands in
+    padded = np.pad(power, ((0, 0), (half, half)))
+    peaks = (power > 0) & (power >= sliding_window_view(padded, 2 * half + 1, axis=1).max(axis=2)) & ~(dc | fundamental)
+    other = np.where(dc | fundamental, 0.0, lobe_power)
+    bare = np.flatnonzero(~peaks.any(axis=1))
+    peaks[bare, other[bare].argmax(axis=1)] = True
+    spur_power = np.where(peaks, other, 0.0)
+    count = min(max(num_spurs, 1), bins)
+    top = np.argpartition(-spur_power, count - 1, axis=1)[:, :count]
+    top = np.take_along_axis(top, np.argsort(-spur_power[rows, top], axis=1), axis=1)
+    worst = spur_power[rows[:, 0], top[:, 0]]
+
+    spurs = empty_spurs(points, num_spurs)
+    listed = top[:, :num_spurs]  # narrower than num_spurs on very short records; the rest stay NaN
+    shown = spurs[:, :listed.shape[1]]
+    shown["frequency_hz"] = listed * bin_hz
+    shown["dbc"] = watts_to_dbm(spur_power[rows, listed]) - watts_to_dbm(p1)[:, None]
+    distance = np.abs(listed[:, :, None] - harmonic_bins[:, None, :])
+    near = (distance <= half) & ~on_fundamental[:, None, :]
+    shown["harmonic"] = np.where(near.any(axis=2), orders[near.argmax(axis=2)], 0) if num_harmonics else 0
+    shown[spur_power[rows, listed] == 0] = (np.nan, np.nan, 0)  # fewer peaks than requested
+
+    ratio = lambda a, b: 10 * np.log10(np.maximum(a, 1e-300) / np.maximum(b, 1e-300))
+    sinad = ratio(p1, noise + harmonic_power)
+    headroom = 0.0
+    if full_scale is not None:
+        headroom = 20 * np.log10(full_scale / np.maximum(np.sqrt(2 * impedance * p1), 1e-300))
+    columns = {
+        "fundamental_hz": f0,
+        "fundamental_dbm": watts_to_dbm(p1),
+        "sfdr_dbc": np.where(worst > 0, ratio(p1, worst), np.nan),
+        "spur_hz": top[:, 0] * bin_hz,
+        "thd_dbc": ratio(harmonic_power, p1) if num_harmonics else np.full(points, np.nan),
+        "snr_db": ratio(p1, noise),
+        "sinad_db": sinad,
+        "enob": (sinad + headroom - 1.76) / 6.02,
+        "noise_dbm_hz": watts_to_dbm(noise / (sample_rate / 2)),
+    }
+    return MetricsTable(columns, harmonics_dbc, spurs)
+
+
+def spectral_metrics(waves, sample_rate=None, fundamentals=None, window=None, pad=None, impedance=None,
+                     num_harmonics=None, num_spurs=None, full_scale=None, workers=None):
+    """
+    MetricsTable of a sweep: a stacked Waveform / array (points x samples) or a list of records, grouped by
+    length and sample rate like power_spectra. fundamentals (Hz, scalar or one per point) pins the fundamental
+    to the strongest bin within a main lobe of it; None takes the strongest bin above DC. Unset options come
+    from the "metrics" section of config.json, then the "spectrum" section.
+    """
+    config = CONFIG.get("metrics", {})
+    window = config.get("window") if window is None else window
+    pad = config.get("pad") if pad is None else pad
+    window, pad, impedance, workers = spectrum_settings(window, pad, impedance, workers)
+    num_harmonics = int(config.get("num_harmonics", 5) if num_harmonics is None else num_harmonics)
+    num_spurs = int(config.get("num_spurs", 5) if num_spurs is None else num_spurs)
+    full_scale = config.get("full_scale") if full_scale is None else full_scale
+    options = (impedance, num_harmonics, num_spurs, full_scale, workers)
+
+    if hasattr(waves, "sample_rate") or isinstance(waves, np.ndarray):
+        block, rate = as_samples(waves, sample_rate)
+        block = np.atleast_2d(block)
+        plan = spectrum_plan(block.shape[-1], window, pad)
+        return _metrics_block(block, rate, fundamentals, plan, *options)
+
+    waves = list(waves)
+    table = MetricsTable.empty(len(waves), num_harmonics, num_spurs)
+    if fundamentals is not None:
+        fundamentals = np.broadcast_to(np.asarray(fundamentals, dtype=np.float64), (len(waves),))
+    for (length, rate), indices in group_by_length(waves, sample_rate).items():
+        block = np.stack([as_samples(waves[i], sample_rate)[0] for i in indices])
+        plan = spectrum_plan(length, window, pad)
+        hint = None if fundamentals is None else fundamentals[indices]
+        table.assign(indices, _metrics_block(block, rate, hint, plan, *options))
+    return table
@@ -0,0 +1,131 @@
+import functools
+
+import numpy as np
+from scipy import fft as sp_fft
+from scipy import signal
+
+from config_loader import load_config
+
+
+CONFIG = load_config()
+
+
+# One-sided power spectra of real waveforms. Samples are volts; power is what the waveform would deliver into
+# `impedance` ohms, in dBm, scaled so a sinusoid of amplitude A reads A^2 / (2 R) at its bin (window coherent gain
+# removed). Records are zero-padded to scipy's next fast real-FFT length unless pad=False, and the window,
+# padded length and per-bin scaling for each (length, window, pad) are built once and reused (SpectrumPlan).
+
+WINDOW_ALIASES = {"rect": "boxcar", "rectangular": "boxcar", "none": "boxcar"}
+MIN_WATTS = 1e-30  # floor before the log: an exact zero bin reads -270 dBm instead of -inf
+
+
+def _window_key(window):
+    if isinstance(window, list):
+        window = tuple(window)  # e.g. ["kaiser", 14] from config.json
+    return WINDOW_ALIASES.get(window, window) if isinstance(window, str) else window
+
+
+class SpectrumPlan:
+    """Window, FFT length and bin scaling for records of num_samples samples."""
+
+    def __init__(self, num_samples, window="hann", pad=True):
+        self.num_samples = int(num_samples)
+        self.window_name = window
+        self.num_fft = sp_fft.next_fast_len(self.num_samples, real=True) if pad else self.num_samples
+        self.window = signal.get_window(window, self.num_samples, fftbins=True)
+        self.window.setflags(write=False)
+        # |X|^2 -> sinusoid power: (2 |X| / sum(w))^2 / 2 off DC and Nyquist, (|X| / sum(w))^2 on them
+        scale = np.full(self.num_fft // 2 + 1, 2.0 / self.window.sum() ** 2)
+        scale[0] /= 2
+        if self.num_fft % 2 == 0:
+            scale[-1] /= 2
+        self.scale = scale
+        self.scale.setflags(write=False)
+
+    def frequencies(self, sample_rate):
+        """Bin frequencies (Hz)."""
+        return sp_fft.rfftfreq(self.num_fft, 1.0 / float(sample_rate))
+
+    def transform(self, samples, workers=None):
+        """Windowed rfft along the last axis (leading axes are independent records)."""
+        return sp_fft.rfft(np.asarray(samples) * self.window, n=self.num_fft, axis=-1, workers=workers)
+
+    def power(self, samples, impedance=50.0, workers=None):
+        """Power per bin (W) into impedance ohms."""
+        spectrum = self.transform(samples, workers)
+        return (spectrum.real ** 2 + spectrum.imag ** 2) * (self.scale / float(impedance))
+
+
+@functools.lru_cache(maxsize=64)
+def _cached_plan(num_samples, window, pad):
+    return SpectrumPlan(num_samples, window, pad)
+
+
+def spectrum_plan(num_samples, window="hann", pad=True):
+    """Shared SpectrumPlan for this record length, window and padding."""
+    return _cached_plan(int(num_samples), _window_key(window), bool(pad))
+
+
+def watts_to_dbm(watts):
+    return 10.0 * np.log10(np.maximum(watts, MIN_WATTS) / 1e-3)
+
+
+def spectrum_settings(window, pad, impedance, workers):
+    """Fill unset analysis options from the "spectrum" section of config.json."""
+    config = CONFIG.get("spectrum", {})
+    return (config.get("window", "hann") if window is None else window,
+            config.get("pad", True) if pad is None else pad,
+            config.get("impedance", 50.0) if impedance is None else impedance,
+            config.get("workers") if workers is None else workers)
+
+
+def as_samples(samples, sample_rate):
+    if hasattr(samples, "sample_rate"):
+        sample_rate, samples = samples.sample_rate, samples.samples
+    if sample_rate is None:
+        raise ValueError("sample_rate is required for plain sample arrays")
+    return np.asarray(samples), float(sample_rate)
+
+
+def power_spectrum(samples, sample_rate=None, window=None, pad=None, impedance=None, workers=None):
+    """
+    (frequencies in Hz, power in dBm) of a real waveform (Waveform or samples at sample_rate Hz).
+    None takes window / pad / impedance / workers (scipy.fft threads) from the "spectrum" section of config.json.
+    """
+    window, pad, impedance, workers = spectrum_settings(window, pad, impedance, workers)
+    samples, sample_rate = as_samples(samples, sample_rate)
+    plan = spectrum_plan(samples.shape[-1], window, pad)
+    return plan.frequencies(sample_rate), watts_to_dbm(plan.power(samples, impedance, workers))
+
+
+def group_by_length(waves, sample_rate=None):
+    """{(num_samples, sample_rate): [indices]} of a list of 1-D Waveforms / arrays, in first-seen order."""
+    groups = {}
+    for index, wave in enumerate(waves):
+        samples, rate = as_samples(wave, sample_rate)
+        groups.setdefault((samples.shape[-1], rate), []).append(index)
+    return groups
+
+
+def power_spectra(waves, sample_rate=None, window=None, pad=None, impedance=None, workers=None):
+    """
+    power_spectrum of every point of a sweep, as [(frequencies, dBm)] in input order. A stacked sweep (Waveform or
+    array of points x samples) is one rfft over the last axis; a ragged list of records is grouped by length and
+    sample rate, each group stacked and transformed at once with its shared window and plan. Rows of one group
+    share a single frequency array.
+    """
+    window, pad, impedance, workers = spectrum_settings(window, pad, impedance, workers)
+    if hasattr(waves, "sample_rate") or isinstance(waves, np.ndarray):
+        block, rate = as_samples(waves, sample_rate)
+        block = np.atleast_2d(block)
+        plan = spectrum_plan(block.shape[-1], window, pad)
+        frequencies = plan.frequencies(rate)
+        return [(frequencies, row) for row in watts_to_dbm(plan.power(block, impedance, workers))]
+
+    waves = list(waves)
+    spectra = [None] * len(waves)
+    for (length, rate), indices in group_by_length(waves, sample_rate).items():
+        block = np.stack([as_samples(waves[i], sample_rate)[0] for i in indices])
+        for i, spectrum in zip(indices, power_spectra(block, rate, window, pad, impedance, workers)):
+            spectra[i] = spectrum
+    return spectra
@@ -0,0 +1,66 @@
+import numpy as np
+
+
+# Stepped-frequency synthesis without a Python loop over steps.
+# Step k holds frequency f[k] (Hz) for counts[k] samples. The phase each step starts from is the cumulative
+# sum of the phase advanced by all earlier steps (mod 1 cycle), so the tone is continuous across step edges.
+
+def stepped_frequency_phase(frequencies, counts, sampling_freq):
+    """Per-sample phase in cycles, built with np.repeat over steps."""
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.int64)
+    cycles_per_sample = frequencies / sampling_freq
+
+    step_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    advance = np.mod(cycles_per_sample * counts, 1.0)
+    start_phase = np.mod(np.concatenate(([0.0], np.cumsum(advance)[:-1])), 1.0)
+
+    phase = np.arange(int(counts.sum()), dtype=np.float64)
+    phase -= np.repeat(step_starts, counts)            # sample index within its step
+    phase *= np.repeat(cycles_per_sample, counts)
+    phase += np.repeat(start_phase, counts)
+    return phase
+
+
+def stepped_frequency_tone(frequencies, counts, sampling_freq, amplitude=1.0):
+    """amplitude * sin(phase) of the stepped-frequency phase, computed in place."""
+    wave = stepped_frequency_phase(frequencies, counts, sampling_freq)
+    wave *= 2 * np.pi
+    np.sin(wave, out=wave)
+    if amplitude != 1.0:
+        wave *= amplitude
+    return wave
+
+
+def stepped_frequency_chunk_kernel(frequencies, counts, sampling_freq, amplitude=1.0):
+    """
+    Chunk kernel(start, stop, out) (see chunked_synthesis) of stepped_frequency_tone: the phase of each sample
+    comes from its step's start phase, so any chunk is computed on its own and only per-step tables are kept.
+    """
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.int64)
+    cycles_per_sample = frequencies / sampling_freq
+    step_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    advance = np.mod(cycles_per_sample * counts, 1.0)
+    start_phase = np.mod(np.concatenate(([0.0], np.cumsum(advance)[:-1])), 1.0)
+    step_starts = step_starts[counts > 0]  # an empty step never owns a sample
+    cycles_per_sample, start_phase = cycles_per_sample[counts > 0], start_phase[counts > 0]
+
+    def kernel(start, stop, out):
+        step = np.searchsorted(step_starts, np.arange(start, stop), side="right") - 1
+        phase = np.arange(start, stop, dtype=np.float64)
+        phase -= step_starts[step]
+        phase *= cycles_per_sample[step]
+        phase += start_phase[step]
+        phase *= 2 * np.pi
+        np.sin(phase, out=phase)
+        if amplitude != 1.0:
+            phase *= amplitude
+        out[:] = phase
+    return kernel
+
+
+def step_frequencies(start_freq, stop_freq, step_freq):
+    """start, start + step, ... up to and including stop (with a small tolerance for float steps)."""
+    num_steps = int(np.floor((stop_freq - start_freq) / step_freq + 1e-9)) + 1
+    return start_freq + step_freq * np.arange(max(num_steps, 0))
@@ -0,0 +1,222 @@
+import itertools
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from dac_codes import DACEncoder
+from spectrum import spectrum_plan, spectrum_settings, watts_to_dbm
+from waveform_graph import Node
+
+
+# Spectra of waveforms too long to transform in one piece. Samples arrive as chunks of any size (Node.stream,
+# Waveform.iter_chunks, memory-mapped .bin files, csv files) and are cut into overlapping windowed segments of
+# segment_length; only the last partial segment is carried between chunks, so state is O(segment_length)
+# whatever the record length. WelchPSD averages segment powers (Welch's method); Spectrogram keeps them as rows
+# of a time-frequency map, merging neighbouring rows pairwise whenever it would exceed max_rows.
+# Both are waveform_graph sinks: node.stream(WelchPSD(...)) returns the finished estimator.
+# Scaling follows spectrum.py: spectrum() reads a sinusoid of amplitude A as A^2 / (2 R) in dBm at its bin,
+# psd() is the density in dBm/Hz (scipy.signal.welch with scaling="density", detrend=False, divided by R).
+
+MAX_BLOCK_BYTES = 64 << 20  # segments transformed per rfft call are capped at this much complex output
+
+
+class _SegmentStream:
+    """Cuts chunks into segments of segment_length every hop samples, carrying at most one partial segment."""
+
+    def __init__(self, sample_rate, segment_length, overlap, window, impedance, workers):
+        window, _, impedance, workers = spectrum_settings(window, False, impedance, workers)
+        self.sample_rate = float(sample_rate)
+        self.segment_length = int(segment_length)
+        if not 0 <= overlap < 1:
+            raise ValueError(f"overlap must be in [0, 1), got {overlap}")
+        self.hop = max(1, int(round(self.segment_length * (1 - overlap))))
+        self.plan = spectrum_plan(self.segment_length, window, pad=False)
+        self.impedance = float(impedance)
+        self.workers = workers
+        self.block = max(1, MAX_BLOCK_BYTES // (16 * len(self.plan.scale)))
+        self.num_samples = 0
+        self.num_segments = 0
+        self._tail = np.empty(0)
+
+    @property
+    def frequencies(self):
+        return self.plan.frequencies(self.sample_rate)
+
+    def update(self, chunk):
+        """Feed the next samples of the record; returns self."""
+        chunk = np.asarray(chunk, dtype=np.float64).reshape(-1)
+        self.num_samples += len(chunk)
+        data = np.concatenate([self._tail, chunk])
+        count = (len(data) - self.segment_length) // self.hop + 1 if len(data) >= self.segment_length else 0
+        if count:
+            segments = sliding_window_view(data, self.segment_length)[::self.hop][:count]
+            for first in range(0, count, self.block):
+                block = segments[first:first + self.block]
+                self._accumulate(self.plan.power(block, self.impedance, self.workers))
+            self.num_segments += count
+        self._tail = data[count * self.hop:].copy()
+        return self
+
+    def consume(self, chunks):
+        for chunk in chunks:
+            self.update(chunk)
+        return self
+
+    # waveform_graph sink protocol
+    def write(self, start, chunk):
+        self.update(chunk)
+
+    def close(self):
+        return self
+
+    def _accumulate(self, powers):
+        raise NotImplementedError
+
+
+class WelchPSD(_SegmentStream):
+    """Running Welch average of segment power spectra; memory is one segment plus one spectrum."""
+
+    def __init__(self, sample_rate, segment_length=4096, overlap=0.5, window=None, impedance=None, workers=None):
+        super().__init__(sample_rate, segment_length, overlap, window, impedance, workers)
+        self._sum = np.zeros(len(self.plan.scale))
+
+    def _accumulate(self, powers):
+        self._sum += powers.sum(axis=0)
+
+    def power(self):
+        """Mean power per bin (W), sinusoid-calibrated."""
+        if not self.num_segments:
+            raise ValueError(f"Need at least {self.segment_length} samples for one segment, "
+                             f"got {self.num_samples}")
+        return self._sum / self.num_segments
+
+    def spectrum(self):
+        """(frequencies in Hz, averaged power in dBm per bin)."""
+        return self.frequencies, watts_to_dbm(self.power())
+
+    def psd(self):
+        """(frequencies in Hz, power spectral density in dBm/Hz)."""
+        window = self.plan.window
+        # sinusoid scale sum(w)^2 -> noise scale fs * sum(w^2)
+        density = self.power() * window.sum() ** 2 / (self.sample_rate * np.dot(window, window))
+        return self.frequencies, watts_to_dbm(density)
+
+
+class Spectrogram(_SegmentStream):
+    """
+    Time-frequency map with at most max_rows rows. Each row is the mean power of `factor` consecutive segments;
+    factor starts at 1 and doubles (neighbouring rows summed pairwise) whenever the rows would exceed max_rows,
+    so a record of any length ends with between max_rows / 2 and max_rows rows.
+    """
+
+    def __init__(self, sample_rate, segment_length=1024, overlap=0.5, window=None, impedance=None, max_rows=512,
+                 workers=None):
+        super().__init__(sample_rate, segment_length, overlap, window, impedance, workers)
+        self.max_rows = max(2, int(max_rows))
+        self.factor = 1
+        self._rows = []  # summed power of factor segments each
+        self._partial = np.zeros(len(self.plan.scale))
+        self._partial_count = 0
+
+    def _accumulate(self, powers):
+        position = 0
+        while position < len(powers):
+            if self._partial_count:
+                take = powers[position:position + self.factor - self._partial_count]
+                self._partial += take.sum(axis=0)
+                self._partial_count += len(take)
+                position += len(take)
+                if self._partial_count == self.factor:
+                    self._rows.append(self._partial)
+                    self._partial, self._partial_count = np.zeros_like(self._partial), 0
+            else:
+                whole = (len(powers) - position) // self.factor
+                if whole:
+                    fit = max(1, min(whole, self.max_rows - len(self._rows)))
+                    stop = position + fit * self.factor
+                    rows = powers[position:stop].reshape(fit, self.factor, -1).sum(axis=1)
+                    self._rows.extend(rows)
+                    position = stop
+                else:
+                    self._partial = powers[position:].sum(axis=0)
+                    self._partial_count = len(powers) - position
+                    position = len(powers)
+            if len(self._rows) >= self.max_rows:
+                self._merge()
+
+    def _merge(self):
+        """Halve the row count: sum neighbouring rows; an odd last row goes back into the partial row."""
+        if len(self._rows) % 2:
+            self._partial = self._partial + self._rows.pop()
+            self._partial_count += self.factor
+        rows = np.asarray(self._rows)
+        self._rows = list(rows.reshape(len(rows) // 2, 2, -1).sum(axis=1))
+        self.factor *= 2
+
+    def result(self):
+        """(row centre times in s, frequencies in Hz, rows x bins power in dBm per bin)."""
+        rows = [row / self.factor for row in self._rows]
+        counts = [self.factor] * len(rows)
+        if self._partial_count:
+            rows.append(self._partial / self._partial_count)
+            counts.append(self._partial_count)
+        first = self.factor * np.arange(len(rows))
+        # row r averages segments first .. first + count - 1; segment k spans samples k * hop .. k * hop + length
+        centres = (first * self.hop + ((np.asarray(counts) - 1) * self.hop + self.segment_length) / 2)
+        power = np.asarray(rows) if rows else np.empty((0, len(self.plan.scale)))
+        return centres / self.sample_rate, self.frequencies, watts_to_dbm(power)
+
+
+def file_chunks(file_path, chunk_size=1 << 20, encoder=None):
+    """Samples of a saved waveform file, chunk by chunk: .bin DAC words (memory-mapped) or csv (first column)."""
+    chunk_size = int(chunk_size)
+    if file_path.lower().endswith(".bin"):
+        encoder = encoder or DACEncoder()
+        words = np.memmap(file_path, dtype="<i2", mode="r")
+        for start in range(0, len(words), chunk_size):
+            yield encoder.decode(words[start:start + chunk_size])
+        return
+    with open(file_path, newline="") as file:
+        next(file)  # header
+        while True:
+            lines = list(itertools.islice(file, chunk_size))
+            if not lines:
+                return
+            yield np.loadtxt(lines, delimiter=",", ndmin=2)[:, 0]
+
+
+def source_chunks(source, chunk_size=1 << 20, sample_rate=None, encoder=None):
+    """
+    (chunk iterator, sample rate) for a Waveform, waveform_graph Node, array / memmap, file path or an iterable
+    of sample chunks. Plain arrays, files and iterables need sample_rate (Hz).
+    """
+    chunk_size = int(chunk_size)
+    if isinstance(source, Node):
+        def rendered():
+            buffer = np.empty(min(chunk_size, max(1, source.num_samples)))
+            for start in range(0, source.num_samples, chunk_size):
+                stop = min(start + chunk_size, source.num_samples)
+                source.render(start, stop, buffer[:stop - start])
+                yield buffer[:stop - start]
+        return rendered(), source.sample_rate
+    if hasattr(source, "sample_rate"):
+        return (chunk for _, chunk in source.iter_chunks(chunk_size)), source.sample_rate
+    if sample_rate is None:
+        raise ValueError("sample_rate is required unless source is a Waveform or a Node")
+    if isinstance(source, str):
+        return file_chunks(source, chunk_size, encoder), float(sample_rate)
+    if isinstance(source, np.ndarray):
+        return (source[start:start + chunk_size] for start in range(0, len(source), chunk_size)), float(sample_rate)
+    return iter(source), float(sample_rate)
+
+
+def welch_psd(source, sample_rate=None, segment_length=4096, chunk_size=1 << 20, encoder=None, **kwargs):
+    """WelchPSD of a whole source (see source_chunks), read chunk by chunk."""
+    chunks, sample_rate = source_chunks(source, chunk_size, sample_rate, encoder)
+    return WelchPSD(sample_rate, segment_length, **kwargs).consume(chunks)
+
+
+def spectrogram(source, sample_rate=None, segment_length=1024, chunk_size=1 << 20, encoder=None, **kwargs):
+    """Spectrogram of a whole source (see source_chunks), read chunk by chunk; returns its result()."""
+    chunks, sample_rate = source_chunks(source, chunk_size, sample_rate, encoder)
+    return Spectrogram(sample_rate, segment_length, **kwargs).consume(chunks).result()
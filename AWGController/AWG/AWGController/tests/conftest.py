@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the package modules import each other flat (from Waveform import Waveform), so put their folder on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,46 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from CombinedWaveformGenerator import CombinedWaveformGenerator
+
+
+STEPLFM = {"start_freq": 0.1, "stop_freq": 0.5, "step_freq": 0.05, "dwell_time": 10}
+
+
+class _Sum:
+    """waveform_graph sink keeping only a running sum."""
+
+    def __init__(self):
+        self.total = 0.0
+
+    def write(self, start, chunk):
+        self.total += float(chunk.sum())
+
+    def close(self):
+        return self.total
+
+
+@pytest.mark.parametrize("method, kwargs", [("generate_steplfm", STEPLFM),
+                                            ("generate_noise", {"variance": 0.5, "seed": 7})])
+def test_lazy_matches_generator(method, kwargs):
+    generator = CombinedWaveformGenerator()
+    num_samples = (1 << 20) + 12345  # crosses a noise block boundary
+    expected = getattr(generator, method)(num_samples=num_samples, **kwargs).samples
+    node = generator.lazy(method, num_samples, **kwargs)
+    np.testing.assert_array_equal(node.to_array(chunk_size=100_000, max_workers=1), expected)
+
+
+def test_lazy_components_stream_in_bounded_memory():
+    generator = CombinedWaveformGenerator()
+    num_samples = 1 << 23  # 64 MiB per full-length float64 component
+    tracemalloc.start()
+    try:
+        node = (generator.lazy("generate_steplfm", num_samples, **STEPLFM)
+                + generator.lazy("generate_noise", num_samples, variance=0.1, seed=1))
+        node.stream(_Sum(), chunk_size=1 << 16)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < num_samples * 8 / 4
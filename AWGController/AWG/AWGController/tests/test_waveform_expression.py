@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+import waveform_expression
+from waveform_expression import ExpressionError, compile_expression
+
+
+ENGINES = [False] + ([True] if waveform_expression.numexpr is not None else [])
+
+
+@pytest.mark.parametrize("use_numexpr", ENGINES)
+def test_where_with_numeric_condition(use_numexpr):
+    node = compile_expression("where(sin(2*pi*1e6*t), 1, 0)", 1000, 7.2e9, use_numexpr=use_numexpr)
+    out = np.empty(1000)
+    node.render(0, 1000, out)
+    t = np.arange(1000) / 7.2e9
+    np.testing.assert_array_equal(out, np.where(np.sin(2 * np.pi * 1e6 * t) != 0, 1.0, 0.0))
+
+
+@pytest.mark.parametrize("text", ["1e400*t", "log(0) + t"])
+def test_non_finite_constant_rejected(text):
+    with pytest.raises(ExpressionError):
+        compile_expression(text, 100, 7.2e9)
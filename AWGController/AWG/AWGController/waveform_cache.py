@@ -0,0 +1,364 @@
+import hashlib
+import inspect
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from config_loader import load_config
+from Waveform import Waveform
+
+
+CONFIG = load_config()
+
+
+# Content-addressed cache of generated waveforms. A call such as generator.sinusoidal(frequency=1.2) is keyed by
+# a SHA-256 of its canonical form: generator class, its CACHE_VERSION, method name, every argument after binding
+# (defaults applied, so positional / keyword / omitted spellings agree) and the config.json sections generation
+# reads. Results live in an in-memory LRU tier bounded in bytes and, when a directory is configured, in an
+# on-disk tier of .npy files that are memory-mapped back on a hit, so a rerun of yesterday's sweep generates
+# nothing. Cached samples are read-only: derive new arrays from them rather than modifying them in place.
+
+# arguments that change how samples are computed, not which samples come out
+EXECUTION_PARAMS = frozenset({"chunk_size", "max_workers"})
+# config.json sections read by the generators
+CONFIG_SECTIONS = ("synthesis", "nco", "prbs", "noise", "segment")
+
+
+def _unseeded_noise(args):
+    return args.get("seed") is None and CONFIG.get("noise", {}).get("seed") is None
+
+
+def _unseeded_dither(args):
+    # WaveformGenerator tones / chirps on the NCO engine; dither and its seed come from config.json "nco"
+    if "engine" not in args or (args["engine"] or CONFIG.get("synthesis", {}).get("engine", "float")) != "nco":
+        return False
+    nco = CONFIG.get("nco", {})
+    return bool(nco.get("dither", False)) and nco.get("seed") is None
+
+
+# method -> predicate on the bound arguments, True when the call draws fresh entropy and must not be cached
+RANDOM_CALLS = {
+    "noise": _unseeded_noise,
+    "generate_noise": lambda args: args.get("seed") is None,
+    "PRBS": lambda args: args.get("seed") is None,
+    "PRBS_batch": lambda args: args.get("seed") is None,
+    "sinusoidal": _unseeded_dither,
+    "generate_lfm": _unseeded_dither,
+    "multitone": lambda args: args.get("seed") is None and isinstance(args.get("phases"), str)
+                              and args.get("phases") == "random",
+}
+
+
+def canonical(value):
+    """JSON-serialisable form of an argument; equal arguments give equal forms. Raises TypeError if unhashable."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value  # 7 and 7.0 generate the same samples
+    if isinstance(value, complex):
+        return {"complex": [canonical(value.real), canonical(value.imag)]}
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, dict):
+        return {str(k): canonical(v) for k, v in value.items()}
+    if isinstance(value, np.ndarray):
+        if value.dtype == object or value.size <= 4096:  # small arrays match the equal list
+            return canonical(value.tolist())
+        digest = hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()
+        return {"array": value.dtype.str, "shape": list(value.shape), "sha256": digest}
+    if isinstance(value, np.dtype) or (isinstance(value, type) and issubclass(value, np.generic)):
+        return {"dtype": np.dtype(value).str}
+    if hasattr(value, "cache_key"):
+        return {type(value).__name__: canonical(value.cache_key())}
+    raise TypeError(f"Cannot build a cache key from a {type(value).__name__} argument")
+
+
+def cache_key(generator, method, arguments):
+    """Hex digest identifying generator.method(**arguments)."""
+    params = {name: canonical(value) for name, value in arguments.items() if name not in EXECUTION_PARAMS}
+    if params.get("dtype") is not None and isinstance(params["dtype"], str):
+        params["dtype"] = {"dtype": np.dtype(params["dtype"]).str}
+    settings = {section: {k: v for k, v in CONFIG.get(section, {}).items() if k not in EXECUTION_PARAMS}
+                for section in CONFIG_SECTIONS}
+    payload = {
+        "generator": type(generator).__name__,
+        "version": getattr(generator, "CACHE_VERSION", 0),
+        "method": method,
+        "params": params,
+        "config": canonical(settings),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def _pack(result):
+    """(flat samples, metadata) for a Waveform or a list of Waveforms of one dtype; None for anything else."""
+    single = isinstance(result, Waveform)
+    waves = [result] if single else result
+    if not isinstance(waves, list) or not waves or not all(isinstance(w, Waveform) for w in waves):
+        return None
+    samples = [np.asarray(w.samples) for w in waves]
+    if len({s.dtype for s in samples}) != 1 or samples[0].dtype == object:
+        return None
+    meta = {
+        "single": single,
+        "items": [{"shape": list(s.shape), "sample_rate": w.sample_rate, "start_time": w.start_time}
+                  for s, w in zip(samples, waves)],
+    }
+    flat = samples[0].reshape(-1) if single else np.concatenate([s.reshape(-1) for s in samples])
+    return flat, meta
+
+
+def _unpack(flat, meta):
+    """Waveform(s) viewing flat (no copy)."""
+    waves, offset = [], 0
+    for item in meta["items"]:
+        size = int(np.prod(item["shape"], dtype=np.int64))
+        samples = flat[offset:offset + size].reshape(item["shape"])
+        waves.append(Waveform(samples, item["sample_rate"], item["start_time"]))
+        offset += size
+    return waves[0] if meta["single"] else waves
+
+
+class WaveformCache:
+    """
+    Two-tier LRU store of generated waveforms by cache key: up to max_bytes of samples in memory and, if
+    directory is given, up to max_disk_bytes of .npy files there (the least recently used go first).
+    Safe to share between threads; stats() reports hits, misses and tier sizes.
+    """
+
+    def __init__(self, max_bytes=256 << 20, directory=None, max_disk_bytes=4 << 30):
+        self.max_bytes = int(max_bytes)
+        self.directory = directory
+        self.max_disk_bytes = int(max_disk_bytes)
+        self._memory = OrderedDict()  # key -> (flat samples, metadata)
+        self._memory_bytes = 0
+        self._disk = OrderedDict()    # key -> file bytes, least recently used first
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.counts = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "uncacheable": 0, "evictions": 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._scan()
+
+    @classmethod
+    def from_config(cls):
+        """Cache from the "cache" section of config.json, or None when it is disabled."""
+        config = CONFIG.get("cache", {})
+        if not config.get("enabled", False):
+            return None
+        return cls(config.get("max_bytes", 256 << 20), config.get("directory"), config.get("max_disk_bytes", 4 << 30))
+
+    # --- disk tier ---
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".npy", base + ".json"
+
+    def _scan(self):
+        """Index entries left by earlier runs, oldest access first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            key, ext = os.path.splitext(name)
+            data_path, meta_path = self._paths(key)
+            if ext == ".json" and os.path.exists(data_path):
+                entries.append((os.path.getmtime(meta_path), key, os.path.getsize(data_path)))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _read_disk(self, key):
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as file:
+                meta = json.load(file)
+            empty = sum(np.prod(item["shape"], dtype=np.int64) for item in meta["items"]) == 0
+            flat = np.load(data_path, mmap_mode=None if empty else "r")
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+        return flat, meta
+
+    def _write_disk(self, key, flat, meta):
+        data_path, meta_path = self._paths(key)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        # data first, metadata last: an entry only counts once its .json exists
+        with open(data_path + suffix, "wb") as file:
+            np.save(file, flat)
+        os.replace(data_path + suffix, data_path)
+        with open(meta_path + suffix, "w") as file:
+            json.dump(meta, file)
+        os.replace(meta_path + suffix, meta_path)
+        return os.path.getsize(data_path)
+
+    def _forget_disk(self, key):
+        self._disk_bytes -= self._disk.pop(key, 0)
+
+    def _evict_disk(self, keep):
+        while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+            key = next(k for k in self._disk if k != keep)
+            self._forget_disk(key)
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.counts["evictions"] += 1
+
+    # --- memory tier ---
+    def _remember(self, key, entry):
+        size = entry[0].nbytes
+        if size > self.max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[0].nbytes
+        self._memory[key] = entry
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_bytes:
+            _, (flat, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= flat.nbytes
+            self.counts["evictions"] += 1
+
+    # --- public ---
+    def get(self, key):
+        """Cached Waveform(s) for key, or None."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.counts["memory_hits"] += 1
+                return _unpack(*entry)
+            if key not in self._disk:
+                return None
+            entry = self._read_disk(key)
+            if entry is None:
+                self._forget_disk(key)
+                return None
+            self._disk.move_to_end(key)
+            self._remember(key, entry)
+            self.counts["disk_hits"] += 1
+            return _unpack(*entry)
+
+    def put(self, key, result):
+        """
+        Store a generated result. Returns what the caller should hand on: the cached, read-only view of it, or
+        result unchanged when it is not a Waveform or a list of Waveforms.
+        """
+        packed = _pack(result)
+        if packed is None:
+            with self._lock:
+                self.counts["uncacheable"] += 1
+            return result
+        flat, meta = packed
+        flat.setflags(write=False)
+        with self._lock:
+            self.counts["misses"] += 1
+            self._remember(key, (flat, meta))
+        if self.directory:
+            size = self._write_disk(key, flat, meta)
+            with self._lock:
+                self._forget_disk(key)
+                self._disk[key] = size
+                self._disk_bytes += size
+                self._evict_disk(keep=key)
+        return _unpack(flat, meta)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    def skip(self):
+        """Count a call that bypassed the cache (fresh randomness or unhashable arguments)."""
+        with self._lock:
+            self.counts["uncacheable"] += 1
+
+    def clear(self, disk=False):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if disk and self.directory:
+                for key in list(self._disk):
+                    for path in self._paths(key):
+                        if os.path.exists(path):
+                            os.remove(path)
+                self._disk.clear()
+                self._disk_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            hits = self.counts["memory_hits"] + self.counts["disk_hits"]
+            lookups = hits + self.counts["misses"]
+            return dict(self.counts, hit_rate=hits / lookups if lookups else 0.0,
+                        memory_entries=len(self._memory), memory_bytes=self._memory_bytes,
+                        disk_entries=len(self._disk), disk_bytes=self._disk_bytes)
+
+    def wrap(self, generator):
+        return CachedGenerator(generator, self)
+
+
+class CachedGenerator:
+    """
+    Stands in for a WaveformGenerator / CombinedWaveformGenerator: every public method call is looked up in the
+    cache first and generated (then stored) only on a miss. Other attributes pass straight through.
+    """
+
+    def __init__(self, generator, cache):
+        self.generator = generator
+        self.cache = cache
+        self._methods = {}
+        self._signatures = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self.generator, name)
+        if name.startswith("_") or not inspect.ismethod(attr):
+            return attr
+        if name not in self._methods:
+            self._methods[name] = self._cached(name, attr)
+        return self._methods[name]
+
+    def key(self, name, *args, **kwargs):
+        """Cache key of generator.name(*args, **kwargs), or None when that call cannot be cached."""
+        if name not in self._signatures:
+            self._signatures[name] = inspect.signature(getattr(self.generator, name))
+        bound = self._signatures[name].bind(*args, **kwargs)
+        bound.apply_defaults()
+        is_random = RANDOM_CALLS.get(name)
+        if is_random is not None and is_random(bound.arguments):
+            return None
+        try:
+            return cache_key(self.generator, name, bound.arguments)
+        except TypeError:
+            return None
+
+    def contains(self, name, *args, **kwargs):
+        """Whether generator.name(*args, **kwargs) is cached (not counted as a hit or miss)."""
+        key = self.key(name, *args, **kwargs)
+        return key is not None and key in self.cache
+
+    def store(self, name, result, *args, **kwargs):
+        """Cache a result of generator.name(*args, **kwargs) produced elsewhere (e.g. by a worker process)."""
+        key = self.key(name, *args, **kwargs)
+        if key is None:
+            self.cache.skip()
+            return result
+        return self.cache.put(key, result)
+
+    def _cached(self, name, method):
+        def call(*args, **kwargs):
+            key = self.key(name, *args, **kwargs)
+            if key is None:
+                self.cache.skip()
+                return method(*args, **kwargs)
+            result = self.cache.get(key)
+            if result is None:
+                result = self.cache.put(key, method(*args, **kwargs))
+            return result
+
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
@@ -0,0 +1,256 @@
+import ast
+import math
+
+import numpy as np
+
+from lfsr import m_sequence
+from waveform_graph import Node
+
+try:
+    import numexpr
+except ImportError:  # optional: fused evaluation; plain numpy otherwise
+    numexpr = None
+
+
+# Waveform formulas such as  0.5*sin(2*pi*f*t) + prbs(7, 100e6)*gauss(t - 200e-9, 50e-9)
+# are parsed once (Python expression syntax, whitelisted), validated, constant-folded and compiled into a
+# waveform_graph Node evaluated chunk by chunk. Units are SI: t in seconds, frequencies / rates in Hz.
+# Names: t (time), n (sample index), fs (sampling frequency), pi, e, plus any constants passed as variables.
+# With numexpr installed, each chunk is one fused numexpr evaluation; otherwise numpy ufuncs on chunk buffers.
+
+class ExpressionError(ValueError):
+    pass
+
+
+UFUNCS = {name: getattr(np, name) for name in ("sin", "cos", "tan", "arcsin", "arccos", "arctan", "sinh", "cosh",
+                                               "tanh", "exp", "log", "log10", "sqrt", "abs")}
+# name: (min args, max args); rewritten into the primitives above before compilation
+MACROS = {"clip": (3, 3), "gauss": (2, 3), "rect": (2, 2), "square": (2, 2), "sawtooth": (2, 2), "where": (3, 3)}
+SOURCES = {"prbs": (2, 3)}
+BINARY_OPS = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/", ast.Pow: "**", ast.Mod: "%"}
+COMPARE_OPS = {ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">", ast.GtE: ">="}
+NUMPY_OPS = {"+": np.add, "-": np.subtract, "*": np.multiply, "/": np.divide, "**": np.power, "%": np.mod,
+             "<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal, "!=": np.not_equal}
+
+
+# --- intermediate representation: tuples ("const", v) ("var", name) ("op", sym, a, b) ("call", fn, args)
+# ("where", cond, a, b) ("source", index) ---
+
+def _const(expr):
+    return expr[0] == "const"
+
+
+def _fold(expr):
+    """Evaluate subtrees that do not depend on t / n / sources once, at compile time."""
+    kind = expr[0]
+    if kind == "op":
+        a, b = _fold(expr[2]), _fold(expr[3])
+        if _const(a) and _const(b):
+            return ("const", float(NUMPY_OPS[expr[1]](a[1], b[1])))
+        return ("op", expr[1], a, b)
+    if kind == "call":
+        args = [_fold(arg) for arg in expr[2]]
+        if all(_const(arg) for arg in args):
+            return ("const", float(UFUNCS[expr[1]](*[arg[1] for arg in args])))
+        return ("call", expr[1], args)
+    if kind == "where":
+        cond, a, b = (_fold(part) for part in expr[1:])
+        if _const(cond):
+            return a if cond[1] else b
+        return ("where", cond, a, b)
+    return expr
+
+
+def _check_finite(expr, text):
+    """Reject constants that overflowed (1e400 * t) or are undefined (log(0), 0 / 0) after folding."""
+    if _const(expr):
+        if not math.isfinite(expr[1]):
+            raise ExpressionError(f"Constant part of '{text}' evaluates to {expr[1]}")
+    elif expr[0] == "op":
+        _check_finite(expr[2], text)
+        _check_finite(expr[3], text)
+    elif expr[0] == "call":
+        for arg in expr[2]:
+            _check_finite(arg, text)
+    elif expr[0] == "where":
+        for part in expr[1:]:
+            _check_finite(part, text)
+
+
+def _prbs_bits(order, seed=1):
+    """One period of the maximal-length sequence of the given order (same taps as WaveformGenerator.get_taps)."""
+    if not int(seed) % (1 << int(order)):
+        raise ExpressionError("prbs seed must be non-zero")
+    return m_sequence(order, seed).astype(np.float64)
+
+
+class _Parser:
+    def __init__(self, variables, sampling_freq):
+        self.constants = {"pi": math.pi, "e": math.e, "fs": float(sampling_freq)}
+        for name, value in (variables or {}).items():
+            if name in ("t", "n") or name in self.constants or name in UFUNCS or name in MACROS or name in SOURCES:
+                raise ExpressionError(f"Variable name '{name}' is reserved")
+            self.constants[name] = float(value)
+        self.sources = []  # (name, constant args)
+
+    def parse(self, text):
+        try:
+            tree = ast.parse(text.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ExpressionError(f"Syntax error in '{text}': {e.msg}") from None
+        with np.errstate(all="ignore"):  # overflow / log(0) while folding is reported by _check_finite instead
+            expr = _fold(self.visit(tree.body))
+        _check_finite(expr, text)
+        return expr
+
+    def visit(self, node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return ("const", float(node.value))
+        if isinstance(node, ast.Name):
+            if node.id in ("t", "n"):
+                return ("var", node.id)
+            if node.id in self.constants:
+                return ("const", self.constants[node.id])
+            raise ExpressionError(f"Unknown name '{node.id}'")
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = self.visit(node.operand)
+            return operand if isinstance(node.op, ast.UAdd) else ("op", "-", ("const", 0.0), operand)
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPS:
+            return ("op", BINARY_OPS[type(node.op)], self.visit(node.left), self.visit(node.right))
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in COMPARE_OPS:
+            return ("op", COMPARE_OPS[type(node.ops[0])], self.visit(node.left), self.visit(node.comparators[0]))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            return self.call(node.func.id, node.args)
+        raise ExpressionError(f"Unsupported syntax: {ast.unparse(node)}")
+
+    def call(self, name, arg_nodes):
+        limits = MACROS.get(name) or SOURCES.get(name) or ((1, 1) if name in UFUNCS else None)
+        if limits is None:
+            raise ExpressionError(f"Unknown function '{name}'")
+        if not limits[0] <= len(arg_nodes) <= limits[1]:
+            raise ExpressionError(f"{name}() takes {limits[0]}-{limits[1]} arguments, got {len(arg_nodes)}")
+        args = [self.visit(arg) for arg in arg_nodes]
+
+        if name in UFUNCS:
+            return ("call", name, args)
+        if name in SOURCES:
+            args = [_fold(arg) for arg in args]
+            if not all(_const(arg) for arg in args):
+                raise ExpressionError(f"{name}() arguments must be constants")
+            for arg in args:
+                _check_finite(arg, f"{name}()")
+            self.sources.append((name, [arg[1] for arg in args]))
+            return ("source", len(self.sources) - 1)
+
+        one, zero, half = ("const", 1.0), ("const", 0.0), ("const", 0.5)
+        if name == "where":  # a numeric condition means "non-zero", as in numpy
+            cond = args[0]
+            if not (cond[0] == "op" and cond[1] in COMPARE_OPS.values()):
+                cond = ("op", "!=", cond, zero)
+            return ("where", cond, args[1], args[2])
+        if name == "clip":
+            x, low, high = args
+            return ("where", ("op", "<", x, low), low, ("where", ("op", ">", x, high), high, x))
+        if name == "gauss":  # gauss(x, sigma[, center]) = exp(-((x - center) / sigma)**2 / 2)
+            x = args[0] if len(args) == 2 else ("op", "-", args[0], args[2])
+            z = ("op", "/", x, args[1])
+            return ("call", "exp", [("op", "*", ("const", -0.5), ("op", "*", z, z))])
+        if name == "rect":  # 1 inside |x| <= width / 2
+            return ("where", ("op", "<=", ("call", "abs", [args[0]]), ("op", "*", half, args[1])), one, zero)
+        cycle = ("op", "%", ("op", "*", args[0], args[1]), one)  # fraction of the period, square / sawtooth(t, f)
+        if name == "square":
+            return ("where", ("op", "<", cycle, half), one, ("const", -1.0))
+        return ("op", "-", ("op", "*", ("const", 2.0), cycle), one)
+
+
+def _to_numexpr(expr):
+    kind = expr[0]
+    if kind == "const":
+        return repr(expr[1])
+    if kind == "var":
+        return expr[1]
+    if kind == "source":
+        return f"_source{expr[1]}"
+    if kind == "op":
+        return f"({_to_numexpr(expr[2])} {expr[1]} {_to_numexpr(expr[3])})"
+    if kind == "call":
+        return f"{expr[1]}({', '.join(_to_numexpr(arg) for arg in expr[2])})"
+    return f"where({_to_numexpr(expr[1])}, {_to_numexpr(expr[2])}, {_to_numexpr(expr[3])})"
+
+
+def _to_numpy(expr):
+    """Closure env -> array (or scalar) evaluating expr with numpy ufuncs."""
+    kind = expr[0]
+    if kind == "const":
+        value = expr[1]
+        return lambda env: value
+    if kind in ("var", "source"):
+        key = expr[1] if kind == "var" else f"_source{expr[1]}"
+        return lambda env: env[key]
+    if kind == "op":
+        fn, a, b = NUMPY_OPS[expr[1]], _to_numpy(expr[2]), _to_numpy(expr[3])
+        return lambda env: fn(a(env), b(env))
+    if kind == "call":
+        fn, a = UFUNCS[expr[1]], _to_numpy(expr[2][0])
+        return lambda env: fn(a(env))
+    cond, a, b = (_to_numpy(part) for part in expr[1:])
+    return lambda env: np.where(cond(env), a(env), b(env))
+
+
+def _uses(expr, name):
+    if expr[0] == "var":
+        return expr[1] == name
+    if expr[0] == "op":
+        return _uses(expr[2], name) or _uses(expr[3], name)
+    if expr[0] == "call":
+        return any(_uses(arg, name) for arg in expr[2])
+    if expr[0] == "where":
+        return any(_uses(part, name) for part in expr[1:])
+    return False
+
+
+class ExpressionNode(Node):
+    """Compiled formula as a lazy waveform_graph leaf; use_numexpr=None picks numexpr when it is installed."""
+
+    def __init__(self, text, num_samples, sampling_freq, variables=None, use_numexpr=None):
+        super().__init__(num_samples, sampling_freq)
+        self.text = text
+        parser = _Parser(variables, sampling_freq)
+        self.expr = parser.parse(text)
+        self.sources = [self._source(name, args) for name, args in parser.sources]
+        self.uses_time = _uses(self.expr, "t") or bool(self.sources)
+        self.use_numexpr = (numexpr is not None) if use_numexpr is None else bool(use_numexpr and numexpr)
+        if self.use_numexpr:
+            self.numexpr_text = _to_numexpr(self.expr)
+        else:
+            self.evaluate = _to_numpy(self.expr)
+        if self.num_samples:
+            self.render(0, 1, np.empty(1))  # surface evaluation errors now rather than mid-waveform
+
+    def _source(self, name, args):
+        if name == "prbs":  # prbs(order, bit rate[, seed]): 0/1 levels, one bit per 1 / rate seconds
+            bits, rate = _prbs_bits(args[0], args[2] if len(args) > 2 else 1), args[1]
+            return lambda t: np.take(bits, np.floor(t * rate).astype(np.int64), mode="wrap")
+        raise ExpressionError(f"Unknown source '{name}'")
+
+    def render(self, start, stop, out):
+        n = np.arange(start, stop, dtype=np.float64)
+        env = {"n": n}
+        if self.uses_time:
+            env["t"] = n / self.sample_rate
+        for i, source in enumerate(self.sources):
+            env[f"_source{i}"] = source(env["t"])
+        try:
+            if _const(self.expr):
+                out[:] = self.expr[1]
+            elif self.use_numexpr:
+                numexpr.evaluate(self.numexpr_text, local_dict=env, out=out, casting="unsafe")
+            else:
+                out[:] = self.evaluate(env)
+        except (ArithmeticError, LookupError, NotImplementedError, TypeError, ValueError) as e:
+            raise ExpressionError(f"Cannot evaluate '{self.text}': {e}") from e
+
+
+def compile_expression(text, num_samples, sampling_freq, variables=None, use_numexpr=None):
+    """Parse, validate and compile a formula; raises ExpressionError with the offending part on bad input."""
+    return ExpressionNode(text, num_samples, sampling_freq, variables, use_numexpr)
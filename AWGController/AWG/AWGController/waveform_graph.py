@@ -0,0 +1,262 @@
+import csv
+
+import numpy as np
+
+from chunked_synthesis import synthesize_chunked
+from dac_codes import DACEncoder
+from Waveform import Waveform
+
+
+# Lazy waveform expressions. A Node describes how to compute samples [start, stop) of a waveform; nothing is
+# computed until the graph is evaluated chunk by chunk, so a composition of any size needs only chunk-sized
+# scratch buffers. Nodes combine with +, -, * and the gain / offset / clip / window methods.
+
+class Node:
+    def __init__(self, num_samples, sample_rate):
+        self.num_samples = int(num_samples)
+        self.sample_rate = float(sample_rate)
+
+    def render(self, start, stop, out):
+        """Write samples [start, stop) into out (float64, length stop - start)."""
+        raise NotImplementedError
+
+    # --- composition ---
+    def __add__(self, other):
+        if isinstance(other, Node):
+            return Sum([self, other])
+        return Offset(self, other)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self + (-other if isinstance(other, Node) else -float(other))
+
+    def __rsub__(self, other):
+        return (-self) + other
+
+    def __neg__(self):
+        return Gain(self, -1.0)
+
+    def __mul__(self, other):
+        if isinstance(other, Node):
+            return Product([self, other])
+        return Gain(self, other)
+
+    __rmul__ = __mul__
+
+    def gain(self, value):
+        return Gain(self, value)
+
+    def offset(self, value):
+        return Offset(self, value)
+
+    def clip(self, low=-1.0, high=1.0):
+        return Clip(self, low, high)
+
+    def window(self, name="hann"):
+        return Window(self, name)
+
+    # --- evaluation ---
+    def to_array(self, chunk_size=1 << 20, max_workers=None, out=None):
+        """Evaluate into one (preallocated) array, chunks in parallel on a thread pool."""
+        return synthesize_chunked(self.render, self.num_samples, chunk_size, max_workers, out=out)
+
+    def to_waveform(self, chunk_size=1 << 20, max_workers=None):
+        return Waveform(self.to_array(chunk_size, max_workers), self.sample_rate)
+
+    def stream(self, sink, chunk_size=1 << 20):
+        """Evaluate in order, handing each chunk to sink.write(start, chunk); returns sink.close()."""
+        buffer = np.empty(min(int(chunk_size), max(1, self.num_samples)))
+        for start in range(0, self.num_samples, int(chunk_size)):
+            stop = min(start + int(chunk_size), self.num_samples)
+            chunk = buffer[:stop - start]
+            self.render(start, stop, chunk)
+            sink.write(start, chunk)
+        return sink.close()
+
+
+def _check_compatible(nodes):
+    lengths = {node.num_samples for node in nodes}
+    rates = {node.sample_rate for node in nodes}
+    if len(lengths) != 1 or len(rates) != 1:
+        raise ValueError(f"Cannot combine waveforms with lengths {sorted(lengths)} and sample rates {sorted(rates)}")
+
+
+class Source(Node):
+    """Leaf computed by a chunk kernel(start, stop, out), e.g. chunked_synthesis.sine_chunk_kernel."""
+
+    def __init__(self, kernel, num_samples, sample_rate):
+        super().__init__(num_samples, sample_rate)
+        self.kernel = kernel
+
+    def render(self, start, stop, out):
+        self.kernel(start, stop, out)
+
+
+class ArraySource(Node):
+    """Leaf backed by existing samples (e.g. a generator's output or a memmap)."""
+
+    def __init__(self, samples, sample_rate):
+        super().__init__(len(samples), sample_rate)
+        self.samples = samples
+
+    def render(self, start, stop, out):
+        out[:] = self.samples[start:stop]
+
+
+class PeriodicSource(Node):
+    """Leaf repeating a short unit (e.g. one PRBS period) over num_samples without tiling it in memory."""
+
+    def __init__(self, unit, num_samples, sample_rate):
+        super().__init__(num_samples, sample_rate)
+        self.unit = np.asarray(unit, dtype=np.float64)
+
+    def render(self, start, stop, out):
+        np.take(self.unit, np.arange(start, stop), out=out, mode="wrap")
+
+
+class Sum(Node):
+    def __init__(self, children):
+        # flatten nested sums so a + b + c is one node
+        flat = []
+        for child in children:
+            flat.extend(child.children if isinstance(child, Sum) else [child])
+        _check_compatible(flat)
+        super().__init__(flat[0].num_samples, flat[0].sample_rate)
+        self.children = flat
+
+    def render(self, start, stop, out):
+        self.children[0].render(start, stop, out)
+        scratch = np.empty_like(out)
+        for child in self.children[1:]:
+            child.render(start, stop, scratch)
+            out += scratch
+
+
+class Product(Node):
+    """Sample-wise product, e.g. a carrier modulated by an envelope."""
+
+    def __init__(self, children):
+        flat = []
+        for child in children:
+            flat.extend(child.children if isinstance(child, Product) else [child])
+        _check_compatible(flat)
+        super().__init__(flat[0].num_samples, flat[0].sample_rate)
+        self.children = flat
+
+    def render(self, start, stop, out):
+        self.children[0].render(start, stop, out)
+        scratch = np.empty_like(out)
+        for child in self.children[1:]:
+            child.render(start, stop, scratch)
+            out *= scratch
+
+
+class Gain(Node):
+    def __init__(self, child, value):
+        super().__init__(child.num_samples, child.sample_rate)
+        self.child, self.value = child, float(value)
+
+    def render(self, start, stop, out):
+        self.child.render(start, stop, out)
+        out *= self.value
+
+
+class Offset(Node):
+    def __init__(self, child, value):
+        super().__init__(child.num_samples, child.sample_rate)
+        self.child, self.value = child, float(value)
+
+    def render(self, start, stop, out):
+        self.child.render(start, stop, out)
+        out += self.value
+
+
+class Clip(Node):
+    def __init__(self, child, low=-1.0, high=1.0):
+        super().__init__(child.num_samples, child.sample_rate)
+        self.child, self.low, self.high = child, float(low), float(high)
+
+    def render(self, start, stop, out):
+        self.child.render(start, stop, out)
+        np.clip(out, self.low, self.high, out=out)
+
+
+class Window(Node):
+    """Multiplies by a symmetric cosine-sum window spanning the whole record, evaluated per chunk."""
+
+    COEFFICIENTS = {
+        "rect": (1.0,),
+        "hann": (0.5, 0.5),
+        "hamming": (0.54, 0.46),
+        "blackman": (0.42, 0.5, 0.08),
+        "blackmanharris": (0.35875, 0.48829, 0.14128, 0.01168),
+    }
+
+    def __init__(self, child, name="hann"):
+        if name not in self.COEFFICIENTS:
+            raise ValueError(f"Unknown window '{name}', expected one of {list(self.COEFFICIENTS)}")
+        super().__init__(child.num_samples, child.sample_rate)
+        self.child, self.name = child, name
+
+    def render(self, start, stop, out):
+        self.child.render(start, stop, out)
+        phase = np.arange(start, stop, dtype=np.float64)
+        phase *= 2 * np.pi / max(1, self.num_samples - 1)
+        window = np.full_like(out, self.COEFFICIENTS[self.name][0])
+        for k, a in enumerate(self.COEFFICIENTS[self.name][1:], start=1):
+            window += (-1) ** k * a * np.cos(k * phase)
+        out *= window
+
+
+# Sinks for Node.stream(): write(start, chunk) is called in order, close() returns the result.
+
+class ArraySink:
+    def __init__(self, num_samples, out=None):
+        self.out = np.empty(num_samples) if out is None else out
+
+    def write(self, start, chunk):
+        self.out[start:start + len(chunk)] = chunk
+
+    def close(self):
+        return self.out
+
+
+class FileSink:
+    """Streams to a waveform file in the format save_waveform writes: csv (Y1 column) or bin (int16 DAC words)."""
+
+    def __init__(self, file_path, file_format="csv", encoder=None):
+        self.file_path = file_path
+        self.file_format = file_format
+        self.encoder = encoder or DACEncoder()
+        self.file = open(file_path, "wb" if file_format == "bin" else "w", newline=None if file_format == "bin" else "")
+        if file_format != "bin":
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(["Y1"])
+
+    def write(self, start, chunk):
+        if self.file_format == "bin":
+            self.encoder.encode(chunk).astype("<i2", copy=False).tofile(self.file)
+        else:
+            self.writer.writerows(chunk[:, None].tolist())
+
+    def close(self):
+        self.file.close()
+        return self.file_path
+
+
+class DecimatingSink:
+    """Keeps every step-th sample (step chosen for at most max_points), for plotting huge records."""
+
+    def __init__(self, num_samples, sample_rate, max_points=20000):
+        self.step = max(1, int(np.ceil(num_samples / max_points)))
+        self.sample_rate = float(sample_rate)
+        self.parts = []
+
+    def write(self, start, chunk):
+        first = (-start) % self.step
+        self.parts.append(chunk[first::self.step].copy())
+
+    def close(self):
+        samples = np.concatenate(self.parts) if self.parts else np.empty(0)
+        return Waveform(samples, self.sample_rate / self.step)